@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, InventoryItem, InventoryChangeLog
+from .models import Category, InventoryItem, InventoryChangeLog, ArchivedChangeLog, TenantPlacement
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -8,7 +8,7 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(InventoryItem)
 class InventoryItemAdmin(admin.ModelAdmin):
-    list_display = ('name', 'user', 'category', 'quantity', 'price', 'date_added', 'last_updated')
+    list_display = ('name', 'user', 'category', 'quantity', 'reorder_point', 'price', 'date_added', 'last_updated')
     list_filter = ('category', 'user')
     search_fields = ('name', 'description')
     date_hierarchy = 'date_added'
@@ -17,4 +17,16 @@ class InventoryItemAdmin(admin.ModelAdmin):
 class InventoryChangeLogAdmin(admin.ModelAdmin):
     list_display = ('inventory_item', 'user', 'previous_quantity', 'new_quantity', 'change_type', 'timestamp')
     list_filter = ('change_type', 'user')
-    date_hierarchy = 'timestamp'
\ No newline at end of file
+    date_hierarchy = 'timestamp'
+
+@admin.register(ArchivedChangeLog)
+class ArchivedChangeLogAdmin(admin.ModelAdmin):
+    list_display = ('id', 'inventory_item', 'user', 'previous_quantity', 'new_quantity', 'change_type', 'timestamp')
+    list_filter = ('change_type',)
+    raw_id_fields = ('inventory_item', 'user', 'owner')
+
+@admin.register(TenantPlacement)
+class TenantPlacementAdmin(admin.ModelAdmin):
+    list_display = ('user', 'shard', 'moving')
+    list_filter = ('shard', 'moving')
+    raw_id_fields = ('user',)
@@ -0,0 +1,17 @@
+from django.urls import path
+from . import async_views
+from .urls import router
+
+# GET routes served natively under ASGI. They shadow the router's routes for
+# the same paths and hand every other request to the router's view.
+sync_views = {pattern.name: pattern.callback for pattern in router.urls}
+
+urlpatterns = [
+    path('inventory/', async_views.InventoryListView.as_view(sync_view=sync_views['inventory-list'])),
+    path('inventory/levels/', async_views.InventoryLevelsView.as_view(sync_view=sync_views['inventory-levels'])),
+    path('inventory/<int:pk>/', async_views.InventoryDetailView.as_view(sync_view=sync_views['inventory-detail'])),
+    path('changes/', async_views.ChangeLogListView.as_view(sync_view=sync_views['changes-list'])),
+    path('categories/', async_views.CategoryListView.as_view(sync_view=sync_views['category-list'])),
+    path('categories/<int:pk>/', async_views.CategoryDetailView.as_view(sync_view=sync_views['category-detail'])),
+    path('users/me/', async_views.CurrentUserView.as_view(sync_view=sync_views['user-me'])),
+]
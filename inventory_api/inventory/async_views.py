@@ -0,0 +1,215 @@
+"""
+Native async implementations of the read-heavy endpoints.
+
+They are routed only by the ASGI deployment (see ``inventory_api.asgi_urls``)
+and reuse the regular viewsets for everything that doesn't touch the
+database: querysets, filters, permissions, serializers and error handling.
+Database access goes through the async ORM, so the event loop stays free
+while a query runs and only the queries themselves are handed to the sync
+thread. Anything these views don't serve natively, such as writes or the
+browsable API, is passed on to the regular DRF view.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .authentication import CachedJWTAuthentication
+from .cache import acached_category_response
+from .conditional import is_conditional
+from .instrumentation import phase
+from .sharding import get_shards, set_tenant
+from .views import CategoryViewSet, InventoryChangeLogViewSet, InventoryItemViewSet, UserViewSet
+
+
+async def aauthenticate(request):
+    """
+    Resolve the user the way DEFAULT_AUTHENTICATION_CLASSES would for a
+    safe request: a JWT bearer token first, then the session user.
+    """
+    result = await CachedJWTAuthentication().aauthenticate(request)
+    if result is not None:
+        return result
+    user = await request.auser()
+    if user.is_authenticated and user.is_active:
+        return user, None
+    return AnonymousUser(), None
+
+
+async def afilter_queryset(view, queryset):
+    for backend_class in view.filter_backends:
+        backend = backend_class()
+        if isinstance(backend, DjangoFilterBackend) and any(
+                name in view.request.query_params for name in view.filterset_fields):
+            # Validating model choice filters queries the database
+            queryset = await sync_to_async(backend.filter_queryset)(view.request, queryset, view)
+        else:
+            queryset = backend.filter_queryset(view.request, queryset, view)
+    return view.narrow_queryset(queryset)
+
+
+async def aget_object(view, queryset):
+    lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+    try:
+        obj = await queryset.aget(**{view.lookup_field: view.kwargs[lookup_url_kwarg]})
+    except queryset.model.DoesNotExist:
+        # Same message as get_object_or_404()
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+    view.check_object_permissions(view.request, obj)
+    return obj
+
+
+class AsyncReadView(View):
+    """
+    Serves GET and HEAD for one viewset action; ``read()`` returns a DRF
+    Response, which is rendered as JSON here.
+    """
+    viewset_class = None
+    action = None
+    # The DRF view routed to the same path, for requests not served here
+    sync_view = None
+    renderer = JSONRenderer()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Like APIView.as_view(): SessionAuthentication enforces CSRF where
+        # it applies, and token-authenticated writes need no CSRF cookie
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD') and self.is_native(request):
+            return self.get(request, *args, **kwargs)
+        return self.fallback(request, *args, **kwargs)
+
+    def is_native(self, request):
+        # The browsable API and other renderers stay on the DRF view
+        return (request.GET.get('format', 'json') == 'json'
+                and 'text/html' not in request.headers.get('Accept', ''))
+
+    async def get(self, request, *args, **kwargs):
+        # Options given to @action, such as permission_classes
+        initkwargs = getattr(getattr(self.viewset_class, self.action), 'kwargs', {})
+        view = self.viewset_class(
+            **initkwargs, action=self.action, args=args, kwargs=kwargs, format_kwarg=None, headers={},
+            request=Request(request, authenticators=()),
+        )
+        try:
+            user, auth = await aauthenticate(request)
+            view.request.user, view.request.auth = user, auth
+            if not user.is_authenticated:
+                raise NotAuthenticated()
+            if get_shards():
+                await sync_to_async(set_tenant)(user)
+            view.check_permissions(view.request)
+            view.check_throttles(view.request)
+            response = await self.read(view)
+        except (APIException, Http404) as exc:
+            response = view.handle_exception(exc)
+        return self.render(view, response)
+
+    async def read(self, view):
+        raise NotImplementedError
+
+    def render(self, view, response):
+        if not isinstance(response, Response):
+            # 304 and 412 responses to conditional requests
+            return response
+        with phase('render'):
+            content = self.renderer.render(response.data, renderer_context={'view': view, 'response': response})
+        rendered = HttpResponse(content, status=response.status_code, content_type='application/json')
+        for header, value in response.items():
+            if header.lower() != 'content-type':
+                rendered[header] = value
+        return rendered
+
+    async def fallback(self, request, *args, **kwargs):
+        return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+
+
+class InventoryListView(AsyncReadView):
+    viewset_class = InventoryItemViewSet
+    action = 'list'
+
+    async def read(self, view):
+        request = view.request
+        queryset = await afilter_queryset(view, view.get_queryset())
+        if is_conditional(request):
+            paginator = view.pagination_class()
+            rows = await paginator.apaginate_queryset(view.get_validator_queryset(queryset), request, view)
+            not_modified = view.page_preconditions(request, rows, paginator)
+            if not_modified is not None:
+                return not_modified
+        return view.page_response(
+            await view.paginator.apaginate_queryset(view.get_list_queryset(queryset), request, view))
+
+
+class InventoryDetailView(AsyncReadView):
+    viewset_class = InventoryItemViewSet
+    action = 'retrieve'
+
+    async def read(self, view):
+        if is_conditional(view.request):
+            last_updated = await view.get_freshness_queryset().afirst()
+            precondition_failed = view.item_preconditions(view.request, last_updated)
+            if precondition_failed is not None:
+                return precondition_failed
+        item = await aget_object(view, await afilter_queryset(view, view.get_queryset()))
+        return view.item_response(view.get_serializer(item).data, item)
+
+
+class InventoryLevelsView(AsyncReadView):
+    viewset_class = InventoryItemViewSet
+    action = 'levels'
+
+    async def read(self, view):
+        page = await view.paginator.apaginate_queryset(
+            view.get_list_queryset(view.get_levels_queryset(view.request)), view.request, view)
+        return view.get_paginated_response(view.serialize_page(page))
+
+
+class ChangeLogListView(AsyncReadView):
+    viewset_class = InventoryChangeLogViewSet
+    action = 'list'
+
+    async def read(self, view):
+        queryset = await afilter_queryset(view, view.get_queryset())
+        archived = None
+        if view.include_archived():
+            archived = await afilter_queryset(view, view.get_archived_queryset())
+        page = await view.paginator.apaginate_querysets(
+            view.get_page_querysets(queryset, archived), view.request, view)
+        return view.get_paginated_response(view.serialize_page(page))
+
+
+class CategoryReadView(AsyncReadView):
+    """
+    Category reads come from the versioned cache; the miss after each
+    change runs the regular viewset action.
+    """
+    viewset_class = CategoryViewSet
+
+    async def read(self, view):
+        build = getattr(super(CategoryViewSet, view), self.action)
+        return await acached_category_response(view.request, sync_to_async(lambda: build(view.request)))
+
+
+class CategoryListView(CategoryReadView):
+    action = 'list'
+
+
+class CategoryDetailView(CategoryReadView):
+    action = 'retrieve'
+
+
+class CurrentUserView(AsyncReadView):
+    viewset_class = UserViewSet
+    action = 'me'
+
+    async def read(self, view):
+        return view.me(view.request)
@@ -0,0 +1,125 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .instrumentation import phase
+from .metrics import record_cache
+
+
+class UserCache:
+    """
+    Thread-safe, per-process LRU cache of authenticated users with a TTL.
+
+    Entries are dropped on any save or delete of the user (see signals.py);
+    the TTL bounds how long other processes can keep serving a user that
+    was changed elsewhere.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'INVENTORY_AUTH_USER_CACHE_SIZE', 1024)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'INVENTORY_AUTH_USER_CACHE_TTL', 60)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def set(self, key, user):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == str(user_id)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that serves users from ``user_cache``.
+
+    Entries are keyed by the token's user id and, when CHECK_REVOKE_TOKEN
+    is on, its password claim, so a user is only cached after passing the
+    same checks as an uncached lookup.
+    """
+
+    def authenticate(self, request):
+        with phase('auth'):
+            return super().authenticate(request)
+
+    def authenticate_header(self, request):
+        # Listed ahead of sessions, this decides the challenge; send none so
+        # failed authentication stays 403 as it was for session-first
+        return None
+
+    def get_user(self, validated_token):
+        key = self.get_cache_key(validated_token)
+        if key is None:
+            return super().get_user(validated_token)
+        user = user_cache.get(key)
+        record_cache('users', user is not None)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(key, user)
+        # Views may set attributes on request.user; keep the cached one clean
+        return copy.copy(user)
+
+    async def aauthenticate(self, request):
+        """``authenticate()`` for async views, taking a plain Django request."""
+        with phase('auth'):
+            header = self.get_header(request)
+            if header is None:
+                return None
+            raw_token = self.get_raw_token(header)
+            if raw_token is None:
+                return None
+            validated_token = self.get_validated_token(raw_token)
+            return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        key = self.get_cache_key(validated_token)
+        user = user_cache.get(key) if key is not None else None
+        if user is None:
+            # Only cache misses reach the database, and get_user() counts them
+            return await sync_to_async(self.get_user)(validated_token)
+        record_cache('users', True)
+        return copy.copy(user)
+
+    def get_cache_key(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            return None
+        return (
+            str(validated_token[api_settings.USER_ID_CLAIM]),
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) if api_settings.CHECK_REVOKE_TOKEN else None,
+        )
@@ -0,0 +1,102 @@
+"""
+Versioned response cache for category reads.
+
+Every cache key carries the current category version, which is bumped on
+any Category save or delete, so stale entries are never read again and
+simply expire. Misses are built from the primary database: a lagging
+replica would otherwise cache its old rows under the new version. The
+cache alias is configurable and defaults to "default".
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+from .metrics import record_cache
+from .routers import read_from_primary
+
+CATEGORY_VERSION_KEY = 'inventory:categories:version'
+
+
+def get_cache():
+    return caches[getattr(settings, 'INVENTORY_CATEGORY_CACHE', 'default')]
+
+
+def get_category_version():
+    cache = get_cache()
+    version = cache.get(CATEGORY_VERSION_KEY)
+    if version is None:
+        # Start from a timestamp rather than 1, so a version key that was
+        # evicted can't be reset to a value that still has cached entries.
+        cache.add(CATEGORY_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATEGORY_VERSION_KEY)
+    return version
+
+
+def bump_category_version():
+    cache = get_cache()
+    try:
+        cache.incr(CATEGORY_VERSION_KEY)
+    except ValueError:
+        cache.set(CATEGORY_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_categories(using=None):
+    # Bump now so the writing transaction doesn't read its own stale entries,
+    # and again on commit to drop anything cached from the old rows meanwhile.
+    bump_category_version()
+    transaction.on_commit(bump_category_version, using=using)
+
+
+def cached_category_response(request, build_response):
+    """
+    Return the cached data for this URL at the current category version,
+    calling ``build_response`` on a miss. Responses carry an ETag, and a
+    matching If-None-Match is answered with a 304 without touching the cache.
+    """
+    key, etag, response = lookup_category_response(request)
+    if response is None:
+        with read_from_primary():
+            response = build_response()
+        response = store_category_response(key, etag, response)
+    return response
+
+
+async def acached_category_response(request, build_response):
+    """``cached_category_response`` for async views; ``build_response`` is awaited."""
+    key, etag, response = lookup_category_response(request)
+    if response is None:
+        with read_from_primary():
+            response = await build_response()
+        response = store_category_response(key, etag, response)
+    return response
+
+
+def lookup_category_response(request):
+    version = get_category_version()
+    url_hash = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    key = f'inventory:categories:{version}:{url_hash}'
+    etag = f'"{version:x}-{url_hash[:16]}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return key, etag, not_modified
+    data = get_cache().get(key)
+    record_cache('categories', data is not None)
+    if data is None:
+        return key, etag, None
+    response = Response(data)
+    response['ETag'] = etag
+    return key, etag, response
+
+
+def store_category_response(key, etag, response):
+    if response.status_code != 200:
+        return response
+    get_cache().set(key, response.data, getattr(settings, 'INVENTORY_CATEGORY_CACHE_TIMEOUT', 24 * 60 * 60))
+    response['ETag'] = etag
+    return response
@@ -0,0 +1,110 @@
+import logging
+import os
+
+from django.core import checks
+from django.db import DatabaseError, connections
+
+from inventory_api.database import missing_pool_dependencies, wants_pool
+
+SQLITE_PRAGMAS = ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size')
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_profile(connection):
+    with connection.cursor() as cursor:
+        pragmas = {}
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(f'PRAGMA {pragma}')
+            # In-memory databases have no mmap_size
+            row = cursor.fetchone()
+            if row is not None:
+                pragmas[pragma] = row[0]
+    messages = [checks.Info(
+        f'SQLite database {connection.alias!r}: '
+        + ', '.join(f'{name}={value}' for name, value in pragmas.items())
+        + f', transaction_mode={connection.transaction_mode or "DEFERRED"}.',
+        id='inventory.I001',
+    )]
+    if not connection.is_in_memory_db() and str(pragmas.get('journal_mode')).lower() != 'wal':
+        messages.append(checks.Warning(
+            f'SQLite database {connection.alias!r} is not in WAL mode, so concurrent '
+            'writers will fail with "database is locked".',
+            hint='Set PRAGMA journal_mode=WAL in OPTIONS["init_command"].',
+            id='inventory.W001',
+        ))
+    return messages
+
+
+def postgresql_profile(connection):
+    settings_dict = connection.settings_dict
+    pool = settings_dict['OPTIONS'].get('pool')
+    if pool:
+        sizes = pool if isinstance(pool, dict) else {}
+        description = (f'pooled connections (min_size={sizes.get("min_size", 4)}, '
+                       f'max_size={sizes.get("max_size", "unbounded")})')
+    else:
+        description = (f'CONN_MAX_AGE={settings_dict["CONN_MAX_AGE"]}, '
+                       f'CONN_HEALTH_CHECKS={settings_dict["CONN_HEALTH_CHECKS"]}')
+    messages = [checks.Info(f'PostgreSQL database {connection.alias!r}: {description}.', id='inventory.I002')]
+    if not pool and settings_dict['CONN_MAX_AGE'] == 0:
+        messages.append(checks.Warning(
+            f'PostgreSQL database {connection.alias!r} opens a new connection for every request.',
+            hint='Set INVENTORY_DB_CONN_MAX_AGE or INVENTORY_DB_POOL.',
+            id='inventory.W002',
+        ))
+    return messages
+
+
+@checks.register()
+def check_connection_pool(app_configs=None, env=os.environ, **kwargs):
+    """Warn when INVENTORY_DB_POOL asks for a connection pool that can't be used."""
+    if env.get('INVENTORY_DB_ENGINE') != 'postgresql' or not wants_pool(env):
+        return []
+    missing = missing_pool_dependencies()
+    if not missing:
+        return []
+    return [checks.Warning(
+        f'INVENTORY_DB_POOL is set, but the connection pool needs {" and ".join(missing)}, which '
+        f'{"is" if len(missing) == 1 else "are"} not installed; using persistent connections instead.',
+        hint='pip install "psycopg[pool]"',
+        id='inventory.W003',
+    )]
+
+
+def sqlite_exists(connection):
+    # Checking must not create a database file, or open a throwaway in-memory one
+    return not connection.is_in_memory_db() and os.path.exists(connection.settings_dict['NAME'])
+
+
+@checks.register()
+def check_database_profile(app_configs=None, databases=None, **kwargs):
+    """
+    Report the connection settings each database is actually running with.
+    
+    Runs with every command that checks the project, runserver included,
+    and at WSGI and ASGI start (see ``log_database_profile()``). ``check
+    --database`` and migrate name the databases to look at; otherwise every
+    configured one is, except SQLite databases that don't exist yet.
+    PostgreSQL settings are reported without connecting.
+    """
+    messages = []
+    for alias in connections if databases is None else databases:
+        connection = connections[alias]
+        if connection.vendor == 'sqlite':
+            if databases is None and not sqlite_exists(connection):
+                continue
+            try:
+                messages.extend(sqlite_profile(connection))
+            except DatabaseError:
+                if databases is not None:
+                    raise
+        elif connection.vendor == 'postgresql':
+            messages.extend(postgresql_profile(connection))
+    return messages
+
+
+def log_database_profile():
+    """Log the database profile where no checks run, as when a WSGI or ASGI server starts."""
+    for message in check_database_profile() + check_connection_pool():
+        logger.log(logging.WARNING if message.is_serious(checks.WARNING) else logging.INFO, '%s', message)
@@ -0,0 +1,56 @@
+"""
+ETag / Last-Modified validators for inventory items.
+
+Validators are derived from ``last_updated``, which every write path bumps,
+and the category version, because item representations embed their
+category's name. Checking freshness therefore only needs ``(id,
+last_updated)`` from the database.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .cache import get_category_version
+
+CONDITIONAL_HEADERS = (
+    'HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_UNMODIFIED_SINCE',
+)
+
+
+def is_conditional(request):
+    return any(header in request.META for header in CONDITIONAL_HEADERS)
+
+
+def item_etag(item_id, last_updated):
+    return f'"{item_id}-{last_updated.timestamp():.6f}-{get_category_version():x}"'
+
+
+def page_etag(request, rows, has_next, has_previous):
+    """ETag of one page of items: the rows on it, their versions and its links."""
+    digest = hashlib.md5(f'{request.build_absolute_uri()}|{get_category_version()}|'
+                         f'{has_next:d}{has_previous:d}'.encode())
+    for row in rows:
+        digest.update(f'|{row.id}:{row.last_updated.isoformat()}'.encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def precondition_response(request, etag, last_modified=None):
+    """
+    The 304 or 412 response the request's conditional headers call for,
+    or None if it should be processed normally.
+    """
+    response = get_conditional_response(
+        request, etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified is not None else None,
+    )
+    if response is not None and response.status_code == 304:
+        set_validators(response, etag, last_modified)
+    return response
@@ -0,0 +1,178 @@
+"""
+Per-request SQL and timing instrumentation.
+
+``RequestTimingMiddleware`` gives each request a ``RequestProfile``. While
+it is active, ``record_query()``, an execute wrapper installed on every
+database connection, counts its queries and SQL time, and ``phase()``
+times the parts of the request: authentication, serializers, the view
+and rendering. Phases nest, so the view's time includes the others.
+
+The results go out in a ``Server-Timing`` header. Requests slower than
+INVENTORY_SLOW_REQUEST_THRESHOLD seconds are logged as a warning with the
+whole profile as the ``request_timing`` attribute of the log record. So are
+requests that run the same statement INVENTORY_REPEATED_QUERY_THRESHOLD
+times or more, the signature of an N+1 query. INVENTORY_REQUEST_TIMING
+turns it all off.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Server-Timing metrics, in the order they are sent
+PHASES = ('auth', 'serializer', 'view', 'render')
+
+current_profile = ContextVar('current_profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = None
+        self.phases = {}
+        # Phase name -> [depth, started]
+        self._open = {}
+        self.queries = 0
+        self.sql_time = 0.0
+        self.slowest_sql = None
+        self.slowest_time = 0.0
+        # Statement -> [count, seconds]; Django passes parameters
+        # separately, so repeats of a query share one statement
+        self.statements = {}
+
+    def enter(self, name):
+        entry = self._open.get(name)
+        if entry is None:
+            self._open[name] = [1, time.perf_counter()]
+        else:
+            entry[0] += 1
+
+    def exit(self, name):
+        entry = self._open.get(name)
+        if entry is None:
+            return
+        entry[0] -= 1
+        if not entry[0]:
+            del self._open[name]
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - entry[1]
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.sql_time += duration
+        if duration > self.slowest_time:
+            self.slowest_sql, self.slowest_time = sql, duration
+        statement = self.statements.get(sql)
+        if statement is None:
+            self.statements[sql] = [1, duration]
+        else:
+            statement[0] += 1
+            statement[1] += duration
+
+    def finish(self):
+        for name in list(self._open):
+            self._open[name][0] = 1
+            self.exit(name)
+        self.duration = time.perf_counter() - self.started
+
+    def repeated_queries(self, threshold):
+        """Statements run at least ``threshold`` times, most frequent first."""
+        repeated = [(sql, count, seconds) for sql, (count, seconds) in self.statements.items() if count >= threshold]
+        return sorted(repeated, key=lambda statement: -statement[1])
+
+    def server_timing(self):
+        metrics = [f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries"']
+        if self.queries:
+            metrics.append(f'db-slowest;dur={self.slowest_time * 1000:.1f}')
+        metrics.extend(f'{name};dur={self.phases[name] * 1000:.1f}' for name in PHASES if name in self.phases)
+        metrics.append(f'total;dur={self.duration * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def as_dict(self, repeated=()):
+        return {
+            'duration_ms': round(self.duration * 1000, 1),
+            'queries': self.queries,
+            'sql_ms': round(self.sql_time * 1000, 1),
+            'slowest_sql': self.slowest_sql,
+            'slowest_sql_ms': round(self.slowest_time * 1000, 1),
+            'phases_ms': {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            'repeated_queries': [{'sql': sql, 'count': count, 'ms': round(seconds * 1000, 1)}
+                                 for sql, count, seconds in repeated],
+        }
+
+
+@contextmanager
+def profile_request():
+    profile = RequestProfile()
+    token = current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        current_profile.reset(token)
+        profile.finish()
+
+
+@contextmanager
+def phase(name):
+    """Count the time spent in the block towards the current request's ``name`` phase."""
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    profile.enter(name)
+    try:
+        yield
+    finally:
+        profile.exit(name)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper adding each query to the current request's profile."""
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.record_query(sql, time.perf_counter() - started)
+
+
+def report(request, response, profile):
+    """Add the Server-Timing header and log the request if it was slow or repetitive."""
+    response['Server-Timing'] = profile.server_timing()
+    repeated = profile.repeated_queries(getattr(settings, 'INVENTORY_REPEATED_QUERY_THRESHOLD', 10))
+    slow = profile.duration >= getattr(settings, 'INVENTORY_SLOW_REQUEST_THRESHOLD', 1.0)
+    if not slow and not repeated:
+        return
+    match = request.resolver_match
+    timing = {
+        'method': request.method,
+        'path': request.path,
+        'view': match.view_name if match is not None else None,
+        'status': response.status_code,
+        **profile.as_dict(repeated),
+    }
+    if slow:
+        logger.warning('Slow request: %s %s took %.0fms, %d queries in %.0fms',
+                       request.method, request.path, timing['duration_ms'], profile.queries, timing['sql_ms'],
+                       extra={'request_timing': timing})
+    if repeated:
+        sql, count, _ = repeated[0]
+        logger.warning('Repeated query in %s %s, %d times: %s',
+                       request.method, request.path, count, sql, extra={'request_timing': timing})
+
+
+class TimedSerializerMixin:
+    """Count serializing and validating towards the ``serializer`` phase."""
+
+    def to_representation(self, instance):
+        with phase('serializer'):
+            return super().to_representation(instance)
+
+    def run_validation(self, *args, **kwargs):
+        with phase('serializer'):
+            return super().run_validation(*args, **kwargs)
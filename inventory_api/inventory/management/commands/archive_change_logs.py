@@ -0,0 +1,62 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventory.models import InventoryChangeLog
+from inventory.sharding import tenant_databases
+
+
+class Command(BaseCommand):
+    help = (
+        'Move change logs older than the retention horizon to the archive table, collapsing '
+        "each item's archived history into a single checkpoint row. Runs in short batches and "
+        'can be stopped and restarted at any point.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            default=getattr(settings, 'INVENTORY_CHANGE_LOG_RETENTION_DAYS', 365),
+            help='Keep this many days of change logs in the live table. '
+                 'Defaults to INVENTORY_CHANGE_LOG_RETENTION_DAYS.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Change logs moved per transaction.')
+        parser.add_argument(
+            '--max-batches', type=int, default=None,
+            help='Stop after this many batches; the next run carries on from there.',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.0,
+            help='Seconds to wait between batches, to leave room for other writers.',
+        )
+        parser.add_argument(
+            '--database',
+            help='Database to archive. Defaults to every database holding change logs, shards included.',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        archived = batches = 0
+        for database in [options['database']] if options['database'] else tenant_databases():
+            logs = InventoryChangeLog.objects.using(database)
+            after = None
+            while options['max_batches'] is None or batches < options['max_batches']:
+                moved, after = logs.archive(cutoff, options['batch_size'], after)
+                if not moved:
+                    break
+                archived += moved
+                batches += 1
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f'Batch {batches}: archived {moved} change logs from {database}.')
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} change logs older than {cutoff:%Y-%m-%d %H:%M} in {batches} batches.'))
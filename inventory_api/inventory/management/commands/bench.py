@@ -0,0 +1,349 @@
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from inventory.models import Category, InventoryChangeLog, InventoryItem
+from inventory.sharding import get_shards, tenant_databases
+
+PASSWORD = 'bench-password'
+
+# Routes that hash a password run a tenth as many requests
+SLOW_ROUTES = ('users-register', 'token-obtain')
+
+# Relative changes beyond --threshold that count as regressions, and
+# whether higher is worse
+COMPARED_METRICS = {'p50_ms': True, 'p95_ms': True, 'p99_ms': True, 'requests_per_second': False}
+
+
+class Bench:
+    """Seeded data and the request each route sends, by request number."""
+
+    def __init__(self, users, items, categories):
+        self.users = users
+        self.items = items
+        self.categories = categories
+        self.access = {user.pk: f'Bearer {AccessToken.for_user(user)}' for user in users}
+        self.refresh = {user.pk: str(RefreshToken.for_user(user)) for user in users}
+        self.serial = itertools.count(1)
+
+    def user(self, number):
+        return self.users[number % len(self.users)]
+
+    def item(self, user, number):
+        items = self.items[user.pk]
+        return items[number % len(items)]
+
+    def route(self, name, number):
+        """(method, path, JSON body, user to authenticate as) for request ``number``."""
+        user = self.user(number)
+        if name == 'inventory-list':
+            return 'get', '/api/inventory/', None, user
+        if name == 'inventory-retrieve':
+            return 'get', f'/api/inventory/{self.item(user, number)}/', None, user
+        if name == 'inventory-create':
+            return 'post', '/api/inventory/', {
+                'name': f'Bench item {next(self.serial)}', 'quantity': 10, 'price': '4.99',
+                'category': self.categories[number % len(self.categories)],
+            }, user
+        if name == 'inventory-update':
+            return 'patch', f'/api/inventory/{self.item(user, number)}/', {'quantity': number % 100}, user
+        if name == 'inventory-adjust':
+            return 'post', f'/api/inventory/{self.item(user, number)}/adjust/', {'delta': 1}, user
+        if name == 'inventory-levels':
+            return 'get', '/api/inventory/levels/', None, user
+        if name == 'changes-list':
+            return 'get', '/api/changes/', None, user
+        if name == 'categories-list':
+            return 'get', '/api/categories/', None, user
+        if name == 'users-register':
+            return 'post', '/api/users/register/', {
+                'username': f'bench-new-{next(self.serial)}', 'password': PASSWORD,
+            }, None
+        if name == 'users-me':
+            return 'get', '/api/users/me/', None, user
+        if name == 'token-obtain':
+            return 'post', '/api/auth/token/', {'username': user.username, 'password': PASSWORD}, None
+        if name == 'token-refresh':
+            return 'post', '/api/auth/token/refresh/', {'refresh': self.refresh[user.pk]}, None
+        raise KeyError(name)
+
+
+ROUTES = [
+    'inventory-list', 'inventory-retrieve', 'inventory-create', 'inventory-update', 'inventory-adjust',
+    'inventory-levels', 'changes-list', 'categories-list', 'users-register', 'users-me',
+    'token-obtain', 'token-refresh',
+]
+
+
+def percentile(ordered, percent):
+    """Nearest-rank percentile of an ordered list."""
+    return ordered[max(math.ceil(len(ordered) * percent / 100) - 1, 0)]
+
+
+def compare(results, baseline, threshold):
+    """Regressions of ``results`` against ``baseline``, as messages."""
+    regressions = []
+    for name, route in results['routes'].items():
+        previous = baseline.get('routes', {}).get(name)
+        if previous is None:
+            continue
+        for metric, higher_is_worse in COMPARED_METRICS.items():
+            if not previous.get(metric):
+                continue
+            change = (route[metric] - previous[metric]) / previous[metric]
+            if (change if higher_is_worse else -change) > threshold / 100:
+                regressions.append(f'{name}: {metric} {previous[metric]:.1f} -> {route[metric]:.1f} '
+                                   f'({change:+.0%})')
+        # Query counts are deterministic, so any increase is a regression
+        if route['queries_per_request'] > previous.get('queries_per_request', math.inf):
+            regressions.append(f'{name}: queries_per_request {previous["queries_per_request"]:.1f} -> '
+                               f'{route["queries_per_request"]:.1f}')
+    return regressions
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database and measure latency, throughput and queries per request of every '
+        'API route, driven concurrently through the full request stack in-process. Writes the results '
+        'as JSON and can compare them with a baseline from an earlier run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Users to seed.')
+        parser.add_argument('--categories', type=int, default=20, help='Categories to seed.')
+        parser.add_argument('--items', type=int, default=500, help='Inventory items to seed per user.')
+        parser.add_argument('--changes', type=int, default=5, help='Change logs to seed per item.')
+        parser.add_argument(
+            '--route', action='append', dest='routes', choices=ROUTES,
+            help='Route to measure, repeatable. Defaults to every route.',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help=f'Measured requests per route; {" and ".join(SLOW_ROUTES)} run a tenth as many.',
+        )
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per route first.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Client threads sending requests at once.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the generated data.')
+        parser.add_argument('--output', help='File to write the results to, as JSON.')
+        parser.add_argument('--compare', metavar='BASELINE', help='Results file to check for regressions against.')
+        parser.add_argument(
+            '--threshold', type=float, default=20.0,
+            help='Percent a latency or throughput may get worse by before it counts as a regression.',
+        )
+        parser.add_argument(
+            '--in-place', action='store_true',
+            help='Seed and run against the configured databases instead of throwaway test databases.',
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Could not read the baseline: {error}')
+
+        if options['in_place']:
+            results = self.run(options)
+        else:
+            results = self.run_isolated(options)
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}.')
+        if baseline is not None:
+            regressions = compare(results, baseline, options['threshold'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(f'Regression: {regression}')
+                raise CommandError(f'{len(regressions)} regressions against {options["compare"]}.')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["compare"]}.'))
+
+    def run_isolated(self, options):
+        tests = {alias: connections[alias].settings_dict['TEST'] for alias in connections}
+        with tempfile.TemporaryDirectory() as directory:
+            for alias, test in tests.items():
+                # SQLite test databases are in memory by default, where
+                # concurrent writers fail with "table is locked" instead of waiting
+                if connections[alias].vendor == 'sqlite' and not test.get('NAME') and not test.get('MIRROR'):
+                    connections[alias].settings_dict['TEST'] = {**test, 'NAME': os.path.join(directory, f'{alias}.sqlite3')}
+            old_config = setup_databases(verbosity=0, interactive=False, aliases=set(connections),
+                                         serialized_aliases=set())
+            try:
+                return self.run(options)
+            finally:
+                connections.close_all()
+                teardown_databases(old_config, verbosity=0)
+                for alias, test in tests.items():
+                    connections[alias].settings_dict['TEST'] = test
+
+    def run(self, options):
+        bench = self.seed(options)
+        routes = options['routes'] or ROUTES
+        results = {
+            'created': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connections[DEFAULT_DB_ALIAS].vendor,
+                'shards': len(get_shards()),
+                'cpus': os.cpu_count(),
+            },
+            'options': {name: options[name] for name in
+                        ('users', 'categories', 'items', 'changes', 'requests', 'warmup', 'concurrency', 'seed')},
+            'routes': {},
+        }
+        # Production settings: DEBUG would also record every query
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name in routes:
+                requests = options['requests']
+                if name in SLOW_ROUTES:
+                    requests = max(requests // 10, 1)
+                results['routes'][name] = self.measure(
+                    bench, name, requests, options['warmup'], options['concurrency'])
+        return results
+
+    def seed(self, options):
+        if User.objects.filter(username='bench-user-1').exists():
+            raise CommandError('The database already has benchmark data; use a fresh database.')
+        self.stdout.write(
+            f'Seeding {options["users"]} users, {options["categories"]} categories, '
+            f'{options["users"] * options["items"]} items and '
+            f'{options["users"] * options["items"] * options["changes"]} change logs...')
+        rng = random.Random(options['seed'])
+        password = make_password(PASSWORD)
+        users = User.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+            User(username=f'bench-user-{number}', password=password) for number in range(1, options['users'] + 1))
+        categories = Category.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+            Category(name=f'Bench category {number}') for number in range(1, options['categories'] + 1))
+        for user in users:
+            items = InventoryItem.objects.using(DEFAULT_DB_ALIAS).bulk_create([
+                InventoryItem(
+                    user=user, name=f'Item {number} of {user.username}', description=f'Seeded item {number}',
+                    quantity=rng.randint(0, 200), reorder_point=rng.randint(0, 20),
+                    price=Decimal(rng.randint(100, 100000)) / 100,
+                    category=rng.choice(categories) if categories else None,
+                )
+                for number in range(options['items'])
+            ], batch_size=1000)
+            logs = []
+            for item in items:
+                quantity = item.quantity
+                for _ in range(options['changes']):
+                    previous, quantity = quantity, max(quantity + rng.randint(-10, 10), 0)
+                    logs.append(InventoryChangeLog(
+                        inventory_item=item, user=user, owner=user, previous_quantity=previous,
+                        new_quantity=quantity, change_type=rng.choice(InventoryChangeLog.STOCK_CHANGE_TYPES)[0]))
+            InventoryChangeLog.objects.using(DEFAULT_DB_ALIAS).bulk_create(logs, batch_size=1000)
+        if get_shards():
+            # Spread the seeded users over the shards like new users
+            call_command('rebalance_shards', grace=0, stdout=StringIO())
+
+        item_ids = {user.pk: [] for user in users}
+        for alias in tenant_databases():
+            rows = InventoryItem.objects.using(alias).filter(user__in=users).order_by('id')
+            for user_id, item_id in rows.values_list('user_id', 'id'):
+                item_ids[user_id].append(item_id)
+        if not all(item_ids.values()):
+            raise CommandError('Every user needs at least one item; raise --items.')
+        return Bench(users, item_ids, [category.pk for category in categories] or [None])
+
+    def measure(self, bench, name, requests, warmup, concurrency):
+        concurrency = max(min(concurrency, requests), 1)
+        latencies = []
+        queries = []
+        errors = []
+        started = threading.Barrier(concurrency + 1)
+        finished = threading.Barrier(concurrency + 1)
+
+        local = threading.local()
+
+        def count_query(execute, sql, params, many, context):
+            local.queries += 1
+            return execute(sql, params, many, context)
+
+        def send(client, number):
+            method, path, data, user = bench.route(name, number)
+            headers = {'authorization': bench.access[user.pk]} if user is not None else {}
+            try:
+                response = getattr(client, method)(path, data, content_type='application/json', headers=headers)
+            except Exception as error:
+                errors.append(f'{method.upper()} {path}: {error!r}')
+                return
+            if response.status_code >= 400:
+                errors.append(f'{method.upper()} {path}: {response.status_code}')
+
+        def worker(index):
+            # Like a server thread: its own client and database connections
+            client = Client(raise_request_exception=False)
+            local.queries = 0
+            for alias in connections:
+                connections[alias].execute_wrappers.append(count_query)
+            for number in range(index, warmup, concurrency):
+                send(client, number)
+            started.wait()
+            for number in range(index, requests, concurrency):
+                local.queries = 0
+                began = time.perf_counter()
+                send(client, warmup + number)
+                latencies.append(time.perf_counter() - began)
+                queries.append(local.queries)
+            finished.wait()
+            connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        started.wait()
+        began = time.perf_counter()
+        finished.wait()
+        elapsed = time.perf_counter() - began
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            self.stderr.write(f'{name}: {len(errors)} failed requests, first {errors[0]}')
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'requests_per_second': len(latencies) / elapsed,
+            'mean_ms': statistics.fmean(latencies) * 1000,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'queries_per_request': statistics.fmean(queries),
+        }
+
+    def report(self, results):
+        self.stdout.write(f'{"route":<20} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+                          f'{"queries":>8} {"errors":>7}')
+        for name, route in results['routes'].items():
+            self.stdout.write(
+                f'{name:<20} {route["requests_per_second"]:>8.0f} {route["p50_ms"]:>8.1f} '
+                f'{route["p95_ms"]:>8.1f} {route["p99_ms"]:>8.1f} {route["queries_per_request"]:>8.1f} '
+                f'{route["errors"]:>7}')
@@ -0,0 +1,146 @@
+import asyncio
+import io
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rest_framework_simplejwt.tokens import AccessToken
+
+DEFAULT_PATHS = [
+    '/api/inventory/',
+    '/api/inventory/levels/?low_stock=10',
+    '/api/changes/',
+    '/api/categories/',
+    '/api/users/me/',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare concurrent read throughput of the ASGI application (native async read views) '
+        'with the WSGI application, both driven in-process against the configured database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Username to authenticate as, with a JWT.')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Path to request, repeatable. Defaults to the async read endpoints.',
+        )
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per application.')
+        parser.add_argument(
+            '--concurrency', type=int, default=100,
+            help='Requests in flight at once. For WSGI this is capped by --threads.',
+        )
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='WSGI worker threads, like a threaded WSGI server worker.',
+        )
+        parser.add_argument(
+            '--client-delay', type=float, default=0.0,
+            help='Milliseconds each client takes to receive its response, to model slow clients.',
+        )
+        parser.add_argument('--app', choices=['asgi', 'wsgi', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist.')
+        self.authorization = f'Bearer {AccessToken.for_user(user)}'.encode()
+        paths = options['paths'] or DEFAULT_PATHS
+        requests = [paths[index % len(paths)] for index in range(options['requests'])]
+        delay = options['client_delay'] / 1000
+
+        if options['app'] in ('wsgi', 'both'):
+            self.report('WSGI', self.run_wsgi(requests, options['threads'], delay))
+        if options['app'] in ('asgi', 'both'):
+            self.report('ASGI', asyncio.run(self.run_asgi(requests, options['concurrency'], delay)))
+
+    def report(self, name, result):
+        elapsed, latencies, errors = result
+        latencies.sort()
+        self.stdout.write(
+            f'{name}: {len(latencies)} requests in {elapsed:.2f}s ({len(latencies) / elapsed:.0f} req/s), '
+            f'p50 {statistics.median(latencies) * 1000:.1f}ms, '
+            f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms, {errors} errors')
+
+    def run_wsgi(self, requests, threads, delay):
+        from inventory_api.wsgi import application
+
+        def send(path):
+            url = urlsplit(path)
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': url.path, 'QUERY_STRING': url.query,
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'localhost', 'HTTP_AUTHORIZATION': self.authorization.decode(),
+                'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+                'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+                'wsgi.version': (1, 0),
+            }
+            statuses = []
+            started = time.monotonic()
+            body = application(environ, lambda status, headers: statuses.append(status))
+            try:
+                for _ in body:
+                    pass
+                # A slow client keeps the worker thread busy while it reads
+                time.sleep(delay)
+            finally:
+                body.close()
+            return time.monotonic() - started, not statuses[0].startswith('2')
+
+        def send_and_close(path):
+            try:
+                return send(path)
+            finally:
+                connections.close_all()
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(send_and_close, requests))
+        return time.monotonic() - started, [latency for latency, _ in results], sum(error for _, error in results)
+
+    async def run_asgi(self, requests, concurrency, delay):
+        from inventory_api.asgi import application
+
+        semaphore = asyncio.Semaphore(concurrency)
+        disconnected = asyncio.Event()
+
+        async def send(path):
+            url = urlsplit(path)
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': url.path, 'raw_path': url.path.encode(),
+                'query_string': url.query.encode(), 'root_path': '',
+                'headers': [(b'host', b'localhost'), (b'authorization', self.authorization)],
+                'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+            }
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+            statuses = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # The client stays connected until the response is sent
+                await disconnected.wait()
+
+            async def send_message(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+                elif not message.get('more_body'):
+                    # A slow client only holds a coroutine while it reads
+                    await asyncio.sleep(delay)
+
+            async with semaphore:
+                started = time.monotonic()
+                await application(scope, receive, send_message)
+                return time.monotonic() - started, not 200 <= statuses[0] < 300
+
+        started = time.monotonic()
+        results = await asyncio.gather(*(send(path) for path in requests))
+        return time.monotonic() - started, [latency for latency, _ in results], sum(error for _, error in results)
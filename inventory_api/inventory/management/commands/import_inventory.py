@@ -0,0 +1,181 @@
+import csv
+import itertools
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from inventory.cache import invalidate_categories
+from inventory.models import Category, InventoryItem, InventorySummary
+from inventory.sharding import copy_reference_rows, get_placement, get_shards
+
+INSERT_COLUMNS = ['user', 'name', 'description', 'quantity', 'reorder_point', 'price', 'category',
+                  'date_added', 'last_updated']
+
+
+# Read in place of an NDJSON line that isn't JSON, so it's reported like any invalid row
+INVALID_JSON = object()
+
+
+class InvalidRow(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk import inventory items for a user from a CSV (with a header row) or NDJSON file. '
+        'Recognised columns: name, description, quantity, reorder_point, price, category (category name).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or "-" to read from stdin.')
+        parser.add_argument('--user', required=True, help='Username that will own the imported items.')
+        parser.add_argument(
+            '--format', choices=['csv', 'ndjson'],
+            help='Input format. Defaults to the file extension, or csv for stdin.',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per transaction.')
+        parser.add_argument(
+            '--offset', type=int, default=0,
+            help='Number of data rows to skip, e.g. to resume an interrupted import.',
+        )
+        parser.add_argument('--skip-invalid', action='store_true', help='Report and skip invalid rows.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.using(options['database']).get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist.')
+
+        self.database = options['database']
+        # With sharding on the items go to the user's shard; categories stay global
+        self.item_database = self.database
+        if get_shards():
+            self.item_database, moving = get_placement(user.pk, cached=False)
+            if moving:
+                raise CommandError(f'User "{user.username}" is being moved between shards; try again later.')
+        self.categories = dict(Category.objects.using(self.database).values_list('name', 'id'))
+        input_format = options['format'] or ('ndjson' if options['path'].endswith(('.ndjson', '.jsonl')) else 'csv')
+        batch_size = max(1, options['batch_size'])
+
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        try:
+            rows = self.read_csv(stream) if input_format == 'csv' else self.read_ndjson(stream)
+            rows = itertools.islice(rows, options['offset'], None)
+            self.import_rows(rows, user, options['offset'], batch_size, options['skip_invalid'])
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    def read_csv(self, stream):
+        yield from csv.DictReader(stream)
+
+    def read_ndjson(self, stream):
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield INVALID_JSON
+
+    def import_rows(self, rows, user, offset, batch_size, skip_invalid):
+        started = time.monotonic()
+        imported = skipped = 0
+        position = offset
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            items = []
+            category_names = []
+            for index, row in enumerate(batch, position):
+                try:
+                    items.append(self.parse_row(row))
+                    category_names.append((row.get('category') or '').strip() or None)
+                except InvalidRow as exc:
+                    if not skip_invalid:
+                        raise CommandError(
+                            f'Row {index + 1}: {exc}. {imported} rows were imported; '
+                            f'fix the row and resume with --offset {position}.')
+                    self.stderr.write(f'Skipping row {index + 1}: {exc}')
+                    skipped += 1
+
+            try:
+                with transaction.atomic(using=self.database), transaction.atomic(using=self.item_database):
+                    category_ids = self.resolve_categories(category_names)
+                    self.insert_items(user, items, category_ids)
+            except Exception as exc:
+                raise CommandError(
+                    f'Import failed: {exc}. {imported} rows were imported; resume with --offset {position}.')
+
+            imported += len(items)
+            position += len(batch)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{position} rows read, {imported} imported ({imported / elapsed if elapsed else 0:.0f} rows/s)')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} items in {elapsed:.1f}s'
+            f' ({imported / elapsed if elapsed else 0:.0f} rows/s), {skipped} skipped.'))
+
+    def parse_row(self, row):
+        if row is INVALID_JSON:
+            raise InvalidRow('invalid JSON')
+        if not isinstance(row, dict):
+            raise InvalidRow('row must be an object')
+        name = (row.get('name') or '').strip()
+        if not name:
+            raise InvalidRow('name is required')
+        try:
+            price = Decimal(str(row.get('price', '')).strip())
+            quantity = int(row.get('quantity') or 0)
+            reorder_point = int(row.get('reorder_point') or 0)
+        except (InvalidOperation, TypeError, ValueError):
+            raise InvalidRow('price, quantity and reorder_point must be numbers')
+        if not price.is_finite():
+            raise InvalidRow('price must be a number')
+        if reorder_point < 0:
+            raise InvalidRow('reorder_point must not be negative')
+        return name, row.get('description') or None, quantity, reorder_point, price.quantize(Decimal('0.01'))
+
+    def resolve_categories(self, category_names):
+        missing = {name for name in category_names if name and name not in self.categories}
+        if missing:
+            Category.objects.using(self.database).bulk_create(
+                [Category(name=name) for name in missing], ignore_conflicts=True)
+            invalidate_categories(self.database)
+            created = Category.objects.using(self.database).filter(name__in=missing)
+            self.categories.update((category.name, category.pk) for category in created)
+            if self.item_database != self.database:
+                copy_reference_rows(Category, created, [self.item_database])
+        return [self.categories[name] if name else None for name in category_names]
+
+    def insert_items(self, user, items, category_ids):
+        # A plain executemany instead of bulk_create: building a model instance
+        # and compiling every field per row costs several times the insert itself.
+        connection = connections[self.item_database]
+        opts = InventoryItem._meta
+        price_field = opts.get_field('price')
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        columns = ', '.join(connection.ops.quote_name(opts.get_field(name).column) for name in INSERT_COLUMNS)
+        sql = (f'INSERT INTO {connection.ops.quote_name(opts.db_table)} ({columns}) '
+               f'VALUES ({", ".join(["%s"] * len(INSERT_COLUMNS))})')
+        params = [
+            (user.pk, name, description, quantity, reorder_point,
+             connection.ops.adapt_decimalfield_value(price, price_field.max_digits, price_field.decimal_places),
+             category_id, now, now)
+            for (name, description, quantity, reorder_point, price), category_id in zip(items, category_ids)
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+        InventorySummary.objects.using(self.item_database).apply_changes(
+            (None, InventoryItem.RollupState(user.pk, category_id, quantity, price))
+            for (_, _, quantity, _, price), category_id in zip(items, category_ids)
+        )
@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from inventory.sharding import get_placement, get_shards, hash_shard, move_tenant, sync_reference_tables
+from inventory.write_behind import change_log_buffer
+
+
+class Command(BaseCommand):
+    help = (
+        'Move each tenant whose data is not on the shard its user id hashes to over INVENTORY_SHARDS, '
+        'one tenant at a time, after bringing the shards\' copies of users and categories up to date. '
+        'Tenants from before sharding was turned on are moved off the global database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames',
+            help='Only move this user\'s data; can be repeated.',
+        )
+        parser.add_argument('--to', help='Shard to move the --user tenants to instead of their hashed one.')
+        parser.add_argument(
+            '--grace', type=float, default=getattr(settings, 'INVENTORY_SHARD_MOVE_GRACE', 15),
+            help='Seconds to wait for other processes before copying a tenant and before deleting '
+                 'the old copy. Defaults to INVENTORY_SHARD_MOVE_GRACE.',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only list the tenants that would move.')
+
+    def handle(self, *args, **options):
+        shards = get_shards()
+        if not shards:
+            raise CommandError('Sharding is off: INVENTORY_SHARDS is empty.')
+        if options['to'] and not options['usernames']:
+            raise CommandError('--to needs --user.')
+        if options['to'] and options['to'] not in shards:
+            raise CommandError(f'{options["to"]!r} is not one of INVENTORY_SHARDS ({", ".join(shards)}).')
+
+        users = User.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+            missing = set(options['usernames']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f'Unknown users: {", ".join(sorted(missing))}.')
+
+        if not options['dry_run']:
+            sync_reference_tables()
+            # Logs spooled for a tenant must be written before it moves
+            change_log_buffer.replay()
+
+        moved = 0
+        for user_id, username in users.values_list('pk', 'username'):
+            source = get_placement(user_id, cached=False).database
+            target = options['to'] or hash_shard(user_id)
+            if source == target:
+                continue
+            moved += 1
+            if options['dry_run']:
+                self.stdout.write(f'Would move {username} from {source} to {target}.')
+                continue
+            _, counts = move_tenant(user_id, target, options['grace'])
+            self.stdout.write(f'Moved {username} from {source} to {target}: ' + ', '.join(
+                f'{count} {model._meta.verbose_name_plural}' for model, count in counts.items()) + '.')
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {moved} tenants.'))
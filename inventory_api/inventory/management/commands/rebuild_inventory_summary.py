@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import InventorySummary
+from inventory.sharding import tenant_databases
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-user inventory summary rollups from the item table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only compare the stored rollups with the item table and report differences.',
+        )
+        parser.add_argument(
+            '--database',
+            help='Database to rebuild. Defaults to every database holding inventory data, shards included.',
+        )
+
+    def handle(self, *args, **options):
+        databases = [options['database']] if options['database'] else tenant_databases()
+        mismatches = {}
+        for database in databases:
+            mismatches.update(InventorySummary.objects.using(database).mismatches())
+
+        if options['verify']:
+            for (user_id, category_id), (stored, expected) in sorted(
+                    mismatches.items(), key=lambda entry: (entry[0][0], entry[0][1] or 0)):
+                self.stdout.write(
+                    f'user={user_id} category={category_id}: stored={stored} expected={expected}')
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} summary rows are out of date.')
+            self.stdout.write(self.style.SUCCESS('Inventory summaries are up to date.'))
+            return
+
+        for database in databases:
+            InventorySummary.objects.using(database).rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt inventory summaries ({len(mismatches)} rows were out of date).'))
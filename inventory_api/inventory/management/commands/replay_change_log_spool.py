@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from inventory.write_behind import change_log_buffer
+
+
+class Command(BaseCommand):
+    help = (
+        'Write the change logs left in write-behind spool segments by processes that exited '
+        'before flushing them. Segments of running processes are left alone.'
+    )
+
+    def handle(self, *args, **options):
+        written = change_log_buffer.replay()
+        self.stdout.write(self.style.SUCCESS(f'Replayed {written} change logs.'))
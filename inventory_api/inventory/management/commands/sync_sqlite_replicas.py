@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database over the SQLite replicas in INVENTORY_DB_REPLICAS, '
+        'standing in for replication when trying out read replicas locally.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Replica to update; can be repeated. Defaults to every INVENTORY_DB_REPLICAS alias.',
+        )
+
+    def handle(self, *args, **options):
+        aliases = options['databases'] or getattr(settings, 'INVENTORY_DB_REPLICAS', [])
+        primary = connections[DEFAULT_DB_ALIAS]
+        for alias in aliases:
+            replica = connections[alias]
+            if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+                raise CommandError(f'Replica {alias!r} and the primary must both be SQLite databases.')
+            if alias == DEFAULT_DB_ALIAS or replica.settings_dict['NAME'] == primary.settings_dict['NAME']:
+                raise CommandError(f'{alias!r} is the primary database.')
+            primary.ensure_connection()
+            replica.ensure_connection()
+            # The backup API copies a consistent snapshot while writers carry on
+            primary.connection.backup(replica.connection)
+            self.stdout.write(self.style.SUCCESS(f'Copied {primary.settings_dict["NAME"]} to {alias}.'))
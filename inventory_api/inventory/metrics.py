@@ -0,0 +1,396 @@
+"""
+Prometheus metrics, served at ``/metrics`` in the text exposition format.
+
+``MetricsMiddleware`` counts requests and times them into latency
+histograms, labelled by viewset (or view) and action. Also exported:
+queries per action (counted by the request profile, see
+instrumentation.py), cache hits and misses, and per-worker gauges such as
+requests in flight.
+
+Updates don't take a lock: each thread adds to its own shard, and the
+shards are summed when metrics are collected. A finished thread's shard
+is folded into the process totals.
+
+Pre-forked WSGI workers each have their own totals. With
+INVENTORY_METRICS_DIR set, every process writes its totals to a file in
+that directory every INVENTORY_METRICS_FLUSH_INTERVAL seconds and on
+exit, and ``/metrics`` adds up the files of all of them, so any worker can
+answer a scrape. The directory should be on local disk. Files are named
+by process id and start time, as process ids are reused. Counters and
+histograms of workers that have exited still count; their gauges don't.
+When a process starts writing it takes over the counts in the files of
+processes that are gone, so files don't pile up across restarts and
+counters never go down.
+
+Latency and traffic figures aren't public: scrapes must send
+INVENTORY_METRICS_TOKEN as a bearer token, and without one configured
+``/metrics`` isn't served.
+"""
+import atexit
+import bisect
+import hmac
+import json
+import os
+import threading
+import time
+import weakref
+from pathlib import Path
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Name -> (type, help)
+METRICS = {
+    'inventory_http_requests_total': ('counter', 'Requests handled, by viewset, action, method and status.'),
+    'inventory_http_request_duration_seconds': ('histogram', 'Request latency, by viewset and action.'),
+    'inventory_http_requests_in_flight': ('gauge', 'Requests being handled.'),
+    'inventory_db_queries_total': ('counter', 'Database queries run by requests, by viewset and action.'),
+    'inventory_db_query_duration_seconds_total': ('counter', 'Time spent in database queries by requests.'),
+    'inventory_cache_requests_total': ('counter', 'Cache lookups, by cache and result (hit or miss).'),
+    'inventory_change_log_queue_depth': ('gauge', 'Change logs waiting to be written behind.'),
+    'inventory_worker_threads': ('gauge', 'Threads in the worker processes.'),
+    'inventory_workers': ('gauge', 'Worker processes reporting metrics.'),
+}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Shard:
+    """One thread's metrics, keyed by (name, labels)."""
+
+    __slots__ = ('counters', 'gauges', 'histograms', '__weakref__')
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        # Count per bucket, then the sum
+        self.histograms = {}
+
+
+class ShardOwner:
+    """Kept in a thread's locals; its shard is retired when it goes."""
+
+
+class Registry:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # Also run in forked children, where another thread may have held the lock
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._active = []
+        self._retired = Shard()
+        self._pid = None
+        self._worker = None
+
+    @property
+    def buckets(self):
+        return getattr(settings, 'INVENTORY_METRICS_BUCKETS', DEFAULT_BUCKETS)
+
+    @property
+    def directory(self):
+        directory = getattr(settings, 'INVENTORY_METRICS_DIR', None)
+        return Path(directory) if directory else None
+
+    def shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            pass
+        shard = self._local.shard = Shard()
+        owner = self._local.owner = ShardOwner()
+        weakref.finalize(owner, self._retire, shard)
+        with self._lock:
+            self._active.append(shard)
+        return shard
+
+    def _retire(self, shard):
+        with self._lock:
+            if shard in self._active:
+                self._active.remove(shard)
+                merge(self._retired, shard)
+
+    def inc(self, name, labels=(), amount=1):
+        counters = self.shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def add_gauge(self, name, labels=(), amount=1):
+        gauges = self.shard().gauges
+        key = (name, labels)
+        gauges[key] = gauges.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        histograms = self.shard().histograms
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram[bisect.bisect_left(self.buckets, value)] += 1
+        histogram[-1] += value
+
+    def snapshot(self):
+        """This process's totals."""
+        total = Shard()
+        with self._lock:
+            merge(total, self._retired)
+            for shard in list(self._active):
+                merge(total, shard)
+        for name, value in process_gauges().items():
+            total.gauges[(name, ())] = value
+        return total
+
+    def worker(self):
+        """(pid, start time) of this process; unlike the pid alone, never reused."""
+        pid = os.getpid()
+        if self._worker is None or self._worker[0] != pid:
+            # Where the start time can't be read, any value unique to this process does
+            self._worker = (pid, process_start_time(pid) or time.time_ns())
+        return self._worker
+
+    def start(self):
+        """Write this process's totals to INVENTORY_METRICS_DIR from now on, once per process."""
+        if self._pid == os.getpid() or self.directory is None:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.take_over_exited()
+            threading.Thread(target=self.run, name='metrics-writer', daemon=True).start()
+            atexit.register(self.write)
+
+    def take_over_exited(self):
+        """Fold the counts in the files of processes that are gone into this one's, and remove the files."""
+        for path in self.directory.glob('*.tmp'):
+            # Left by a process that died while writing
+            pid, _, started = path.name.partition('.')[0].partition('-')
+            if pid.isdigit() and started.isdigit() and not is_alive(int(pid), int(started)):
+                path.unlink(missing_ok=True)
+        for path in self.directory.glob('*.json'):
+            data = read_shard(path)
+            if data is None or is_alive(data['pid'], data.get('started')):
+                continue
+            # Only one of the processes starting at once may take them
+            claimed = path.with_suffix(f'.{os.getpid()}.exited')
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue
+            shard = as_shard(data)
+            # Gauges were only true while the process ran
+            shard.gauges = {}
+            with self._lock:
+                merge(self._retired, shard)
+            # Written before the file goes, so no scrape misses the counts
+            self.write()
+            claimed.unlink()
+
+    def run(self):
+        interval = getattr(settings, 'INVENTORY_METRICS_FLUSH_INTERVAL', 1.0)
+        while True:
+            time.sleep(interval)
+            self.write()
+
+    def write(self):
+        directory = self.directory
+        if directory is None:
+            return
+        snapshot = self.snapshot()
+        pid, started = self.worker()
+        path = directory / f'{pid}-{started}.json'
+        # Scrapes write too, alongside the writer thread
+        temporary = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        temporary.write_text(json.dumps({
+            'pid': pid,
+            'started': started,
+            'counters': [[name, labels, value] for (name, labels), value in snapshot.counters.items()],
+            'gauges': [[name, labels, value] for (name, labels), value in snapshot.gauges.items()],
+            'histograms': [[name, labels, value] for (name, labels), value in snapshot.histograms.items()],
+        }))
+        # Readers never see a partly written file
+        os.replace(temporary, path)
+
+    def collect(self):
+        """Totals of this process, or of every process writing to INVENTORY_METRICS_DIR."""
+        if self.directory is None:
+            total = self.snapshot()
+            total.gauges[('inventory_workers', ())] = 1
+            return total
+        self.start()
+        self.write()
+        total = Shard()
+        workers = 0
+        for path in self.directory.glob('*.json'):
+            data = read_shard(path)
+            if data is None:
+                continue
+            shard = as_shard(data)
+            if is_alive(data['pid'], data.get('started')):
+                workers += 1
+            else:
+                shard.gauges = {}
+            merge(total, shard)
+        total.gauges[('inventory_workers', ())] = workers
+        return total
+
+
+def read_shard(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def as_labels(labels):
+    return tuple(tuple(label) for label in labels)
+
+
+def as_shard(data):
+    shard = Shard()
+    for kind in ('counters', 'gauges', 'histograms'):
+        setattr(shard, kind, {(name, as_labels(labels)): value for name, labels, value in data[kind]})
+    return shard
+
+
+def merge(total, shard):
+    for target, source in ((total.counters, shard.counters), (total.gauges, shard.gauges)):
+        # Copied first, as the owning thread may be adding keys
+        for key, value in dict(source).items():
+            target[key] = target.get(key, 0) + value
+    for key, value in dict(shard.histograms).items():
+        histogram = total.histograms.get(key)
+        if histogram is None:
+            total.histograms[key] = list(value)
+        else:
+            for index, count in enumerate(value):
+                histogram[index] += count
+
+
+def process_start_time(pid):
+    """When ``pid`` started, in clock ticks since boot, or None where there's no /proc."""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as stat:
+            # The fields after the parenthesized command name, from the third
+            return int(stat.read().rpartition(b')')[2].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def is_alive(pid, started=None):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # A reused pid belongs to a process that started at another time
+    current = process_start_time(pid)
+    return started is None or current is None or current == started
+
+
+def process_gauges():
+    from .write_behind import change_log_buffer
+
+    return {
+        'inventory_worker_threads': threading.active_count(),
+        'inventory_change_log_queue_depth': change_log_buffer.queue_depth(),
+    }
+
+
+registry = Registry()
+
+# Forked workers start from zero rather than with a copy of the parent's totals
+os.register_at_fork(after_in_child=registry.reset)
+
+
+def view_labels(request):
+    """(viewset or view, action) of the view that handled ``request``."""
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched', ''
+    view = match.func
+    # The native async views shadow a viewset route, and fall back to it
+    view = getattr(view, 'view_initkwargs', {}).get('sync_view', view)
+    view_class = getattr(view, 'cls', None) or getattr(view, 'view_class', None)
+    if view_class is None:
+        return match.view_name or view.__name__, ''
+    actions = getattr(view, 'actions', None)
+    if actions is None:
+        return view_class.__name__, request.method.lower()
+    return view_class.__name__, actions.get(request.method.lower(), '')
+
+
+def record_cache(cache, hit):
+    registry.inc('inventory_cache_requests_total', (('cache', cache), ('result', 'hit' if hit else 'miss')))
+
+
+def request_started():
+    registry.add_gauge('inventory_http_requests_in_flight')
+    return time.perf_counter()
+
+
+def request_finished(request, response, started, profile):
+    duration = time.perf_counter() - started
+    viewset, action = view_labels(request)
+    labels = (('viewset', viewset), ('action', action))
+    registry.inc('inventory_http_requests_total',
+                 labels + (('method', request.method), ('status', str(response.status_code))))
+    registry.observe('inventory_http_request_duration_seconds', labels, duration)
+    if profile is not None:
+        registry.inc('inventory_db_queries_total', labels, profile.queries)
+        registry.inc('inventory_db_query_duration_seconds_total', labels, profile.sql_time)
+
+
+def request_done():
+    registry.add_gauge('inventory_http_requests_in_flight', amount=-1)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(total, buckets=DEFAULT_BUCKETS):
+    """``total`` in the Prometheus text format."""
+    series = {}
+    for (name, labels), value in sorted(total.counters.items()):
+        series.setdefault(name, []).append(f'{name}{format_labels(labels)} {format_value(value)}')
+    for (name, labels), value in sorted(total.gauges.items()):
+        series.setdefault(name, []).append(f'{name}{format_labels(labels)} {format_value(value)}')
+    for (name, labels), histogram in sorted(total.histograms.items()):
+        lines = series.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip([*map(format_value, buckets), '+Inf'], histogram):
+            cumulative += count
+            lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+        lines.append(f'{name}_sum{format_labels(labels)} {format_value(histogram[-1])}')
+        lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+    output = []
+    for name, (kind, help_text) in METRICS.items():
+        output.append(f'# HELP {name} {help_text}')
+        output.append(f'# TYPE {name} {kind}')
+        output.extend(series.get(name, []))
+    return '\n'.join(output) + '\n'
+
+
+def metrics_view(request):
+    token = getattr(settings, 'INVENTORY_METRICS_TOKEN', None)
+    if not token:
+        raise Http404('Set INVENTORY_METRICS_TOKEN to serve metrics.')
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+    return HttpResponse(exposition(registry.collect(), registry.buckets), content_type=CONTENT_TYPE)
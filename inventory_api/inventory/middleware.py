@@ -0,0 +1,130 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .instrumentation import current_profile, profile_request, report
+from .metrics import registry, request_done, request_finished, request_started
+from .routers import route_request
+
+
+class ReplicaRoutingMiddleware:
+    """Let ``routers.ReplicaRouter`` send the reads of safe-method requests to replicas."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with route_request(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with route_request(request):
+            return await self.get_response(request)
+
+
+class RequestTimingMiddleware:
+    """
+    Profile each request's SQL and phases and report them in a Server-Timing
+    header and the slow request log (see instrumentation.py).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INVENTORY_REQUEST_TIMING', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django would otherwise run the sync hooks in a thread
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with profile_request() as profile:
+            response = self.get_response(request)
+        report(request, response, profile)
+        return response
+
+    async def __acall__(self, request):
+        with profile_request() as profile:
+            response = await self.get_response(request)
+        report(request, response, profile)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.view_started()
+
+    def process_template_response(self, request, response):
+        self.render_started(response)
+        return response
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self.view_started()
+
+    async def aprocess_template_response(self, request, response):
+        self.render_started(response)
+        return response
+
+    def view_started(self):
+        profile = current_profile.get()
+        if profile is not None:
+            profile.enter('view')
+
+    def render_started(self, response):
+        profile = current_profile.get()
+        if profile is not None:
+            # DRF responses are rendered after the view returns
+            profile.exit('view')
+            profile.enter('render')
+            response.add_post_render_callback(lambda response: profile.exit('render'))
+
+
+class MetricsMiddleware:
+    """
+    Count and time requests by viewset and action for ``/metrics`` (see
+    metrics.py). Goes after RequestTimingMiddleware, whose query counts it reports.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INVENTORY_METRICS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        registry.start()
+        started = request_started()
+        try:
+            response = self.get_response(request)
+            request_finished(request, response, started, current_profile.get())
+        finally:
+            request_done()
+        return response
+
+    async def __acall__(self, request):
+        registry.start()
+        started = request_started()
+        try:
+            response = await self.get_response(request)
+            request_finished(request, response, started, current_profile.get())
+        finally:
+            # Also when the client disconnects and the request is cancelled
+            request_done()
+        return response
@@ -0,0 +1,67 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_change_log_owners(apps, schema_editor):
+    InventoryChangeLog = apps.get_model('inventory', 'InventoryChangeLog')
+    InventoryItem = apps.get_model('inventory', 'InventoryItem')
+    owner = InventoryItem.objects.filter(pk=models.OuterRef('inventory_item_id')).values('user_id')[:1]
+    InventoryChangeLog.objects.using(schema_editor.connection.alias).update(owner_id=models.Subquery(owner))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorychangelog',
+            name='owner',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='owned_change_logs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(fill_change_log_owners, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='inventorychangelog',
+            name='owner',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='owned_change_logs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(fields=['user', 'id'], name='item_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(fields=['user', 'category', 'id'], name='item_user_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(fields=['user', 'quantity', 'id'], name='item_user_quantity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(fields=['user', 'price', 'id'], name='item_user_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorychangelog',
+            index=models.Index(fields=['owner', '-timestamp', '-id'], name='changelog_owner_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorychangelog',
+            index=models.Index(fields=['inventory_item', '-timestamp', '-id'], name='changelog_item_ts_idx'),
+        ),
+        # The composite indexes above lead with these columns
+        migrations.AlterField(
+            model_name='inventoryitem',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='inventory_items', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='inventorychangelog',
+            name='inventory_item',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='change_logs', to='inventory.inventoryitem'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE inventory_item_fts USING fts5(
+        name, description,
+        content='inventory_inventoryitem', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER inventory_item_fts_insert AFTER INSERT ON inventory_inventoryitem BEGIN
+        INSERT INTO inventory_item_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER inventory_item_fts_delete AFTER DELETE ON inventory_inventoryitem BEGIN
+        INSERT INTO inventory_item_fts(inventory_item_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER inventory_item_fts_update AFTER UPDATE OF name, description ON inventory_inventoryitem BEGIN
+        INSERT INTO inventory_item_fts(inventory_item_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO inventory_item_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO inventory_item_fts(inventory_item_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS inventory_item_fts_update',
+    'DROP TRIGGER IF EXISTS inventory_item_fts_delete',
+    'DROP TRIGGER IF EXISTS inventory_item_fts_insert',
+    'DROP TABLE IF EXISTS inventory_item_fts',
+]
+
+POSTGRESQL_FORWARD = [
+    # Must match PostgreSQLSearchBackend.document exactly
+    """
+    CREATE INDEX IF NOT EXISTS item_search_idx ON inventory_inventoryitem USING gin (
+        to_tsvector('english', coalesce("inventory_inventoryitem"."name", '') || ' ' ||
+                    coalesce("inventory_inventoryitem"."description", ''))
+    )
+    """,
+]
+
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS item_search_idx',
+]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_statements({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            run_statements({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-17 04:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_summaries(apps, schema_editor):
+    InventoryItem = apps.get_model('inventory', 'InventoryItem')
+    InventorySummary = apps.get_model('inventory', 'InventorySummary')
+    rows = (InventoryItem.objects.using(schema_editor.connection.alias).order_by()
+            .values('user_id', 'category_id')
+            .annotate(sku_count=models.Count('id'), total_units=models.Sum('quantity'),
+                      total_value=models.Sum(models.F('quantity') * models.F('price'),
+                                             output_field=models.DecimalField(max_digits=16, decimal_places=2))))
+    InventorySummary.objects.using(schema_editor.connection.alias).bulk_create(
+        InventorySummary(**row) for row in rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_inventory_item_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku_count', models.IntegerField(default=0)),
+                ('total_units', models.BigIntegerField(default=0)),
+                ('total_value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='inventory.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Inventory summaries',
+                'constraints': [models.UniqueConstraint(fields=('user', 'category'), name='summary_user_category_uniq'), models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('user',), name='summary_user_uncategorized_uniq')],
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.7 on 2026-10-17 04:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def build_daily_stats(apps, schema_editor):
+    InventoryChangeLog = apps.get_model('inventory', 'InventoryChangeLog')
+    ChangeLogDailyStat = apps.get_model('inventory', 'ChangeLogDailyStat')
+    rows = (InventoryChangeLog.objects.using(schema_editor.connection.alias).order_by()
+            .annotate(day=TruncDate('timestamp'))
+            .values('owner_id', 'day', 'inventory_item_id', 'change_type')
+            .annotate(net_units=models.Sum(models.F('new_quantity') - models.F('previous_quantity')),
+                      change_count=models.Count('id'),
+                      category_id=models.Max('inventory_item__category_id')))
+    ChangeLogDailyStat.objects.using(schema_editor.connection.alias).bulk_create(
+        (ChangeLogDailyStat(**row) for row in rows.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_inventory_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('change_type', models.CharField(choices=[('restock', 'Restock'), ('sale', 'Sale'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('net_units', models.BigIntegerField(default=0)),
+                ('change_count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventory.category')),
+                ('inventory_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='inventory.inventoryitem')),
+                ('owner', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='change_log_daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'category', 'day'], name='daily_stat_category_idx')],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'day', 'inventory_item', 'change_type'), name='daily_stat_uniq')],
+            },
+        ),
+        migrations.RunPython(build_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-17 05:08
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+
+search_migration = import_module('inventory.migrations.0003_inventory_item_search')
+
+# Adding or removing the column can rebuild the item table on SQLite, which
+# drops the full-text search triggers defined on it. Item ids are kept, so
+# the FTS index itself is still valid and only the triggers need recreating.
+SQLITE_TRIGGERS = [statement.replace('CREATE TRIGGER', 'CREATE TRIGGER IF NOT EXISTS')
+                   for statement in search_migration.SQLITE_FORWARD if 'CREATE TRIGGER' in statement]
+recreate_triggers = search_migration.run_statements({'sqlite': SQLITE_TRIGGERS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_change_log_daily_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, recreate_triggers),
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='reorder_point',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(recreate_triggers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(condition=models.Q(('quantity__lte', models.F('reorder_point'))), fields=['user', 'id'], name='item_low_stock_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-17 05:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_reorder_point'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventorychangelog',
+            name='change_type',
+            field=models.CharField(choices=[('restock', 'Restock'), ('sale', 'Sale'), ('adjustment', 'Adjustment'), ('checkpoint', 'Checkpoint')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ArchivedChangeLog',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('previous_quantity', models.IntegerField()),
+                ('new_quantity', models.IntegerField()),
+                ('change_type', models.CharField(choices=[('restock', 'Restock'), ('sale', 'Sale'), ('adjustment', 'Adjustment'), ('checkpoint', 'Checkpoint')], max_length=20)),
+                ('timestamp', models.DateTimeField()),
+                ('inventory_item', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_change_logs', to='inventory.inventoryitem')),
+                ('owner', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-timestamp', '-id'], name='archived_owner_ts_idx'), models.Index(fields=['inventory_item', '-timestamp', '-id'], name='archived_item_ts_idx')],
+            },
+        ),
+    ]
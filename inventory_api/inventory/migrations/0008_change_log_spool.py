@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-17 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_change_log_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogSpoolPosition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segment', models.CharField(max_length=255, unique=True)),
+                ('sequence', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-17 06:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_tenant_placement'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventorychangelog',
+            index=models.Index(condition=models.Q(('change_type', 'checkpoint'), _negated=True), fields=['timestamp', 'id'], name='changelog_archive_idx'),
+        ),
+    ]
@@ -1,4 +1,9 @@
-from django.db import models
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import F, Q, Count, Sum
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 class Category(models.Model):
@@ -11,32 +16,504 @@ class Category(models.Model):
     class Meta:
         verbose_name_plural = "Categories"
 
+class StockAdjustmentError(Exception):
+    """
+    Raised when one or more stock adjustments could not be applied.
+
+    ``errors`` maps the index of each failing adjustment to an error code,
+    either ``'not_found'`` or ``'insufficient_stock'``.
+    """
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+class InventoryItemQuerySet(models.QuerySet):
+    def adjust_quantities(self, adjustments, user, allow_negative=False):
+        """
+        Apply ``(item_id, delta, change_type)`` adjustments atomically.
+
+        Each delta is applied with a single ``UPDATE ... SET quantity =
+        quantity + delta`` so concurrent adjustments never lose updates.
+        Unless ``allow_negative`` is set, an adjustment that would take the
+        stock below zero is rejected. Either every adjustment is applied
+        and logged, or none are and StockAdjustmentError is raised.
+        """
+        to_pk = self.model._meta.pk.to_python
+        adjustments = [(to_pk(item_id), delta, change_type)
+                       for item_id, delta, change_type in adjustments]
+        errors = {}
+        now = timezone.now()
+        with transaction.atomic(using=self.db):
+            for index, (item_id, delta, change_type) in enumerate(adjustments):
+                queryset = self.filter(pk=item_id)
+                if not allow_negative and delta < 0:
+                    queryset = queryset.filter(quantity__gte=-delta)
+                if not queryset.update(quantity=F('quantity') + delta, last_updated=now):
+                    exists = self.filter(pk=item_id).exists()
+                    errors[index] = 'insufficient_stock' if exists else 'not_found'
+            if errors:
+                transaction.set_rollback(True, using=self.db)
+                raise StockAdjustmentError(errors)
+
+            items = self.select_related('category').in_bulk([a[0] for a in adjustments])
+            # Walk the adjustments backwards so repeated ids in one batch get
+            # a correct previous/new quantity chain.
+            running = {pk: item.quantity for pk, item in items.items()}
+            logs = []
+            for item_id, delta, change_type in reversed(adjustments):
+                new_quantity = running[item_id]
+                running[item_id] = new_quantity - delta
+                logs.append(InventoryChangeLog(
+                    inventory_item=items[item_id],
+                    user=user,
+                    previous_quantity=new_quantity - delta,
+                    new_quantity=new_quantity,
+                    change_type=change_type or InventoryChangeLog.change_type_for(delta),
+                ))
+            logs.reverse()
+            InventoryChangeLog.objects.using(self.db).bulk_create(logs)
+            
+            # ``running`` now holds each item's quantity before this batch
+            InventorySummary.objects.using(self.db).apply_changes(
+                (item.rollup_state()._replace(quantity=running[pk]), item.rollup_state())
+                for pk, item in items.items()
+            )
+        return [items[a[0]] for a in adjustments], logs
+
+    def adjust_quantity(self, item_id, delta, user, change_type=None, allow_negative=False):
+        items, logs = self.adjust_quantities(
+            [(item_id, delta, change_type)], user, allow_negative=allow_negative)
+        return items[0], logs[0]
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            InventorySummary.objects.using(self.db).apply_changes(
+                (None, obj.rollup_state()) for obj in objs)
+        return objs
+    
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            previous = InventoryItem.current_rollup_states([obj.pk for obj in objs], using=self.db)
+            updated = super().bulk_update(objs, fields, *args, **kwargs)
+            InventorySummary.objects.using(self.db).apply_changes(
+                (previous.get(obj.pk), obj.rollup_state()) for obj in objs)
+        return updated
+
 class InventoryItem(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inventory_items')
+    # Indexed through the composite indexes in Meta, all of which lead with user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inventory_items', db_index=False)
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
     quantity = models.IntegerField(default=0)
+    # Items at or below this quantity show up in the low stock feed
+    reorder_point = models.PositiveIntegerField(default=0)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='items')
     date_added = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
     
+    objects = InventoryItemQuerySet.as_manager()
+    
+    # The fields that feed InventorySummary
+    RollupState = namedtuple('RollupState', ['user_id', 'category_id', 'quantity', 'price'])
+    
     def __str__(self):
         return self.name
+    
+    def rollup_state(self):
+        price = self._meta.get_field('price').to_python(self.price)
+        return self.RollupState(self.user_id, self.category_id, self.quantity, price)
+    
+    @classmethod
+    def current_rollup_states(cls, pks, using=None):
+        """
+        Rollup state of each stored item, by pk, locking the rows until the
+        surrounding transaction ends so the delta applied afterwards is exact.
+        """
+        rows = (cls._base_manager.using(using).select_for_update().filter(pk__in=pks)
+                .values_list('pk', *cls.RollupState._fields))
+        return {row[0]: cls.RollupState(*row[1:]) for row in rows}
+    
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            previous = None
+            if not self._state.adding:
+                previous = self.current_rollup_states([self.pk], using).get(self.pk)
+            super().save(*args, **kwargs)
+            InventorySummary.objects.using(using).apply_changes([(previous, self.rollup_state())])
+    
+    class Meta:
+        # Every API query is scoped to the owner, so each index leads with
+        # ``user`` and ends with ``id`` to also serve the keyset ordering.
+        indexes = [
+            models.Index(fields=['user', 'id'], name='item_user_id_idx'),
+            models.Index(fields=['user', 'category', 'id'], name='item_user_category_idx'),
+            models.Index(fields=['user', 'quantity', 'id'], name='item_user_quantity_idx'),
+            models.Index(fields=['user', 'price', 'id'], name='item_user_price_idx'),
+            # Only low rows are indexed, so the low stock feed stays small and
+            # cheap however many healthy items there are; the database keeps
+            # it current on every write, F() and bulk updates included.
+            models.Index(fields=['user', 'id'], condition=Q(quantity__lte=F('reorder_point')),
+                         name='item_low_stock_idx'),
+        ]
+
+class InventoryChangeLogQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.fill_owner()
+        # Timestamps set beforehand, such as on logs written behind, are
+        # kept; auto_now_add would otherwise replace them on insert.
+        timestamps = [obj.timestamp for obj in objs]
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            preset = []
+            for obj, timestamp in zip(objs, timestamps):
+                if timestamp is not None:
+                    obj.timestamp = timestamp
+                    preset.append(obj)
+            if preset:
+                self.bulk_update(preset, ['timestamp'])
+            ChangeLogDailyStat.objects.using(self.db).record(objs)
+        return objs
+    
+    def archive(self, cutoff, batch_size=1000, after=None):
+        """
+        Move up to ``batch_size`` logs older than ``cutoff`` to
+        ArchivedChangeLog and fold them into their items' checkpoint rows.
+        
+        Each call is one short transaction over the oldest logs, read in
+        (timestamp, id) order through changelog_archive_idx, so archiving
+        can stop and resume at any point. ``after`` is the (timestamp, id)
+        returned by the previous call, to carry on from there without
+        rereading the index. Returns the number of logs moved, 0 once
+        nothing is left, and the (timestamp, id) of the last one.
+        """
+        logs = self.filter(timestamp__lt=cutoff).exclude(change_type=InventoryChangeLog.CHECKPOINT)
+        if after is not None:
+            logs = logs.filter(timestamp__gte=after[0]).exclude(timestamp=after[0], id__lte=after[1])
+        with transaction.atomic(using=self.db):
+            logs = list(logs.order_by('timestamp', 'id')[:batch_size])
+            if not logs:
+                return 0, after
+            ArchivedChangeLog.objects.using(self.db).bulk_create(
+                ArchivedChangeLog(id=log.id, inventory_item_id=log.inventory_item_id, user_id=log.user_id,
+                                  owner_id=log.owner_id, previous_quantity=log.previous_quantity,
+                                  new_quantity=log.new_quantity, change_type=log.change_type,
+                                  timestamp=log.timestamp)
+                for log in logs
+            )
+            
+            checkpoints = {
+                checkpoint.inventory_item_id: checkpoint
+                for checkpoint in self.filter(change_type=InventoryChangeLog.CHECKPOINT,
+                                              inventory_item_id__in={log.inventory_item_id for log in logs})
+            }
+            created = []
+            # In time order, so each item's checkpoint ends on its last change in the batch
+            for log in logs:
+                checkpoint = checkpoints.get(log.inventory_item_id)
+                if checkpoint is None:
+                    # The quantity before the first archived change
+                    checkpoint = checkpoints[log.inventory_item_id] = InventoryChangeLog(
+                        inventory_item_id=log.inventory_item_id, owner_id=log.owner_id,
+                        previous_quantity=log.previous_quantity, change_type=InventoryChangeLog.CHECKPOINT)
+                    created.append(checkpoint)
+                checkpoint.user_id = log.user_id
+                checkpoint.new_quantity = log.new_quantity
+                checkpoint.timestamp = log.timestamp
+            
+            # Checkpoints summarize changes already counted in the daily
+            # stats, so skip record(); auto_now_add overwrites the timestamps
+            # on insert, which bulk_update() puts back.
+            timestamps = [checkpoint.timestamp for checkpoint in created]
+            super().bulk_create(created)
+            for checkpoint, timestamp in zip(created, timestamps):
+                checkpoint.timestamp = timestamp
+            self.bulk_update(checkpoints.values(), ['user', 'new_quantity', 'timestamp'])
+            self.filter(pk__in=[log.pk for log in logs]).delete()
+        return len(logs), (logs[-1].timestamp, logs[-1].id)
 
 class InventoryChangeLog(models.Model):
-    CHANGE_TYPES = [
+    STOCK_CHANGE_TYPES = [
         ('restock', 'Restock'),
         ('sale', 'Sale'),
         ('adjustment', 'Adjustment'),
     ]
+    # Stands in for an item's archived history: previous_quantity is the
+    # quantity before its first archived change, new_quantity and timestamp
+    # those of its last one.
+    CHECKPOINT = 'checkpoint'
+    CHANGE_TYPES = STOCK_CHANGE_TYPES + [(CHECKPOINT, 'Checkpoint')]
     
-    inventory_item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='change_logs')
+    inventory_item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='change_logs',
+                                       db_index=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Owner of the inventory item, denormalized so listing a user's history
+    # does not need to join through inventory_item.
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='owned_change_logs', db_index=False)
     previous_quantity = models.IntegerField()
     new_quantity = models.IntegerField()
     change_type = models.CharField(max_length=20, choices=CHANGE_TYPES)
     timestamp = models.DateTimeField(auto_now_add=True)
     
+    objects = InventoryChangeLogQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', '-timestamp', '-id'], name='changelog_owner_ts_idx'),
+            models.Index(fields=['inventory_item', '-timestamp', '-id'], name='changelog_item_ts_idx'),
+            # Archiving walks the oldest logs; checkpoints stay behind
+            models.Index(fields=['timestamp', 'id'], condition=~Q(change_type='checkpoint'),
+                         name='changelog_archive_idx'),
+        ]
+    
+    @staticmethod
+    def change_type_for(delta):
+        return 'restock' if delta > 0 else 'sale'
+    
+    def fill_owner(self):
+        if self.owner_id is None:
+            self.owner_id = self.inventory_item.user_id
+    
+    def save(self, *args, **kwargs):
+        self.fill_owner()
+        adding = self._state.adding
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            if adding:
+                ChangeLogDailyStat.objects.using(using).record([self])
+    
+    def __str__(self):
+        return f"{self.inventory_item.name} - {self.change_type} - {self.timestamp}"
+
+class ChangeLogSpoolPosition(models.Model):
+    """
+    The last change log from a write-behind spool segment that is in the
+    database, written in the same transaction as the logs themselves.
+    """
+    segment = models.CharField(max_length=255, unique=True)
+    sequence = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.segment} @ {self.sequence}"
+
+class TenantPlacement(models.Model):
+    """
+    The shard holding a user's inventory data when sharding is on (see
+    sharding.py). ``moving`` is set while the data is being moved.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='tenant_placement')
+    shard = models.CharField(max_length=100)
+    moving = models.BooleanField(default=False)
+    
     def __str__(self):
-        return f"{self.inventory_item.name} - {self.change_type} - {self.timestamp}"
\ No newline at end of file
+        return f"{self.user_id} @ {self.shard}"
+
+class ArchivedChangeLog(models.Model):
+    """
+    Change logs moved out of InventoryChangeLog once they are past the
+    retention horizon, under their original ids.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    inventory_item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE,
+                                       related_name='archived_change_logs', db_index=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    previous_quantity = models.IntegerField()
+    new_quantity = models.IntegerField()
+    change_type = models.CharField(max_length=20, choices=InventoryChangeLog.CHANGE_TYPES)
+    timestamp = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', '-timestamp', '-id'], name='archived_owner_ts_idx'),
+            models.Index(fields=['inventory_item', '-timestamp', '-id'], name='archived_item_ts_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.inventory_item.name} - {self.change_type} - {self.timestamp}"
+
+class InventorySummaryQuerySet(models.QuerySet):
+    def apply_changes(self, changes):
+        """
+        Fold item changes into the rollups.
+        
+        ``changes`` is an iterable of ``(previous, current)`` RollupStates;
+        ``previous`` is None for a new item and ``current`` is None for a
+        deleted one. Each affected (user, category) row is updated once
+        with F() arithmetic, so concurrent writers never lose increments.
+        """
+        deltas = defaultdict(lambda: [0, 0, Decimal('0')])
+        for previous, current in changes:
+            for state, sign in ((previous, -1), (current, 1)):
+                if state is None:
+                    continue
+                delta = deltas[state.user_id, state.category_id]
+                delta[0] += sign
+                delta[1] += sign * state.quantity
+                delta[2] += sign * state.quantity * Decimal(state.price)
+        
+        for (user_id, category_id), (skus, units, value) in deltas.items():
+            if not (skus or units or value):
+                continue
+            if self._increment(user_id, category_id, skus, units, value):
+                continue
+            # Rows only go missing when nothing was counted yet, or while the
+            # owner is being deleted; only a newly counted item creates one.
+            if skus <= 0:
+                continue
+            self._create(user_id, category_id, skus, units, value)
+    
+    def _increment(self, user_id, category_id, skus, units, value):
+        return self.filter(user_id=user_id, category_id=category_id).update(
+            sku_count=F('sku_count') + skus,
+            total_units=F('total_units') + units,
+            total_value=F('total_value') + value,
+        )
+    
+    def _create(self, user_id, category_id, skus, units, value):
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(user_id=user_id, category_id=category_id, sku_count=skus,
+                            total_units=units, total_value=value)
+        except IntegrityError:
+            # Another writer created the row first
+            self._increment(user_id, category_id, skus, units, value)
+    
+    def move_to_uncategorized(self, category_id):
+        """Fold a category's rollups into the uncategorized rows before it is deleted."""
+        for summary in self.filter(category_id=category_id):
+            totals = (summary.sku_count, summary.total_units, summary.total_value)
+            if not self._increment(summary.user_id, None, *totals):
+                self._create(summary.user_id, None, *totals)
+            summary.delete()
+    
+    def expected(self):
+        """The rollups computed from scratch, keyed by (user_id, category_id)."""
+        rows = (InventoryItem.objects.using(self.db).order_by()
+                .values('user_id', 'category_id')
+                .annotate(sku_count=Count('id'), total_units=Sum('quantity'),
+                          total_value=Sum(F('quantity') * F('price'),
+                                          output_field=models.DecimalField(max_digits=16, decimal_places=2))))
+        return {
+            (row['user_id'], row['category_id']): (
+                row['sku_count'], row['total_units'], Decimal(row['total_value']).quantize(Decimal('0.01')))
+            for row in rows
+        }
+    
+    def mismatches(self):
+        """Rows whose stored totals differ from :meth:`expected`, as {key: (stored, expected)}."""
+        stored = {
+            (row.user_id, row.category_id): (row.sku_count, row.total_units, row.total_value)
+            for row in self.all() if row.sku_count or row.total_units or row.total_value
+        }
+        expected = self.expected()
+        return {
+            key: (stored.get(key), expected.get(key))
+            for key in stored.keys() | expected.keys()
+            if stored.get(key) != expected.get(key)
+        }
+    
+    def rebuild(self):
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            self.bulk_create(
+                InventorySummary(user_id=user_id, category_id=category_id, sku_count=skus,
+                                 total_units=units, total_value=value)
+                for (user_id, category_id), (skus, units, value) in self.expected().items()
+            )
+
+class InventorySummary(models.Model):
+    """
+    Per-user, per-category stock totals, maintained incrementally on every
+    item write. A null category holds the user's uncategorized items.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inventory_summaries')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, related_name='summaries')
+    sku_count = models.IntegerField(default=0)
+    total_units = models.BigIntegerField(default=0)
+    total_value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    
+    objects = InventorySummaryQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name_plural = "Inventory summaries"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category'], name='summary_user_category_uniq'),
+            models.UniqueConstraint(fields=['user'], condition=models.Q(category__isnull=True),
+                                    name='summary_user_uncategorized_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} - {self.category or 'Uncategorized'}"
+
+
+class ChangeLogDailyStatQuerySet(models.QuerySet):
+    def record(self, logs):
+        """Add newly written change logs to their day's totals."""
+        logs = list(logs)
+        # Logs built from ids, as by the write-behind flush, don't carry their
+        # item; look up the categories of those items in one query
+        uncached = {log.inventory_item_id for log in logs if not InventoryChangeLog.inventory_item.is_cached(log)}
+        item_categories = dict(InventoryItem.objects.using(self.db).filter(pk__in=uncached)
+                               .values_list('pk', 'category_id')) if uncached else {}
+        totals = defaultdict(lambda: [0, 0])
+        categories = {}
+        for log in logs:
+            key = (log.owner_id, timezone.localdate(log.timestamp), log.inventory_item_id, log.change_type)
+            totals[key][0] += log.new_quantity - log.previous_quantity
+            totals[key][1] += 1
+            if InventoryChangeLog.inventory_item.is_cached(log):
+                categories[key] = log.inventory_item.category_id
+            else:
+                categories[key] = item_categories.get(log.inventory_item_id)
+        
+        for (owner_id, day, item_id, change_type), (net_units, changes) in totals.items():
+            lookup = dict(owner_id=owner_id, day=day, inventory_item_id=item_id, change_type=change_type)
+            if self._increment(lookup, net_units, changes):
+                continue
+            try:
+                with transaction.atomic(using=self.db):
+                    self.create(net_units=net_units, change_count=changes,
+                                category_id=categories[owner_id, day, item_id, change_type], **lookup)
+            except IntegrityError:
+                # Another writer created the row first
+                self._increment(lookup, net_units, changes)
+    
+    def _increment(self, lookup, net_units, changes):
+        return self.filter(**lookup).update(
+            net_units=F('net_units') + net_units,
+            change_count=F('change_count') + changes,
+        )
+
+class ChangeLogDailyStat(models.Model):
+    """
+    Net unit movement per owner, day, item and change type, maintained as
+    change logs are written. ``category`` is the item's category when the
+    first change of the day was logged.
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='change_log_daily_stats',
+                              db_index=False)
+    day = models.DateField()
+    inventory_item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='daily_stats')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='+')
+    change_type = models.CharField(max_length=20, choices=InventoryChangeLog.STOCK_CHANGE_TYPES)
+    net_units = models.BigIntegerField(default=0)
+    change_count = models.IntegerField(default=0)
+    
+    objects = ChangeLogDailyStatQuerySet.as_manager()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'day', 'inventory_item', 'change_type'],
+                                    name='daily_stat_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', 'category', 'day'], name='daily_stat_category_idx'),
+        ]
@@ -0,0 +1,215 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque cursor pagination over a composite ``(ordering..., pk)`` key.
+
+    Unlike DRF's ``CursorPagination`` the cursor stores the full key of the
+    boundary row, so each page is fetched with a single indexed range
+    predicate: no ``COUNT(*)``, no ``OFFSET`` and no degradation on deep
+    pages. The queryset's own ordering, as left by ``OrderingFilter`` or a
+    ranking search filter, is used as long as it only names non-nullable
+    fields or numeric annotations; the primary key is always appended as
+    the tie-breaker.
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([obj async for obj in self.get_page_queryset(queryset, request, view)])
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        Page through several querysets over models with the same fields,
+        such as live and archived rows, as if they were one.
+        """
+        rows = []
+        for queryset in querysets:
+            rows.extend(self.get_page_queryset(queryset, request, view))
+        return self.set_page(self.merge(rows))
+
+    async def apaginate_querysets(self, querysets, request, view=None):
+        rows = []
+        for queryset in querysets:
+            rows.extend([obj async for obj in self.get_page_queryset(queryset, request, view)])
+        return self.set_page(self.merge(rows))
+
+    def merge(self, rows):
+        # Each queryset's rows are already in page order; sorting by the
+        # last key first leaves them ordered by the full key.
+        ordering = [self._invert(field) for field in self.ordering] if self.reverse else self.ordering
+        for field in reversed(ordering):
+            attname = self._attname(field)
+            rows.sort(key=lambda row: getattr(row, attname), reverse=field.startswith('-'))
+        return rows[:self.page_size + 1]
+
+    def get_page_queryset(self, queryset, request, view):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        self.reverse = bool(self.cursor and self.cursor['r'])
+        ordering = [self._invert(field) for field in self.ordering] if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor:
+            queryset = queryset.filter(self._after(ordering, self.cursor['p']))
+        # One extra row tells whether there is a further page
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, request, queryset, view):
+        # By the time the queryset reaches the paginator every filter backend
+        # (OrderingFilter included) has applied its ordering, so keyset on that.
+        ordering = [field for field in (queryset.query.order_by or self.ordering)
+                    if not isinstance(field, str) or field.lstrip('-') not in ('id', 'pk')]
+        for field in ordering:
+            if not isinstance(field, str) or not self._is_keyset_field(queryset, field.lstrip('-')):
+                raise NotFound(f'Ordering by {field!r} is not supported.')
+        # The primary key follows the direction of the last ordering field
+        descending = bool(ordering) and ordering[-1].startswith('-')
+        return ordering + ['-id' if descending else 'id']
+
+    def _is_keyset_field(self, queryset, name):
+        if name in queryset.query.annotations:
+            return True
+        try:
+            return not self.model._meta.get_field(name).null
+        except FieldDoesNotExist:
+            return False
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, obj, reverse):
+        position = [self._dump(getattr(obj, self._attname(field))) for field in self.ordering]
+        payload = json.dumps({'o': self.ordering, 'p': position, 'r': int(reverse)},
+                             separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if cursor['o'] != self.ordering or len(cursor['p']) != len(self.ordering):
+                raise ValueError
+            cursor['p'] = [self._load(field, value) for field, value in zip(self.ordering, cursor['p'])]
+        except (binascii.Error, ValueError, KeyError, TypeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def _after(self, ordering, position):
+        # (a, b, c) > (x, y, z) expanded into
+        # a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _attname(self, field):
+        try:
+            return self.model._meta.get_field(field.lstrip('-')).attname
+        except FieldDoesNotExist:
+            # An annotation, such as a search rank
+            return field.lstrip('-')
+
+    def _load(self, field, value):
+        try:
+            return self.model._meta.get_field(self._attname(field)).to_python(value)
+        except FieldDoesNotExist:
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise ValueError(value)
+            return value
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def _dump(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+
+class InventoryItemPagination(KeysetPagination):
+    ordering = ('id',)
+
+
+class ChangeLogPagination(KeysetPagination):
+    ordering = ('-timestamp',)
@@ -0,0 +1,177 @@
+"""
+Read-replica routing.
+
+ReplicaRoutingMiddleware marks each request as it comes in. For a
+safe-method request (GET, HEAD, OPTIONS) ``ReplicaRouter`` sends reads to
+one of the INVENTORY_DB_REPLICAS aliases. Writes always go to the primary
+``default`` database, and once a request has written, its later reads stay
+on the primary too so it sees its own changes. Unsafe-method requests and
+code running outside a request (management commands, the write-behind
+flusher) only use the primary.
+
+Replicas are picked by INVENTORY_DB_REPLICA_STRATEGY: ``round_robin``, or
+``lowest_lag`` for the replica furthest along. Unreachable replicas are
+skipped, and with INVENTORY_DB_REPLICA_MAX_LAG set so are replicas further
+behind than that many seconds; when none is left reads fall back to the
+primary. Lag is measured at most every
+INVENTORY_DB_REPLICA_LAG_INTERVAL seconds per replica.
+"""
+import itertools
+import math
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+POSTGRESQL_LAG_QUERY = (
+    'SELECT COALESCE(CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END, 0)'
+)
+
+
+class RoutingState:
+    """
+    Per-request routing: whether reads may use a replica, whether it has
+    written, and the database of the tenant it is for (see sharding.py).
+    """
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.pinned = False
+        self.tenant_database = None
+        self.tenant_moving = False
+
+
+routing_state = ContextVar('routing_state', default=None)
+
+
+@contextmanager
+def route_request(request):
+    """Route the database queries made while handling ``request``."""
+    token = routing_state.set(RoutingState(use_replica=request.method in SAFE_METHODS))
+    try:
+        yield
+    finally:
+        routing_state.reset(token)
+
+
+@contextmanager
+def read_from_primary():
+    """Send the current request's reads in the block to the primary."""
+    state = routing_state.get()
+    if state is None or not state.use_replica:
+        yield
+        return
+    state.use_replica = False
+    try:
+        yield
+    finally:
+        state.use_replica = True
+
+
+def sqlite_file_lag(alias):
+    """
+    How far a file copy of the primary is behind: nothing if the primary
+    hasn't changed since the copy was made, else the age of the copy.
+    """
+    def modified(name):
+        # Committed WAL transactions only reach the main file at checkpoints
+        return max((os.stat(path).st_mtime for path in (name, f'{name}-wal') if os.path.exists(path)), default=0)
+
+    primary = connections[DEFAULT_DB_ALIAS]
+    replica = connections[alias]
+    if primary.vendor != 'sqlite' or primary.is_in_memory_db() or replica.is_in_memory_db():
+        return 0.0
+    copied = modified(replica.settings_dict['NAME'])
+    if modified(primary.settings_dict['NAME']) <= copied:
+        return 0.0
+    return time.time() - copied
+
+
+def postgresql_lag(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(POSTGRESQL_LAG_QUERY)
+        return float(cursor.fetchone()[0])
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self._next_replica = itertools.count()
+        self._lags = {}
+
+    @property
+    def replicas(self):
+        return getattr(settings, 'INVENTORY_DB_REPLICAS', [])
+
+    @property
+    def strategy(self):
+        return getattr(settings, 'INVENTORY_DB_REPLICA_STRATEGY', 'round_robin')
+
+    @property
+    def max_lag(self):
+        return getattr(settings, 'INVENTORY_DB_REPLICA_MAX_LAG', None)
+
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        if state is None or not self.replicas:
+            return None
+        if not state.use_replica or state.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads that a write may depend on see the primary's data
+            return DEFAULT_DB_ALIAS
+        return self.choose_replica()
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.pinned = True
+        # Also for instances that were read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *self.replicas}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in self.replicas:
+            return False
+        return None
+
+    def choose_replica(self):
+        replicas = self.replicas
+        if self.strategy == 'lowest_lag' or self.max_lag is not None:
+            lags = {alias: self.lag(alias) for alias in replicas}
+            # Unreachable replicas have an infinite lag
+            replicas = [alias for alias in replicas
+                        if lags[alias] < math.inf and (self.max_lag is None or lags[alias] <= self.max_lag)]
+            if not replicas:
+                return DEFAULT_DB_ALIAS
+            if self.strategy == 'lowest_lag':
+                return min(replicas, key=lags.__getitem__)
+        return replicas[next(self._next_replica) % len(replicas)]
+
+    def lag(self, alias):
+        """Seconds ``alias`` is behind the primary, remeasured every LAG_INTERVAL seconds."""
+        now = time.monotonic()
+        measured_at, lag = self._lags.get(alias, (None, None))
+        if measured_at is None or now - measured_at >= getattr(settings, 'INVENTORY_DB_REPLICA_LAG_INTERVAL', 5):
+            lag = self.measure_lag(alias)
+            self._lags[alias] = (now, lag)
+        return lag
+
+    def measure_lag(self, alias):
+        try:
+            if connections[alias].vendor == 'postgresql':
+                return postgresql_lag(alias)
+            if connections[alias].vendor == 'sqlite':
+                return sqlite_file_lag(alias)
+        except (DatabaseError, OSError):
+            return math.inf
+        return 0.0
@@ -0,0 +1,173 @@
+"""
+Serializer-free conversion of ``values_list()`` rows.
+
+A ``RowConverter`` turns rows into the same primitives a serializer would
+output, without building a field tree or model instance per row. Plain
+columns (ints, strings, pks) are copied as they are; datetimes and decimals
+go through converters compiled from the serializer's fields once per batch
+of rows, with the current timezone and the REST framework settings already
+resolved. Other fields fall back to their own ``to_representation``.
+"""
+import decimal
+from functools import lru_cache
+
+from rest_framework import ISO_8601, fields, relations
+from rest_framework.settings import api_settings
+
+from .serializers import InventoryChangeLogSerializer, InventoryItemSerializer
+
+# (output field, queryset lookup) pairs, in the same order and with the same
+# names as InventoryItemSerializer / InventoryChangeLogSerializer
+INVENTORY_COLUMNS = [
+    ('id', 'id'),
+    ('user', 'user_id'),
+    ('name', 'name'),
+    ('description', 'description'),
+    ('quantity', 'quantity'),
+    ('reorder_point', 'reorder_point'),
+    ('price', 'price'),
+    ('category', 'category_id'),
+    ('category_name', 'category__name'),
+    ('date_added', 'date_added'),
+    ('last_updated', 'last_updated'),
+]
+
+CHANGE_LOG_COLUMNS = [
+    ('id', 'id'),
+    ('inventory_item', 'inventory_item_id'),
+    ('item_name', 'inventory_item__name'),
+    ('user', 'user_id'),
+    ('username', 'user__username'),
+    ('previous_quantity', 'previous_quantity'),
+    ('new_quantity', 'new_quantity'),
+    ('change_type', 'change_type'),
+    ('timestamp', 'timestamp'),
+]
+
+# Read-only fields sourced through a nullable relation; the serializers omit
+# them entirely when the relation is null.
+SKIPPED_WHEN_NULL = {'category_name'}
+
+# Fields whose representation of a database value is the value itself
+UNCONVERTED_FIELDS = (
+    fields.CharField, fields.IntegerField, fields.BooleanField, fields.ChoiceField,
+    fields.ReadOnlyField, relations.PrimaryKeyRelatedField,
+)
+
+
+def compile_datetime(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None:
+        return None
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+
+    def convert(value):
+        # Aware values, as the database returns them with USE_TZ on
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def compile_decimal(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if field.decimal_places is None or not coerce_to_string or field.localize or field.normalize_output:
+        return field.to_representation
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    rounding = field.rounding
+
+    def convert(value):
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return convert
+
+
+def compile_field(field):
+    """A representation function for database values of ``field``, or None if they need none."""
+    if isinstance(field, UNCONVERTED_FIELDS):
+        return None
+    if isinstance(field, fields.DateTimeField):
+        return compile_datetime(field)
+    if isinstance(field, fields.DecimalField):
+        return compile_decimal(field)
+    return field.to_representation
+
+
+class RowConverter:
+    def __init__(self, serializer_class, columns):
+        self.serializer_class = serializer_class
+        self.columns = columns
+        serializer_fields = serializer_class().fields
+        self.names = [name for name, _ in columns]
+        self.lookups = [lookup for _, lookup in columns]
+        self.fields = [(name, serializer_fields[name]) for name in self.names]
+        self.skipped_when_null = [name for name in self.names if name in SKIPPED_WHEN_NULL]
+
+    def subset(self, names):
+        """A converter for the given output fields only."""
+        return get_row_converter(self.serializer_class,
+                                 tuple(column for column in self.columns if column[0] in names))
+
+    def values_list(self, queryset, extra=()):
+        """
+        Rows with the converter's columns first, followed by the ``extra``
+        fields and any annotation (such as a search rank) the queryset might
+        be ordered or paginated by.
+        """
+        lookups = list(self.lookups)
+        for name in [*extra, *queryset.query.annotations]:
+            if name not in lookups:
+                lookups.append(name)
+        return queryset.values_list(*lookups, named=True)
+
+    def compile(self):
+        # Per batch: the timezone and settings may differ between requests
+        converters = []
+        for name, field in self.fields:
+            convert = compile_field(field)
+            if convert is not None:
+                converters.append((name, convert))
+        names = self.names
+
+        def convert_row(row):
+            # zip() stops at the converter's own columns
+            data = dict(zip(names, row))
+            for name, convert in converters:
+                value = data[name]
+                if value is not None:
+                    data[name] = convert(value)
+            return data
+        return convert_row
+
+    def to_dicts(self, rows):
+        """Rows as the serializer's representations."""
+        convert_row = self.compile()
+        skipped = self.skipped_when_null
+        for row in rows:
+            data = convert_row(row)
+            for name in skipped:
+                if data[name] is None:
+                    del data[name]
+            yield data
+
+    def to_values(self, rows):
+        """Rows as lists of representations, one per column."""
+        convert_row = self.compile()
+        for row in rows:
+            yield list(convert_row(row).values())
+
+
+@lru_cache(maxsize=None)
+def get_row_converter(serializer_class, columns):
+    return RowConverter(serializer_class, columns)
+
+
+def inventory_converter():
+    return get_row_converter(InventoryItemSerializer, tuple(INVENTORY_COLUMNS))
+
+
+def change_log_converter():
+    return get_row_converter(InventoryChangeLogSerializer, tuple(CHANGE_LOG_COLUMNS))
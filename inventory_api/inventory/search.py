@@ -0,0 +1,132 @@
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+
+from .models import InventoryItem
+
+ITEM_TABLE = InventoryItem._meta.db_table
+
+
+class SearchBackend:
+    """
+    Full-text search over inventory item names and descriptions.
+
+    ``search`` narrows a queryset to the items matching every term and, if
+    the backend can rank matches, annotates them with ``search_rank``
+    (higher is more relevant).
+    """
+    ranked = False
+
+    def search(self, queryset, terms):
+        raise NotImplementedError
+
+
+class LikeSearchBackend(SearchBackend):
+    """Fallback for databases without a full-text index: a LIKE scan."""
+    fields = ('name', 'description')
+
+    def search(self, queryset, terms):
+        for term in terms:
+            condition = Q()
+            for field in self.fields:
+                condition |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(condition)
+        return queryset
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    SQLite FTS5 backend.
+
+    ``inventory_item_fts`` is an external-content FTS5 table over the item
+    table, kept in sync by triggers (see migration 0003). Every term is
+    matched as a prefix, which the table's prefix indexes serve directly.
+    """
+    ranked = True
+    fts_table = 'inventory_item_fts'
+
+    def match_expression(self, terms):
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, queryset, terms):
+        match = self.match_expression(terms)
+        matching_ids = RawSQL(
+            f'SELECT rowid FROM {self.fts_table} WHERE {self.fts_table} MATCH %s', (match,))
+        # bm25() is lower for better matches, so negate it
+        rank = RawSQL(
+            f'SELECT -bm25({self.fts_table}) FROM {self.fts_table} '
+            f'WHERE {self.fts_table} MATCH %s AND rowid = "{ITEM_TABLE}"."id"',
+            (match,), output_field=FloatField())
+        return queryset.filter(id__in=matching_ids).annotate(search_rank=rank)
+
+
+class PostgreSQLSearchBackend(SearchBackend):
+    """
+    PostgreSQL tsvector backend.
+
+    The document expression below is indexed with a GIN expression index
+    (see migration 0003); queries must use the exact same expression for the
+    planner to pick the index up.
+    """
+    ranked = True
+    config = 'english'
+    document = (
+        f"to_tsvector('english', coalesce(\"{ITEM_TABLE}\".\"name\", '') || ' ' || "
+        f"coalesce(\"{ITEM_TABLE}\".\"description\", ''))"
+    )
+
+    def query_expression(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def search(self, queryset, terms):
+        query = self.query_expression(terms)
+        tsquery = f"to_tsquery('{self.config}', %s)"
+        matches = RawSQL(f'{self.document} @@ {tsquery}', (query,), output_field=BooleanField())
+        rank = RawSQL(f'ts_rank({self.document}, {tsquery})', (query,), output_field=FloatField())
+        return queryset.alias(search_match=matches).filter(search_match=True).annotate(search_rank=rank)
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgreSQLSearchBackend,
+}
+
+
+def get_search_backend(using='default'):
+    backend_path = getattr(settings, 'INVENTORY_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    return BACKENDS.get(connections[using].vendor, LikeSearchBackend)()
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    Drop-in replacement for ``SearchFilter`` backed by a full-text index.
+
+    Terms are split on non-word characters and all of them must match,
+    each as a prefix. Unless the client asks for an explicit ``ordering``,
+    results come back most relevant first.
+    """
+    search_param = SearchFilter.search_param
+    term_pattern = re.compile(r'\w+')
+
+    def get_search_terms(self, request):
+        return self.term_pattern.findall(request.query_params.get(self.search_param, ''))
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        backend = get_search_backend(queryset.db)
+        queryset = backend.search(queryset, terms)
+        if backend.ranked:
+            queryset = queryset.order_by('-search_rank', '-id')
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return SearchFilter().get_schema_operation_parameters(view)
@@ -1,8 +1,13 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Category, InventoryItem, InventoryChangeLog
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import router, transaction
+from django.utils import timezone
+from datetime import timedelta
+from .models import Category, InventoryItem, InventoryChangeLog, InventorySummary
+from .instrumentation import TimedSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     
     class Meta:
@@ -13,26 +18,120 @@ class UserSerializer(serializers.ModelSerializer):
         user = User.objects.create_user(**validated_data)
         return user
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'description']
 
-class InventoryItemSerializer(serializers.ModelSerializer):
+class CategoryField(serializers.PrimaryKeyRelatedField):
+    """
+    Category lookup that reuses the categories prefetched by a bulk
+    payload instead of querying once per item.
+    """
+    
+    def to_internal_value(self, data):
+        categories = getattr(self.root, 'categories', None)
+        if categories is not None and not isinstance(data, bool):
+            try:
+                return categories[Category._meta.pk.to_python(data)]
+            except (KeyError, DjangoValidationError):
+                pass
+        return super().to_internal_value(data)
+
+class InventoryItemListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """
+    Bulk create and update of inventory items.
+    
+    For updates ``instance`` is a queryset of the items the caller may
+    modify; every entry in the payload must carry the ``id`` of one of them.
+    Validation locks those rows until the write, so validate and save in
+    one transaction: concurrent adjustments then can't be overwritten or
+    logged against the wrong previous quantity.
+    """
+    
+    def to_internal_value(self, data):
+        if isinstance(data, list) and (self.max_length is None or len(data) <= self.max_length):
+            if self.instance is not None:
+                ids = [self._entry_pk(entry, 'id', InventoryItem) for entry in data]
+                # Only the items; the category join is nullable
+                self.instance = self.instance.select_for_update(of=('self',)).in_bulk(
+                    [pk for pk in ids if pk is not None])
+            category_ids = [self._entry_pk(entry, 'category', Category) for entry in data]
+            self.categories = Category.objects.in_bulk([pk for pk in category_ids if pk is not None])
+        return super().to_internal_value(data)
+    
+    def _entry_pk(self, entry, key, model):
+        if not isinstance(entry, dict) or entry.get(key) is None:
+            return None
+        try:
+            return model._meta.pk.to_python(entry[key])
+        except DjangoValidationError:
+            return None
+    
+    def run_child_validation(self, data):
+        if self.instance is None:
+            return super().run_child_validation(data)
+        
+        item = self.instance.get(self._entry_pk(data, 'id', InventoryItem))
+        if item is None:
+            raise serializers.ValidationError({'id': ['Item not found.']})
+        self.child.instance = item
+        self.child.initial_data = data
+        validated = super().run_child_validation(data)
+        validated['id'] = item.pk
+        return validated
+    
+    def create(self, validated_data):
+        items = [InventoryItem(**attrs) for attrs in validated_data]
+        with transaction.atomic(using=router.db_for_write(InventoryItem)):
+            return InventoryItem.objects.bulk_create(items)
+    
+    def update(self, instance, validated_data):
+        user = self.context['request'].user
+        now = timezone.now()
+        fields = {'last_updated'}
+        items = []
+        change_logs = []
+        for attrs in validated_data:
+            item = instance[attrs.pop('id')]
+            old_quantity = item.quantity
+            for attr, value in attrs.items():
+                setattr(item, attr, value)
+                fields.add(attr)
+            item.last_updated = now
+            
+            if item.quantity != old_quantity:
+                change_logs.append(InventoryChangeLog(
+                    inventory_item=item,
+                    user=user,
+                    previous_quantity=old_quantity,
+                    new_quantity=item.quantity,
+                    change_type=InventoryChangeLog.change_type_for(item.quantity - old_quantity)
+                ))
+            items.append(item)
+        
+        with transaction.atomic(using=router.db_for_write(InventoryItem, instance=items[0] if items else None)):
+            InventoryItem.objects.bulk_update(items, fields)
+            InventoryChangeLog.objects.bulk_create(change_logs)
+        return items
+
+class InventoryItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    category = CategoryField(queryset=Category.objects.all(), allow_null=True, required=False)
     category_name = serializers.ReadOnlyField(source='category.name')
     
     class Meta:
         model = InventoryItem
-        fields = ['id', 'user', 'name', 'description', 'quantity', 'price', 
+        fields = ['id', 'user', 'name', 'description', 'quantity', 'reorder_point', 'price', 
                   'category', 'category_name', 'date_added', 'last_updated']
         read_only_fields = ['date_added', 'last_updated', 'user']
+        list_serializer_class = InventoryItemListSerializer
     
     def create(self, validated_data):
         # Assign current user
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
-class InventoryChangeLogSerializer(serializers.ModelSerializer):
+class InventoryChangeLogSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='user.username')
     item_name = serializers.ReadOnlyField(source='inventory_item.name')
     
@@ -40,4 +139,70 @@ class InventoryChangeLogSerializer(serializers.ModelSerializer):
         model = InventoryChangeLog
         fields = ['id', 'inventory_item', 'item_name', 'user', 'username', 
                   'previous_quantity', 'new_quantity', 'change_type', 'timestamp']
-        read_only_fields = ['user', 'timestamp']
\ No newline at end of file
+        read_only_fields = ['user', 'timestamp']
+
+class StockAdjustmentSerializer(TimedSerializerMixin, serializers.Serializer):
+    delta = serializers.IntegerField()
+    change_type = serializers.ChoiceField(choices=InventoryChangeLog.STOCK_CHANGE_TYPES, required=False)
+    allow_negative = serializers.BooleanField(default=False)
+    
+    def validate_delta(self, value):
+        if value == 0:
+            raise serializers.ValidationError('Delta must be non-zero.')
+        return value
+
+class BulkStockAdjustmentSerializer(StockAdjustmentSerializer):
+    id = serializers.IntegerField()
+    allow_negative = None
+
+class BulkStockAdjustmentRequestSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    A bulk adjustment: the adjustments, and as for a single adjustment
+    whether they may take stock below zero. A bare list of adjustments is
+    accepted too, without ``allow_negative``.
+    """
+    adjustments = BulkStockAdjustmentSerializer(many=True)
+    allow_negative = serializers.BooleanField(default=False)
+    
+    def __init__(self, *args, max_length=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['adjustments'].max_length = max_length
+
+class InventorySummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    category_name = serializers.ReadOnlyField(source='category.name')
+    
+    class Meta:
+        model = InventorySummary
+        fields = ['category', 'category_name', 'sku_count', 'total_units', 'total_value']
+
+class InventoryTotalsSerializer(TimedSerializerMixin, serializers.Serializer):
+    sku_count = serializers.IntegerField()
+    total_units = serializers.IntegerField()
+    total_value = serializers.DecimalField(max_digits=16, decimal_places=2)
+    categories = InventorySummarySerializer(many=True)
+
+class ChangeStatsQuerySerializer(TimedSerializerMixin, serializers.Serializer):
+    bucket = serializers.ChoiceField(choices=['day', 'week', 'month'], default='day')
+    inventory_item = serializers.IntegerField(required=False)
+    category = serializers.IntegerField(required=False)
+    change_type = serializers.ChoiceField(choices=InventoryChangeLog.STOCK_CHANGE_TYPES, required=False)
+    
+    def get_fields(self):
+        # ``from`` is a keyword, so these cannot be declared as attributes
+        fields = super().get_fields()
+        fields['from'] = serializers.DateField(required=False)
+        fields['to'] = serializers.DateField(required=False)
+        return fields
+    
+    def validate(self, attrs):
+        attrs.setdefault('to', timezone.localdate())
+        attrs.setdefault('from', attrs['to'] - timedelta(days=30))
+        if attrs['from'] > attrs['to']:
+            raise serializers.ValidationError({'from': ['Must not be after "to".']})
+        return attrs
+
+class ChangeStatsSerializer(TimedSerializerMixin, serializers.Serializer):
+    period = serializers.DateField()
+    change_type = serializers.CharField()
+    net_units = serializers.IntegerField()
+    changes = serializers.IntegerField()
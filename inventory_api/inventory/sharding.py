@@ -0,0 +1,347 @@
+"""
+Per-tenant sharding of inventory data.
+
+With INVENTORY_SHARDS set, each user's items, change logs, archived logs,
+daily stats and summaries live on one of the shard databases, picked when
+the user is created by rendezvous hashing of the user id over the shards and
+recorded in TenantPlacement. Users without a placement, such as those from
+before sharding was turned on, stay on the global ``default`` database
+until ``manage.py rebalance_shards`` moves them.
+
+Users and categories live on the global database. Every shard keeps a copy
+of both tables, written after each change on the global database commits,
+so joins and foreign keys from tenant rows keep working within a shard.
+
+``ShardRouter`` sends tenant queries to the tenant's shard: by the row
+they're about when Django passes one, and otherwise by the tenant of the
+current request, as set by ``set_tenant()`` once the user is authenticated.
+Each shard allocates ids from its own range (see ``reserve_id_range()``),
+so rows keep their ids when a tenant is moved.
+
+Moving a tenant marks its placement as moving and waits
+INVENTORY_SHARD_MOVE_GRACE seconds, for every process's cached placement
+(INVENTORY_SHARD_PLACEMENT_TTL) and every request in flight to notice. Writes
+are refused with a 503 from then on. The rows are then copied in one
+transaction, the placement is switched, and after another grace period
+the old copy is deleted.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from rest_framework.exceptions import APIException
+
+from .metrics import record_cache
+from .models import (ArchivedChangeLog, Category, ChangeLogDailyStat, InventoryChangeLog, InventoryItem,
+                     InventorySummary, TenantPlacement)
+from .routers import RoutingState, routing_state
+
+# Tenant models and the field holding their tenant, parents before children
+TENANT_MODELS = [
+    (InventoryItem, 'user_id'),
+    (InventoryChangeLog, 'owner_id'),
+    (ArchivedChangeLog, 'owner_id'),
+    (ChangeLogDailyStat, 'owner_id'),
+    (InventorySummary, 'user_id'),
+]
+TENANT_FIELDS = dict(TENANT_MODELS)
+
+# Copied to every shard
+REFERENCE_MODELS = [User, Category]
+
+# Shard n allocates ids from n << ID_RANGE_BITS on
+ID_RANGE_BITS = 40
+
+Placement = namedtuple('Placement', ['database', 'moving'])
+
+UNPLACED = Placement(DEFAULT_DB_ALIAS, False)
+
+
+class TenantMoving(APIException):
+    status_code = 503
+    default_detail = 'This account is being moved to another database. Try again shortly.'
+    default_code = 'tenant_moving'
+
+    def __init__(self):
+        super().__init__()
+        # Sent as Retry-After
+        self.wait = getattr(settings, 'INVENTORY_SHARD_MOVE_GRACE', 15)
+
+
+def get_shards():
+    return getattr(settings, 'INVENTORY_SHARDS', [])
+
+
+def tenant_databases():
+    """Every database that can hold tenant rows."""
+    return [DEFAULT_DB_ALIAS, *get_shards()]
+
+
+def hash_shard(user_id, shards=None):
+    """
+    The shard a user belongs on. Rendezvous hashing: adding a shard only
+    moves the users that now hash onto it.
+    """
+    def score(alias):
+        return hashlib.blake2b(f'{alias}:{user_id}'.encode(), digest_size=8).digest()
+
+    return max(shards or get_shards(), key=score)
+
+
+class PlacementCache:
+    """Per-process LRU cache of tenant placements with a TTL."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'INVENTORY_SHARD_PLACEMENT_TTL', 5)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, placement):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, placement)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > getattr(settings, 'INVENTORY_SHARD_PLACEMENT_CACHE_SIZE', 10000):
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+placement_cache = PlacementCache()
+
+
+def get_placements(user_ids, cached=True):
+    """Placement of each user, by id."""
+    if not get_shards():
+        return dict.fromkeys(user_ids, UNPLACED)
+    placements = {}
+    if cached:
+        for user_id in user_ids:
+            placement = placement_cache.get(user_id)
+            record_cache('placements', placement is not None)
+            if placement is not None:
+                placements[user_id] = placement
+    missing = set(user_ids) - placements.keys()
+    if missing:
+        # Always from the primary, never from a lagging replica
+        rows = (TenantPlacement.objects.using(DEFAULT_DB_ALIAS).filter(user_id__in=missing)
+                .values_list('user_id', 'shard', 'moving'))
+        found = {user_id: Placement(shard, moving) for user_id, shard, moving in rows}
+        for user_id in missing:
+            placements[user_id] = found.get(user_id, UNPLACED)
+            placement_cache.set(user_id, placements[user_id])
+    return placements
+
+
+def get_placement(user_id, cached=True):
+    return get_placements([user_id], cached)[user_id]
+
+
+def set_placement(user_id, database, moving=False):
+    TenantPlacement.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user_id=user_id, defaults={'shard': database, 'moving': moving})
+    placement_cache.evict(user_id)
+
+
+def set_tenant(user):
+    """Route the current request's tenant queries to ``user``'s database."""
+    state = routing_state.get()
+    if state is None or not get_shards() or not user.is_authenticated:
+        return
+    state.tenant_database, state.tenant_moving = get_placement(user.pk)
+
+
+@contextmanager
+def use_tenant(user_id):
+    """Route tenant queries to ``user_id``'s database outside of requests."""
+    state = RoutingState(use_replica=False)
+    state.tenant_database, state.tenant_moving = get_placement(user_id, cached=False)
+    token = routing_state.set(state)
+    try:
+        yield state.tenant_database
+    finally:
+        routing_state.reset(token)
+
+
+class ShardRouter:
+    def db_for_read(self, model, **hints):
+        return self.route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if model in TENANT_FIELDS and state is not None and state.tenant_moving:
+            raise TenantMoving()
+        return self.route(model, hints)
+
+    def route(self, model, hints):
+        shards = get_shards()
+        if not shards:
+            return None
+        instance = hints.get('instance')
+        field = TENANT_FIELDS.get(model)
+        if field is None:
+            if instance is not None and instance._state.db in shards:
+                # Only the global database's copy of a user or category is current
+                return DEFAULT_DB_ALIAS
+            return None
+        if instance is not None:
+            if instance._state.db is not None and type(instance) in TENANT_FIELDS:
+                return instance._state.db
+            if isinstance(instance, User):
+                return get_placement(instance.pk).database
+            tenant = getattr(instance, TENANT_FIELDS.get(type(instance), ''), None)
+            if tenant is not None:
+                return get_placement(tenant).database
+        state = routing_state.get()
+        if state is not None and state.tenant_database:
+            return state.tenant_database
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_shards(), *getattr(settings, 'INVENTORY_DB_REPLICAS', [])}
+        if get_shards() and obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def reference_copy(obj):
+    model = type(obj)
+    return model(**{field.attname: getattr(obj, field.attname) for field in model._meta.concrete_fields})
+
+
+def copy_reference_rows(model, objs, databases=None):
+    """Insert or update copies of global rows on the shards."""
+    objs = list(objs)
+    if not objs:
+        return
+    fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+    for alias in databases or get_shards():
+        model._base_manager.using(alias).bulk_create(
+            [reference_copy(obj) for obj in objs],
+            update_conflicts=True, unique_fields=['pk'], update_fields=fields)
+
+
+def delete_reference_rows(model, pks, databases=None):
+    """Delete copies of global rows from the shards, along with the rows depending on them."""
+    for alias in databases or get_shards():
+        model._base_manager.using(alias).filter(pk__in=pks).delete()
+
+
+def sync_reference_tables(databases=None, batch_size=1000):
+    """Bring the shards' copies of users and categories up to date."""
+    for model in REFERENCE_MODELS:
+        rows = model._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk')
+        batch = []
+        for obj in rows.iterator(chunk_size=batch_size):
+            batch.append(obj)
+            if len(batch) == batch_size:
+                copy_reference_rows(model, batch, databases)
+                batch = []
+        copy_reference_rows(model, batch, databases)
+        current = set(rows.values_list('pk', flat=True))
+        for alias in databases or get_shards():
+            stale = set(model._base_manager.using(alias).values_list('pk', flat=True)) - current
+            delete_reference_rows(model, stale, [alias])
+
+
+def reserve_id_range(alias):
+    """Start the shard's tenant id sequences at its own range."""
+    start = (get_shards().index(alias) + 1) << ID_RANGE_BITS
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model, _ in TENANT_MODELS:
+            if not model._meta.pk.auto_created:
+                # Archived logs keep the ids of the logs they were
+                continue
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) SELECT %s, 0 '
+                               'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)', [table, table])
+                cursor.execute('UPDATE sqlite_sequence SET seq = MAX(seq, %s) WHERE name = %s', [start, table])
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'SELECT setval(pg_get_serial_sequence(%s, %s), GREATEST(%s, '
+                    f'(SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)})))',
+                    [table, model._meta.pk.column, start])
+
+
+def copy_tenant(user_id, source, target, batch_size=1000):
+    """Copy a tenant's rows, ids and timestamps included. Returns the count per model."""
+    counts = {}
+    with transaction.atomic(using=target):
+        # Left behind by an interrupted move
+        delete_tenant(user_id, target)
+        for model, field in TENANT_MODELS:
+            fields = model._meta.concrete_fields
+            rows = model._base_manager.using(source).filter(**{field: user_id}).order_by('pk')
+            counts[model] = 0
+            batch = []
+            for obj in rows.iterator(chunk_size=batch_size):
+                batch.append(obj)
+                if len(batch) == batch_size:
+                    insert_raw(model, batch, fields, target)
+                    counts[model] += len(batch)
+                    batch = []
+            if batch:
+                insert_raw(model, batch, fields, target)
+                counts[model] += len(batch)
+    return counts
+
+
+def insert_raw(model, objs, fields, using):
+    # raw skips pre_save(), which would replace auto_now timestamps
+    queryset = model._base_manager.using(using)
+    batch_size = connections[using].ops.bulk_batch_size(fields, objs) or len(objs)
+    for start in range(0, len(objs), batch_size):
+        queryset._insert(objs[start:start + batch_size], fields=fields, raw=True, using=using)
+
+
+def delete_tenant(user_id, alias):
+    for model, field in reversed(TENANT_MODELS):
+        model._base_manager.using(alias).filter(**{field: user_id})._raw_delete(alias)
+
+
+def move_tenant(user_id, target, grace=None):
+    """
+    Move a tenant's rows to ``target``, one transaction for the copy.
+    Returns the source database and the number of rows moved per model.
+    """
+    if grace is None:
+        grace = getattr(settings, 'INVENTORY_SHARD_MOVE_GRACE', 15)
+    source = get_placement(user_id, cached=False).database
+    if source == target:
+        set_placement(user_id, target)
+        return source, {}
+    set_placement(user_id, source, moving=True)
+    time.sleep(grace)
+    try:
+        counts = copy_tenant(user_id, source, target)
+    except Exception:
+        set_placement(user_id, source)
+        raise
+    set_placement(user_id, target)
+    # Readers that still have the old placement cached read the old copy
+    time.sleep(grace)
+    delete_tenant(user_id, source)
+    return source, counts
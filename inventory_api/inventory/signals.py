@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+
+from . import sharding
+from .authentication import user_cache
+from .cache import invalidate_categories
+from .instrumentation import record_query
+from .models import Category, InventoryItem, InventorySummary
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # First, so connection.execute_wrapper() blocks entered before the
+    # connection opened still remove their own wrapper on exit
+    if getattr(settings, 'INVENTORY_REQUEST_TIMING', True) and record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@receiver(post_delete, sender=InventoryItem)
+def remove_item_from_summary(sender, instance, using, **kwargs):
+    InventorySummary.objects.using(using).apply_changes([(instance.rollup_state(), None)])
+
+
+@receiver(pre_delete, sender=Category)
+def uncategorize_summary(sender, instance, using, **kwargs):
+    # Deleting a category sets its items' category to NULL with a plain
+    # UPDATE, so move the category's totals over to match.
+    InventorySummary.objects.using(using).move_to_uncategorized(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, using, **kwargs):
+    invalidate_categories(using)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_cached_user(sender, instance, **kwargs):
+    # Covers deactivation and password changes, which are saved like any other change
+    user_cache.evict_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def place_new_user(sender, instance, created, using, raw=False, **kwargs):
+    if created and not raw and using == DEFAULT_DB_ALIAS and sharding.get_shards():
+        sharding.set_placement(instance.pk, sharding.hash_shard(instance.pk))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Category)
+def copy_to_shards(sender, instance, using, raw=False, **kwargs):
+    if raw or using != DEFAULT_DB_ALIAS or not sharding.get_shards():
+        return
+    row = sharding.reference_copy(instance)
+    transaction.on_commit(lambda: sharding.copy_reference_rows(sender, [row]), using=using)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Category)
+def delete_from_shards(sender, instance, using, **kwargs):
+    if using != DEFAULT_DB_ALIAS or not sharding.get_shards():
+        return
+    pk = instance.pk
+    # Takes the user's tenant rows on the shard with it
+    transaction.on_commit(lambda: sharding.delete_reference_rows(sender, [pk]), using=using)
+
+
+@receiver(post_migrate)
+def reserve_shard_id_range(sender, using, **kwargs):
+    if sender.name == 'inventory' and using in sharding.get_shards():
+        sharding.reserve_id_range(using)
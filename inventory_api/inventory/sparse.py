@@ -0,0 +1,58 @@
+"""
+Sparse fieldsets: ``?fields=`` and ``?exclude=`` on read endpoints.
+
+Both take comma-separated serializer field names. The selected fields
+prune the serializer and narrow the queryset to the columns, and the
+joins, those fields are read from.
+"""
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+
+
+def parse_field_names(request, param):
+    names = []
+    for value in request.query_params.getlist(param):
+        names.extend(name.strip() for name in value.split(',') if name.strip())
+    return names
+
+
+def requested_fields(request, available):
+    """
+    The names in ``available`` selected by the request, in that order, or
+    None if it has neither parameter.
+    """
+    if FIELDS_PARAM not in request.query_params and EXCLUDE_PARAM not in request.query_params:
+        return None
+    errors = {}
+    selected = {}
+    for param in (FIELDS_PARAM, EXCLUDE_PARAM):
+        selected[param] = parse_field_names(request, param)
+        unknown = [name for name in selected[param] if name not in available]
+        if unknown:
+            errors[param] = [f'Unknown field "{name}".' for name in unknown]
+    if errors:
+        raise ValidationError(errors)
+    fields, exclude = selected[FIELDS_PARAM], selected[EXCLUDE_PARAM]
+    return [name for name in available if (not fields or name in fields) and name not in exclude]
+
+
+def narrow_queryset(queryset, fields, required=()):
+    """
+    ``queryset`` loading only the model fields the given (bound) serializer
+    fields read, plus ``required``, and joining only the relations they
+    read through.
+    """
+    only, related = set(required), set()
+    for field in fields:
+        if not field.source_attrs:
+            # source='*' needs the whole instance
+            return queryset
+        only.add('__'.join(field.source_attrs))
+        if len(field.source_attrs) > 1:
+            related.add('__'.join(field.source_attrs[:-1]))
+    queryset = queryset.select_related(None)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*only)
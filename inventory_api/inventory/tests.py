@@ -1,10 +1,44 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.db import connection, connections, transaction
+from django.db.models import F, QuerySet
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import User
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
 from decimal import Decimal
-from .models import Category, InventoryItem, InventoryChangeLog
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework_simplejwt.tokens import AccessToken
+from inventory_api.database import database_from_env, replicas_from_env, shards_from_env
+from .async_views import AsyncReadView
+from .management.commands.bench import compare, percentile
+from .checks import check_connection_pool, check_database_profile, log_database_profile, postgresql_profile
+from .instrumentation import phase, profile_request, report
+from .metrics import Registry, exposition, process_start_time, registry
+from .routers import ReplicaRouter, route_request
+from .sharding import ID_RANGE_BITS, get_placement, hash_shard, placement_cache, set_placement
+from .authentication import user_cache
+from .cache import get_cache
+from .serializers import InventoryItemSerializer, InventoryChangeLogSerializer
+from .models import (Category, InventoryItem, InventoryChangeLog, ArchivedChangeLog, InventorySummary,
+                     InventorySummaryQuerySet, ChangeLogDailyStat, ChangeLogSpoolPosition, TenantPlacement)
+from .views import InventoryItemViewSet
+from .write_behind import ChangeLogBuffer
 
 class ModelTests(TestCase):
     
@@ -135,6 +169,76 @@ class CategoryViewSetTests(APITestCase):
         self.assertFalse(Category.objects.filter(name='Books').exists())
 
 
+class CategoryCacheTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.admin_user = User.objects.create_superuser(username='admin', password='adminpassword123')
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.category = Category.objects.create(name='Electronics', description='Electronic items')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+    def names(self, response):
+        return [category['name'] for category in response.data['results']]
+        
+    def test_repeated_reads_hit_the_database_once(self):
+        list_url = reverse('category-list')
+        detail_url = reverse('category-detail', args=[self.category.id])
+        first_list = self.client.get(list_url)
+        first_detail = self.client.get(detail_url)
+        
+        with self.assertNumQueries(0):
+            cached_list = self.client.get(list_url)
+            cached_detail = self.client.get(detail_url)
+        self.assertEqual(cached_list.data, first_list.data)
+        self.assertEqual(cached_detail.data, first_detail.data)
+        self.assertEqual(cached_list['ETag'], first_list['ETag'])
+        
+    def test_query_string_is_part_of_the_key(self):
+        Category.objects.create(name='Clothing')
+        url = reverse('category-list')
+        
+        self.assertEqual(self.names(self.client.get(url)), ['Electronics', 'Clothing'])
+        self.assertEqual(self.names(self.client.get(url, {'search': 'cloth'})), ['Clothing'])
+        
+    def test_if_none_match_returns_not_modified(self):
+        url = reverse('category-list')
+        etag = self.client.get(url)['ETag']
+        
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        
+    def test_api_write_invalidates(self):
+        url = reverse('category-list')
+        etag = self.client.get(url)['ETag']
+        admin_client = APIClient()
+        admin_client.force_authenticate(user=self.admin_user)
+        
+        admin_client.post(url, {'name': 'Books'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.names(response), ['Electronics', 'Books'])
+        
+        admin_client.delete(reverse('category-detail', args=[self.category.id]))
+        self.assertEqual(self.names(self.client.get(url)), ['Books'])
+        self.assertEqual(
+            self.client.get(reverse('category-detail', args=[self.category.id])).status_code,
+            status.HTTP_404_NOT_FOUND)
+        
+    def test_admin_write_invalidates(self):
+        url = reverse('category-detail', args=[self.category.id])
+        self.client.get(url)
+        self.client.force_login(self.admin_user)
+        
+        response = self.client.post(
+            reverse('admin:inventory_category_change', args=[self.category.id]),
+            {'name': 'Gadgets', 'description': 'Electronic items'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(url).data['name'], 'Gadgets')
+
+
 class InventoryItemViewSetTests(APITestCase):
     def setUp(self):
         # Create users
@@ -288,6 +392,497 @@ class InventoryItemViewSetTests(APITestCase):
         self.assertTrue(found_laptop, "Laptop with low stock not found in results")
 
 
+class StockAdjustmentTests(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='password123')
+        self.user2 = User.objects.create_user(username='user2', password='password123')
+        self.item = InventoryItem.objects.create(
+            user=self.user1,
+            name='Laptop',
+            quantity=5,
+            price=Decimal('999.99')
+        )
+        self.other_item = InventoryItem.objects.create(
+            user=self.user2,
+            name='Tablet',
+            quantity=8,
+            price=Decimal('399.99')
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user1)
+        
+    def test_adjust_applies_delta_and_logs_change(self):
+        url = reverse('inventory-adjust', args=[self.item.id])
+        response = self.client.post(url, {'delta': -3})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['quantity'], 2)
+        self.assertEqual(response.data['change_log']['previous_quantity'], 5)
+        self.assertEqual(response.data['change_log']['new_quantity'], 2)
+        self.assertEqual(response.data['change_log']['change_type'], 'sale')
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 2)
+        
+    def test_adjust_uses_explicit_change_type(self):
+        url = reverse('inventory-adjust', args=[self.item.id])
+        response = self.client.post(url, {'delta': 4, 'change_type': 'adjustment'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        log = InventoryChangeLog.objects.get(inventory_item=self.item)
+        self.assertEqual(log.change_type, 'adjustment')
+        self.assertEqual((log.previous_quantity, log.new_quantity), (5, 9))
+        
+    def test_adjust_rejects_negative_stock(self):
+        url = reverse('inventory-adjust', args=[self.item.id])
+        response = self.client.post(url, {'delta': -6})
+        
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 5)
+        self.assertFalse(InventoryChangeLog.objects.exists())
+        
+    def test_adjust_allows_negative_stock_when_requested(self):
+        url = reverse('inventory-adjust', args=[self.item.id])
+        response = self.client.post(url, {'delta': -6, 'allow_negative': True})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['quantity'], -1)
+        
+    def test_adjust_rejects_zero_delta(self):
+        url = reverse('inventory-adjust', args=[self.item.id])
+        response = self.client.post(url, {'delta': 0})
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+    def test_adjust_another_users_item(self):
+        url = reverse('inventory-adjust', args=[self.other_item.id])
+        response = self.client.post(url, {'delta': 1})
+        
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.other_item.refresh_from_db()
+        self.assertEqual(self.other_item.quantity, 8)
+        
+    def test_adjust_is_relative_to_current_stock(self):
+        # A stale copy of the row must not be written back over the adjustment
+        stale = InventoryItem.objects.get(pk=self.item.pk)
+        InventoryItem.objects.adjust_quantity(self.item.pk, -2, self.user1)
+        InventoryItem.objects.adjust_quantity(stale.pk, -1, self.user1)
+        
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 2)
+        self.assertEqual(
+            list(InventoryChangeLog.objects.order_by('id').values_list('previous_quantity', 'new_quantity')),
+            [(5, 3), (3, 2)]
+        )
+
+
+class BulkInventoryTests(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='password123')
+        self.user2 = User.objects.create_user(username='user2', password='password123')
+        self.category = Category.objects.create(name='Electronics')
+        self.item1 = InventoryItem.objects.create(
+            user=self.user1, name='Laptop', quantity=5, price=Decimal('999.99'))
+        self.item2 = InventoryItem.objects.create(
+            user=self.user1, name='Smartphone', quantity=10, price=Decimal('599.99'))
+        self.other_item = InventoryItem.objects.create(
+            user=self.user2, name='Tablet', quantity=8, price=Decimal('399.99'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user1)
+        
+    def test_bulk_create(self):
+        url = reverse('inventory-bulk')
+        data = [
+            {'name': 'Mouse', 'quantity': 20, 'price': '19.99', 'category': self.category.id},
+            {'name': 'Keyboard', 'quantity': 15, 'price': '49.99'},
+        ]
+        response = self.client.post(url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['name'] for item in response.data], ['Mouse', 'Keyboard'])
+        self.assertTrue(all(item['id'] for item in response.data))
+        self.assertEqual(response.data[0]['category_name'], 'Electronics')
+        self.assertEqual(InventoryItem.objects.filter(user=self.user1).count(), 4)
+        
+    def test_bulk_create_query_count_is_independent_of_batch_size(self):
+        url = reverse('inventory-bulk')
+        
+        def post_batch(size):
+            data = [{'name': f'Item {i}', 'quantity': i, 'price': '1.00', 'category': self.category.id}
+                    for i in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            return len(queries)
+        
+        post_batch(1)  # creates the user's summary row
+        self.assertEqual(post_batch(2), post_batch(20))
+        
+    def test_bulk_create_reports_errors_per_item(self):
+        url = reverse('inventory-bulk')
+        data = [
+            {'name': 'Mouse', 'quantity': 20, 'price': '19.99'},
+            {'name': 'Keyboard', 'quantity': 15},
+        ]
+        response = self.client.post(url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('price', response.data[1])
+        self.assertFalse(InventoryItem.objects.filter(name='Mouse').exists())
+        
+    @override_settings(INVENTORY_BULK_MAX_ITEMS=1)
+    def test_bulk_create_rejects_oversized_batch(self):
+        url = reverse('inventory-bulk')
+        data = [
+            {'name': 'Mouse', 'quantity': 20, 'price': '19.99'},
+            {'name': 'Keyboard', 'quantity': 15, 'price': '49.99'},
+        ]
+        response = self.client.post(url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+    def test_bulk_update_logs_quantity_changes(self):
+        url = reverse('inventory-bulk')
+        data = [
+            {'id': self.item1.id, 'quantity': 7},
+            {'id': self.item2.id, 'name': 'Phone'},
+        ]
+        response = self.client.patch(url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.item1.refresh_from_db()
+        self.item2.refresh_from_db()
+        self.assertEqual(self.item1.quantity, 7)
+        self.assertEqual(self.item2.name, 'Phone')
+        self.assertEqual(self.item2.quantity, 10)
+        
+        log = InventoryChangeLog.objects.get()
+        self.assertEqual(log.inventory_item, self.item1)
+        self.assertEqual((log.previous_quantity, log.new_quantity, log.change_type), (5, 7, 'restock'))
+        
+    def test_bulk_update_locks_items_until_saved(self):
+        url = reverse('inventory-bulk')
+        in_bulk = QuerySet.in_bulk
+        lookups = []
+        
+        def locking_in_bulk(queryset, *args, **kwargs):
+            if queryset.model is InventoryItem:
+                lookups.append(queryset.query.select_for_update)
+                # A concurrent adjustment that commits just before the lock
+                InventoryItem.objects.filter(pk=self.item1.pk).update(quantity=F('quantity') + 3)
+            return in_bulk(queryset, *args, **kwargs)
+        
+        with mock.patch.object(QuerySet, 'in_bulk', locking_in_bulk):
+            response = self.client.patch(url, [{'id': self.item1.id, 'quantity': 4}], format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(lookups, [True])
+        log = InventoryChangeLog.objects.get()
+        self.assertEqual((log.previous_quantity, log.new_quantity, log.change_type), (8, 4, 'sale'))
+        
+    def test_bulk_update_rejects_other_users_items(self):
+        url = reverse('inventory-bulk')
+        data = [
+            {'id': self.item1.id, 'quantity': 7},
+            {'id': self.other_item.id, 'quantity': 0},
+        ]
+        response = self.client.patch(url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('id', response.data[1])
+        self.item1.refresh_from_db()
+        self.assertEqual(self.item1.quantity, 5)
+        
+    def test_bulk_adjust(self):
+        url = reverse('inventory-bulk-adjust')
+        data = [
+            {'id': self.item1.id, 'delta': -2},
+            {'id': self.item2.id, 'delta': 5},
+        ]
+        response = self.client.post(url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['quantity'] for item in response.data], [3, 15])
+        self.assertEqual(
+            sorted(InventoryChangeLog.objects.values_list('change_type', flat=True)),
+            ['restock', 'sale']
+        )
+        
+    def test_bulk_adjust_is_all_or_nothing(self):
+        url = reverse('inventory-bulk-adjust')
+        data = [
+            {'id': self.item1.id, 'delta': -2},
+            {'id': self.item2.id, 'delta': -11},
+        ]
+        response = self.client.post(url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('id', response.data[1])
+        self.item1.refresh_from_db()
+        self.assertEqual(self.item1.quantity, 5)
+        self.assertFalse(InventoryChangeLog.objects.exists())
+        
+    def test_bulk_adjust_allows_negative_stock_when_requested(self):
+        url = reverse('inventory-bulk-adjust')
+        adjustments = [{'id': self.item1.id, 'delta': -6}]
+        
+        response = self.client.post(url, {'adjustments': adjustments}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', response.data['adjustments'][0])
+        
+        response = self.client.post(url, {'adjustments': adjustments, 'allow_negative': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['quantity'], -1)
+        
+    def test_bulk_adjust_validates_the_request(self):
+        url = reverse('inventory-bulk-adjust')
+        response = self.client.post(
+            url, {'adjustments': [{'id': self.item1.id, 'delta': 0}], 'allow_negative': 'maybe'}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('delta', response.data['adjustments'][0])
+        self.assertIn('allow_negative', response.data)
+
+
+class InventorySummaryTests(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='password123')
+        self.user2 = User.objects.create_user(username='user2', password='password123')
+        self.electronics = Category.objects.create(name='Electronics')
+        self.books = Category.objects.create(name='Books')
+        self.laptop = InventoryItem.objects.create(
+            user=self.user1, name='Laptop', quantity=5, price=Decimal('999.99'), category=self.electronics)
+        self.novel = InventoryItem.objects.create(
+            user=self.user1, name='Novel', quantity=10, price=Decimal('12.50'), category=self.books)
+        InventoryItem.objects.create(user=self.user2, name='Tablet', quantity=8, price=Decimal('399.99'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user1)
+        
+    def assertSummariesUpToDate(self):
+        self.assertEqual(InventorySummary.objects.mismatches(), {})
+        
+    def test_summary_endpoint(self):
+        response = self.client.get(reverse('inventory-summary'))
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['sku_count'], 2)
+        self.assertEqual(response.data['total_units'], 15)
+        self.assertEqual(response.data['total_value'], '5124.95')
+        self.assertEqual(
+            [(row['category_name'], row['sku_count'], row['total_value']) for row in response.data['categories']],
+            [('Electronics', 1, '4999.95'), ('Books', 1, '125.00')]
+        )
+        
+    def test_summary_query_count_is_independent_of_item_count(self):
+        InventoryItem.objects.bulk_create([
+            InventoryItem(user=self.user1, name=f'Item {i}', quantity=1, price=Decimal('1.00'),
+                          category=self.books)
+            for i in range(50)
+        ])
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('inventory-summary'))
+        self.assertEqual(response.data['sku_count'], 52)
+        
+    def test_api_writes_keep_summaries_up_to_date(self):
+        self.client.post(reverse('inventory-list'), {
+            'name': 'Mouse', 'quantity': 3, 'price': '19.99', 'category': self.electronics.id})
+        self.assertSummariesUpToDate()
+        
+        self.client.patch(reverse('inventory-detail', args=[self.laptop.id]),
+                          {'price': '899.99', 'category': self.books.id})
+        self.assertSummariesUpToDate()
+        
+        self.client.post(reverse('inventory-adjust', args=[self.novel.id]), {'delta': -4})
+        self.assertSummariesUpToDate()
+        
+        self.client.delete(reverse('inventory-detail', args=[self.novel.id]))
+        self.assertSummariesUpToDate()
+        
+    def test_bulk_writes_keep_summaries_up_to_date(self):
+        self.client.post(reverse('inventory-bulk'), [
+            {'name': 'Mouse', 'quantity': 3, 'price': '19.99'},
+            {'name': 'Atlas', 'quantity': 2, 'price': '45.00', 'category': self.books.id},
+        ], format='json')
+        self.assertSummariesUpToDate()
+        
+        self.client.patch(reverse('inventory-bulk'), [
+            {'id': self.laptop.id, 'quantity': 1, 'category': None},
+            {'id': self.novel.id, 'price': '9.99'},
+        ], format='json')
+        self.assertSummariesUpToDate()
+        
+        self.client.post(reverse('inventory-bulk-adjust'), [
+            {'id': self.novel.id, 'delta': 5},
+            {'id': self.novel.id, 'delta': -2},
+            {'id': self.laptop.id, 'delta': 4},
+        ], format='json')
+        self.assertSummariesUpToDate()
+        
+    def test_deletes_keep_summaries_up_to_date(self):
+        self.electronics.delete()
+        self.assertSummariesUpToDate()
+        self.assertTrue(InventorySummary.objects.filter(user=self.user1, category=None, sku_count=1).exists())
+        
+        InventoryItem.objects.filter(user=self.user1).delete()
+        self.assertSummariesUpToDate()
+        
+        self.user2.delete()
+        self.assertSummariesUpToDate()
+        
+    def test_rows_created_concurrently_are_added_to(self):
+        increment = InventorySummaryQuerySet._increment
+        
+        def racing_increment(queryset, user_id, category_id, *totals):
+            updated = increment(queryset, user_id, category_id, *totals)
+            if not updated:
+                # Another writer inserts the missing row before this one can
+                InventorySummary.objects.create(user_id=user_id, category_id=category_id)
+            return updated
+        
+        with mock.patch.object(InventorySummaryQuerySet, '_increment', racing_increment):
+            self.electronics.delete()
+            self.assertSummariesUpToDate()
+            
+            InventoryItem.objects.create(user=self.user2, name='Atlas', quantity=2, price=Decimal('45.00'),
+                                         category=self.books)
+            self.assertSummariesUpToDate()
+        
+    def test_rebuild_command(self):
+        InventorySummary.objects.filter(user=self.user1).update(total_units=0)
+        
+        with self.assertRaises(CommandError):
+            call_command('rebuild_inventory_summary', '--verify', stdout=StringIO())
+        call_command('rebuild_inventory_summary', stdout=StringIO())
+        call_command('rebuild_inventory_summary', '--verify', stdout=StringIO())
+        self.assertSummariesUpToDate()
+
+
+class ConditionalRequestTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.category = Category.objects.create(name='Electronics')
+        self.laptop = InventoryItem.objects.create(
+            user=self.user, name='Laptop', quantity=5, price=Decimal('999.99'), category=self.category)
+        self.phone = InventoryItem.objects.create(
+            user=self.user, name='Phone', quantity=10, price=Decimal('499.99'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.detail_url = reverse('inventory-detail', args=[self.laptop.id])
+        self.list_url = reverse('inventory-list')
+        
+    def test_detail_not_modified(self):
+        response = self.client.get(self.detail_url)
+        self.assertIn('Last-Modified', response)
+        
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(cached.content, b'')
+        self.assertEqual(cached['ETag'], response['ETag'])
+        
+        InventoryItem.objects.adjust_quantity(self.laptop.id, -1, self.user)
+        changed = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertEqual(changed.data['quantity'], 4)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        
+    def test_list_not_modified(self):
+        etag = self.client.get(self.list_url)['ETag']
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotEqual(self.client.get(self.list_url, {'page_size': 1})['ETag'], etag)
+        
+        self.phone.delete()
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        
+    def test_category_rename_changes_etags(self):
+        detail_etag = self.client.get(self.detail_url)['ETag']
+        list_etag = self.client.get(self.list_url)['ETag']
+        
+        self.category.name = 'Gadgets'
+        self.category.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['category_name'], 'Gadgets')
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+    def test_patch_with_stale_if_match_fails(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        self.client.patch(self.detail_url, {'name': 'Laptop Pro'}, HTTP_IF_MATCH=etag)
+        
+        response = self.client.patch(self.detail_url, {'name': 'Old Laptop'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.name, 'Laptop Pro')
+        
+    def test_update_returns_new_etag(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        
+        response = self.client.put(
+            self.detail_url, {'name': 'Laptop', 'quantity': 7, 'price': '999.99'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response['ETag'], self.client.get(self.detail_url)['ETag'])
+        self.assertEqual(InventoryChangeLog.objects.filter(inventory_item=self.laptop).count(), 1)
+        
+    def test_missing_item(self):
+        response = self.client.get(reverse('inventory-detail', args=[999999]), HTTP_IF_NONE_MATCH='"x"')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LowStockTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        other_user = User.objects.create_user(username='user2', password='password123')
+        self.laptop = InventoryItem.objects.create(
+            user=self.user, name='Laptop', quantity=5, reorder_point=3, price=Decimal('999.99'))
+        self.phone = InventoryItem.objects.create(
+            user=self.user, name='Phone', quantity=10, reorder_point=10, price=Decimal('499.99'))
+        self.cable = InventoryItem.objects.create(
+            user=self.user, name='Cable', quantity=0, price=Decimal('4.50'))
+        InventoryItem.objects.create(user=other_user, name='Tablet', quantity=0, price=Decimal('399.99'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('inventory-low-stock')
+        
+    def low_stock_names(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in response.data['results']]
+        
+    def test_items_at_or_below_reorder_point(self):
+        self.assertEqual(self.low_stock_names(), ['Phone', 'Cable'])
+        
+    def test_follows_adjustments_and_bulk_updates(self):
+        self.client.post(reverse('inventory-adjust', args=[self.laptop.id]), {'delta': -2})
+        self.client.post(reverse('inventory-bulk-adjust'), [{'id': self.phone.id, 'delta': 1}], format='json')
+        self.assertEqual(self.low_stock_names(), ['Laptop', 'Cable'])
+        
+        self.client.patch(reverse('inventory-bulk'), [
+            {'id': self.cable.id, 'quantity': 50},
+            {'id': self.laptop.id, 'reorder_point': 0},
+        ], format='json')
+        self.assertEqual(self.low_stock_names(), [])
+        
+    def test_reorder_point_is_editable(self):
+        response = self.client.patch(
+            reverse('inventory-detail', args=[self.laptop.id]), {'reorder_point': 5})
+        self.assertEqual(response.data['reorder_point'], 5)
+        self.assertEqual(self.low_stock_names(), ['Laptop', 'Phone', 'Cable'])
+        
+        response = self.client.patch(
+            reverse('inventory-detail', args=[self.laptop.id]), {'reorder_point': -1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class InventoryChangeLogViewSetTests(APITestCase):
     def setUp(self):
         # Create users
@@ -407,42 +1002,1760 @@ class InventoryChangeLogViewSetTests(APITestCase):
             self.assertEqual(log.get('change_type'), 'restock')
 
 
-class UserRegistrationTests(APITestCase):
+class KeysetPaginationTests(APITestCase):
     def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.items = InventoryItem.objects.bulk_create([
+            InventoryItem(user=self.user, name=f'Item {i}', quantity=i % 3, price=Decimal('1.00'))
+            for i in range(25)
+        ])
+        InventoryChangeLog.objects.bulk_create([
+            InventoryChangeLog(inventory_item=item, user=self.user, previous_quantity=0,
+                               new_quantity=item.quantity, change_type='restock')
+            for item in self.items
+        ])
+        # Force timestamp ties so the id tie-breaker has to do the work
+        InventoryChangeLog.objects.filter(id__lte=self.items[9].id).update(timestamp=timezone.now())
         self.client = APIClient()
-        self.register_url = reverse('user-register')
+        self.client.force_authenticate(user=self.user)
         
-    def test_user_registration(self):
-        data = {
-            'username': 'newuser',
-            'email': 'newuser@example.com',
-            'password': 'securepassword123',
-            'first_name': 'New',
-            'last_name': 'User'
-        }
-        response = self.client.post(self.register_url, data)
+    def collect(self, url, link='next'):
+        ids = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data[link]
+            pages += 1
+        return ids, pages
         
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertTrue(User.objects.filter(username='newuser').exists())
+    def test_inventory_pages_by_id(self):
+        ids, pages = self.collect(reverse('inventory-list'))
+        
+        self.assertEqual(ids, [item.id for item in self.items])
+        self.assertEqual(pages, 3)
+        
+    def test_inventory_ordering_is_keyset_compatible(self):
+        ids, _ = self.collect(reverse('inventory-list') + '?ordering=-quantity&page_size=4')
+        
+        expected = InventoryItem.objects.order_by('-quantity', '-id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+        
+    def test_change_logs_page_by_timestamp_and_id(self):
+        ids, _ = self.collect(reverse('changes-list') + '?page_size=3')
+        
+        expected = InventoryChangeLog.objects.order_by('-timestamp', '-id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+        
+    def test_previous_link_walks_back(self):
+        response = self.client.get(reverse('changes-list') + '?page_size=4')
+        first_page = [row['id'] for row in response.data['results']]
+        self.assertIsNone(response.data['previous'])
+        response = self.client.get(response.data['next'])
+        response = self.client.get(response.data['previous'])
+        
+        self.assertEqual([row['id'] for row in response.data['results']], first_page)
+        
+    def test_page_size_is_capped(self):
+        response = self.client.get(reverse('inventory-list') + '?page_size=100000')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 25)
+        self.assertNotIn('count', response.data)
+        
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('inventory-list') + '?cursor=garbage')
+        
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
-class AuthenticationTests(APITestCase):
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked with SQLite EXPLAIN QUERY PLAN')
+class QueryPlanTests(APITestCase):
+    """
+    Each endpoint's queries against the inventory tables must be served by
+    an index rather than a full table scan.
+    """
+    
     def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.category = Category.objects.create(name='Electronics')
+        self.item = InventoryItem.objects.create(
+            user=self.user, name='Laptop', quantity=5, price=Decimal('999.99'), category=self.category)
+        InventoryChangeLog.objects.create(
+            inventory_item=self.item, user=self.user, previous_quantity=0, new_quantity=5,
+            change_type='restock')
         self.client = APIClient()
-        self.user = User.objects.create_user(
-            username='testuser',
-            email='test@example.com',
-            password='testpassword123'
-        )
-        self.token_url = reverse('token_obtain_pair')
+        self.client.force_authenticate(user=self.user)
         
-    def test_obtain_token(self):
-        data = {
-            'username': 'testuser',
-            'password': 'testpassword123'
-        }
-        response = self.client.post(self.token_url, data)
+    def query_plans(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if query['sql'].startswith('SELECT') and '"inventory_inventory' in query['sql']:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                    plans.append(' / '.join(row[3] for row in cursor.fetchall()))
+        self.assertTrue(plans)
+        return plans
+        
+    def assertUsesIndex(self, url, sorted_by_index=True):
+        for plan in self.query_plans(url):
+            self.assertNotRegex(plan, r'SCAN inventory_inventory', plan)
+            if sorted_by_index:
+                self.assertNotIn('TEMP B-TREE', plan)
+        
+    def test_inventory_list(self):
+        self.assertUsesIndex(reverse('inventory-list'))
         
+    def test_inventory_list_ordered(self):
+        self.assertUsesIndex(reverse('inventory-list') + '?ordering=-price')
+        self.assertUsesIndex(reverse('inventory-list') + '?ordering=quantity')
+        
+    def test_inventory_list_by_category(self):
+        self.assertUsesIndex(reverse('inventory-list') + f'?category={self.category.id}')
+        
+    def test_inventory_retrieve(self):
+        self.assertUsesIndex(reverse('inventory-detail', args=[self.item.id]))
+        
+    def test_inventory_search(self):
+        self.assertUsesIndex(reverse('inventory-list') + '?search=lap', sorted_by_index=False)
+        
+    def test_levels_low_stock(self):
+        self.assertUsesIndex(reverse('inventory-levels') + '?low_stock=10', sorted_by_index=False)
+        
+    def test_low_stock_uses_partial_index(self):
+        for plan in self.query_plans(reverse('inventory-low-stock')):
+            self.assertIn('item_low_stock_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+        
+    def test_change_log_list(self):
+        self.assertUsesIndex(reverse('changes-list'))
+        self.assertUsesIndex(reverse('changes-list') + '?ordering=timestamp')
+        
+    def test_change_log_list_by_item(self):
+        self.assertUsesIndex(reverse('changes-list') + f'?inventory_item={self.item.id}')
+        
+    def test_change_log_list_filters_on_owner(self):
+        for plan in self.query_plans(reverse('changes-list')):
+            if 'inventory_inventorychangelog' in plan:
+                self.assertIn('changelog_owner_ts_idx (owner_id=?)', plan)
+
+
+class QueryBudgetTests(APITestCase):
+    """
+    Fixed per-route query budgets. A route that issues a query per row
+    fails here because its count grows with the page size.
+    """
+    budgets = {
+        'inventory-list': 1,
+        'inventory-detail': 1,
+        'inventory-levels': 1,
+        'changes-list': 1,
+        'user-me': 0,
+    }
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(5)])
+        self.items = InventoryItem.objects.bulk_create([
+            InventoryItem(user=self.user, name=f'Item {i}', quantity=i, price=Decimal('1.00'),
+                          category=categories[i % 5])
+            for i in range(30)
+        ])
+        InventoryChangeLog.objects.bulk_create([
+            InventoryChangeLog(inventory_item=item, user=self.user, previous_quantity=0,
+                               new_quantity=item.quantity, change_type='restock')
+            for item in self.items
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn('access', response.data)
-        self.assertIn('refresh', response.data)
\ No newline at end of file
+        return len(queries)
+        
+    def assertWithinBudget(self, route, url, paginated=True):
+        budget = self.budgets[route]
+        sizes = [2, 25] if paginated else [None]
+        for size in sizes:
+            page_url = f'{url}?page_size={size}' if size else url
+            used = self.count_queries(page_url)
+            self.assertLessEqual(used, budget, f'{route} used {used} queries, budget is {budget}')
+        
+    def test_inventory_list(self):
+        self.assertWithinBudget('inventory-list', reverse('inventory-list'))
+        
+    def test_inventory_retrieve(self):
+        self.assertWithinBudget('inventory-detail', reverse('inventory-detail', args=[self.items[0].id]),
+                                paginated=False)
+        
+    def test_levels(self):
+        self.assertWithinBudget('inventory-levels', reverse('inventory-levels'))
+        
+    def test_changes(self):
+        self.assertWithinBudget('changes-list', reverse('changes-list'))
+        
+    def test_me(self):
+        self.assertWithinBudget('user-me', reverse('user-me'), paginated=False)
+
+
+class FullTextSearchTests(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='password123')
+        self.user2 = User.objects.create_user(username='user2', password='password123')
+        self.laptop = InventoryItem.objects.create(
+            user=self.user1, name='Gaming Laptop', description='Laptop with a fast graphics card',
+            quantity=5, price=Decimal('1999.99'))
+        self.bag = InventoryItem.objects.create(
+            user=self.user1, name='Backpack', description='Fits a 15 inch laptop',
+            quantity=10, price=Decimal('59.99'))
+        self.mouse = InventoryItem.objects.create(
+            user=self.user1, name='Wireless Mouse', quantity=20, price=Decimal('29.99'))
+        InventoryItem.objects.create(
+            user=self.user2, name='Office Laptop', quantity=3, price=Decimal('899.99'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user1)
+        
+    def search(self, query, **params):
+        response = self.client.get(reverse('inventory-list'), {'search': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in response.data['results']]
+        
+    def test_search_matches_name_and_description_ranked(self):
+        self.assertEqual(self.search('laptop'), ['Gaming Laptop', 'Backpack'])
+        
+    def test_search_matches_prefixes(self):
+        self.assertEqual(self.search('wire'), ['Wireless Mouse'])
+        
+    def test_search_requires_every_term(self):
+        self.assertEqual(self.search('laptop graphics'), ['Gaming Laptop'])
+        self.assertEqual(self.search('mouse graphics'), [])
+        
+    def test_search_ignores_query_syntax(self):
+        self.assertEqual(self.search('"laptop" OR NEAR(mouse'), [])
+        self.assertEqual(self.search('laptop*'), ['Gaming Laptop', 'Backpack'])
+        
+    def test_search_respects_explicit_ordering(self):
+        self.assertEqual(self.search('laptop', ordering='price'), ['Backpack', 'Gaming Laptop'])
+        
+    def test_search_paginates_by_rank(self):
+        response = self.client.get(reverse('inventory-list'), {'search': 'laptop', 'page_size': 1})
+        names = [item['name'] for item in response.data['results']]
+        response = self.client.get(response.data['next'])
+        names += [item['name'] for item in response.data['results']]
+        
+        self.assertEqual(names, ['Gaming Laptop', 'Backpack'])
+        self.assertIsNone(response.data['next'])
+        
+    def test_index_follows_updates_and_deletes(self):
+        self.mouse.name = 'Trackball'
+        self.mouse.save()
+        self.bag.delete()
+        
+        self.assertEqual(self.search('wireless'), [])
+        self.assertEqual(self.search('track'), ['Trackball'])
+        self.assertEqual(self.search('laptop'), ['Gaming Laptop'])
+        
+    @override_settings(INVENTORY_SEARCH_BACKEND='inventory.search.LikeSearchBackend')
+    def test_like_backend(self):
+        self.assertEqual(sorted(self.search('laptop')), ['Backpack', 'Gaming Laptop'])
+
+
+class ChangeLogStatsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.other_user = User.objects.create_user(username='user2', password='password123')
+        self.books = Category.objects.create(name='Books')
+        self.laptop = InventoryItem.objects.create(
+            user=self.user, name='Laptop', quantity=50, price=Decimal('999.99'))
+        self.novel = InventoryItem.objects.create(
+            user=self.user, name='Novel', quantity=50, price=Decimal('12.50'), category=self.books)
+        self.tablet = InventoryItem.objects.create(
+            user=self.other_user, name='Tablet', quantity=50, price=Decimal('399.99'))
+        self.today = timezone.localdate()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+    def add_history(self, days_ago, item, change_type, net_units, changes=1):
+        ChangeLogDailyStat.objects.create(
+            owner=item.user, day=self.today - timedelta(days=days_ago), inventory_item=item,
+            category=item.category, change_type=change_type, net_units=net_units, change_count=changes)
+        
+    def stats(self, **params):
+        response = self.client.get(reverse('changes-stats'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(row['period'], row['change_type'], row['net_units'], row['changes'])
+                for row in response.data['results']]
+        
+    def test_change_logs_are_rolled_up_as_written(self):
+        InventoryItem.objects.adjust_quantity(self.laptop.id, -3, self.user)
+        InventoryItem.objects.adjust_quantities(
+            [(self.laptop.id, -2, None), (self.novel.id, 10, None)], self.user)
+        InventoryChangeLog.objects.create(
+            inventory_item=self.novel, user=self.user, previous_quantity=60, new_quantity=58,
+            change_type='adjustment')
+        
+        rows = ChangeLogDailyStat.objects.filter(day=self.today).order_by('inventory_item', 'change_type')
+        self.assertEqual(
+            [(row.inventory_item, row.change_type, row.net_units, row.change_count, row.category)
+             for row in rows],
+            [(self.laptop, 'sale', -5, 2, None),
+             (self.novel, 'adjustment', -2, 1, self.books),
+             (self.novel, 'restock', 10, 1, self.books)]
+        )
+        
+    def test_daily_buckets_combine_history_with_today(self):
+        self.add_history(2, self.laptop, 'sale', -4, 2)
+        self.add_history(1, self.laptop, 'restock', 10)
+        self.add_history(1, self.tablet, 'restock', 99)
+        InventoryItem.objects.adjust_quantity(self.laptop.id, -1, self.user)
+        
+        day = lambda n: (self.today - timedelta(days=n)).isoformat()
+        self.assertEqual(self.stats(), [
+            (day(2), 'sale', -4, 2),
+            (day(1), 'restock', 10, 1),
+            (day(0), 'sale', -1, 1),
+        ])
+        
+    def test_today_is_not_double_counted(self):
+        InventoryItem.objects.adjust_quantity(self.laptop.id, 5, self.user)
+        
+        self.assertEqual(self.stats(), [(self.today.isoformat(), 'restock', 5, 1)])
+        
+    def test_monthly_buckets_and_range(self):
+        month_start = self.today.replace(day=1)
+        previous_month = (month_start - timedelta(days=1)).replace(day=1)
+        self.add_history((self.today - previous_month).days, self.laptop, 'sale', -3)
+        self.add_history((self.today - previous_month).days - 1, self.laptop, 'sale', -2)
+        self.add_history(400, self.laptop, 'sale', -100)
+        
+        self.assertEqual(
+            self.stats(bucket='month', **{'from': previous_month.isoformat()}),
+            [(previous_month.isoformat(), 'sale', -5, 2)]
+        )
+        
+    def test_filters(self):
+        self.add_history(1, self.laptop, 'sale', -4)
+        self.add_history(1, self.novel, 'sale', -7)
+        self.add_history(1, self.novel, 'restock', 3)
+        InventoryItem.objects.adjust_quantity(self.novel.id, -1, self.user)
+        
+        self.assertEqual(
+            [row[2] for row in self.stats(category=self.books.id, change_type='sale')], [-7, -1])
+        self.assertEqual(
+            [row[2] for row in self.stats(inventory_item=self.laptop.id)], [-4])
+        
+    def test_invalid_range(self):
+        response = self.client.get(reverse('changes-stats'), {'from': '2025-02-01', 'to': '2025-01-01'})
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ChangeLogRetentionTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.laptop = InventoryItem.objects.create(user=self.user, name='Laptop', quantity=50, price=Decimal('999.99'))
+        self.cable = InventoryItem.objects.create(user=self.user, name='Cable', quantity=50, price=Decimal('4.50'))
+        now = timezone.now()
+        # Three old changes per item, then one recent one
+        for days_ago, delta in ((400, -5), (380, 10), (370, -1), (1, -2)):
+            for item in (self.laptop, self.cable):
+                log = InventoryItem.objects.adjust_quantity(item.id, delta, self.user)[1]
+                InventoryChangeLog.objects.filter(pk=log.pk).update(timestamp=now - timedelta(days=days_ago))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+    def archive(self, *args):
+        out = StringIO()
+        call_command('archive_change_logs', '--days=365', *args, stdout=out)
+        return out.getvalue()
+        
+    def history(self, **params):
+        results, url = [], reverse('changes-list')
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            results += response.data['results']
+            url, params = response.data['next'], {}
+        return results
+        
+    def test_old_logs_are_archived_behind_checkpoints(self):
+        before = list(InventoryChangeLog.objects.order_by('id').values())
+        stats = list(ChangeLogDailyStat.objects.order_by('id').values())
+        
+        self.assertIn('Archived 6 change logs', self.archive())
+        
+        archived = list(ArchivedChangeLog.objects.order_by('id').values())
+        self.assertEqual(archived, [row for row in before if row['timestamp'] < timezone.now() - timedelta(days=365)])
+        live = InventoryChangeLog.objects.filter(inventory_item=self.laptop).order_by('timestamp')
+        checkpoint, recent = live
+        self.assertEqual(
+            (checkpoint.change_type, checkpoint.previous_quantity, checkpoint.new_quantity, checkpoint.timestamp),
+            ('checkpoint', 50, 54, archived[-2]['timestamp']))
+        self.assertEqual((recent.previous_quantity, recent.new_quantity), (54, 52))
+        # Archived changes were already counted
+        self.assertEqual(list(ChangeLogDailyStat.objects.order_by('id').values()), stats)
+        
+    def test_batches_resume_where_they_stopped(self):
+        before = self.history()
+        
+        self.assertIn('Archived 4 change logs', self.archive('--batch-size=2', '--max-batches=2'))
+        self.assertIn('Archived 2 change logs', self.archive('--batch-size=2'))
+        self.assertIn('Archived 0 change logs', self.archive())
+        
+        self.assertEqual(ArchivedChangeLog.objects.count(), 6)
+        self.assertEqual(InventoryChangeLog.objects.filter(change_type='checkpoint').count(), 2)
+        self.assertEqual(self.history(include_archived='true'), before)
+        
+    @skipUnless(connection.vendor == 'sqlite', 'Reads the SQLite query plan')
+    def test_batches_read_the_oldest_logs_through_an_index(self):
+        cutoff = timezone.now() - timedelta(days=365)
+        moved, after = InventoryChangeLog.objects.archive(cutoff, batch_size=2)
+        self.assertEqual(moved, 2)
+        with CaptureQueriesContext(connection) as queries:
+            InventoryChangeLog.objects.archive(cutoff, batch_size=2, after=after)
+        
+        select = next(query['sql'] for query in queries if 'ORDER BY' in query['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {select}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('USING INDEX changelog_archive_idx (timestamp>? AND timestamp<?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        
+    def test_list_includes_archived_history_when_asked(self):
+        before = self.history()
+        self.archive()
+        
+        self.assertEqual([row['change_type'] for row in self.history()], ['sale', 'sale', 'checkpoint', 'checkpoint'])
+        for fast in (True, False):
+            with self.settings(INVENTORY_FAST_LISTS=fast):
+                self.assertEqual(self.history(include_archived='true', page_size=3), before)
+                self.assertEqual(self.history(include_archived='true', inventory_item=self.cable.id),
+                                 [row for row in before if row['inventory_item'] == self.cable.id])
+        
+    def test_invalid_horizon(self):
+        with self.assertRaises(CommandError):
+            call_command('archive_change_logs', '--days=0', stdout=StringIO())
+        
+    def test_checkpoint_is_not_a_stock_change_type(self):
+        response = self.client.post(reverse('inventory-adjust', args=[self.laptop.id]),
+                                    {'delta': 1, 'change_type': 'checkpoint'}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(INVENTORY_CHANGE_LOG_WRITE_BEHIND=True)
+class WriteBehindChangeLogTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.item = InventoryItem.objects.create(user=self.user, name='Laptop', quantity=10, price=Decimal('999.99'))
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_dir = spool_dir.name
+        self.buffer = ChangeLogBuffer(spool_dir=self.spool_dir, background=False)
+        patcher = mock.patch('inventory.write_behind.change_log_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+    def new_log(self, new_quantity=12):
+        return InventoryChangeLog(inventory_item=self.item, user=self.user, owner=self.user, previous_quantity=10,
+                                  new_quantity=new_quantity, change_type='restock', timestamp=timezone.now())
+        
+    def spooled(self):
+        return [line for path in os.listdir(self.spool_dir)
+                for line in open(os.path.join(self.spool_dir, path)).read().splitlines()]
+        
+    def test_update_is_logged_when_flushed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('inventory-detail', args=[self.item.id]),
+                                         {'quantity': 7}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(InventoryChangeLog.objects.exists())
+        event = json.loads(self.spooled()[0])
+        
+        self.assertEqual(self.buffer.flush(), 1)
+        log = InventoryChangeLog.objects.get()
+        self.assertEqual((log.previous_quantity, log.new_quantity, log.change_type), (10, 7, 'sale'))
+        self.assertEqual(log.timestamp.isoformat(), event['timestamp'])
+        self.assertEqual(ChangeLogDailyStat.objects.get().net_units, -3)
+        self.assertEqual(self.spooled(), [])
+        self.assertEqual(ChangeLogSpoolPosition.objects.get().sequence, 1)
+        
+    def test_flush_query_count_is_independent_of_batch_size(self):
+        category = Category.objects.create(name='Electronics')
+        InventoryItem.objects.filter(pk=self.item.pk).update(category=category)
+        
+        def flush(count):
+            with self.captureOnCommitCallbacks(execute=True):
+                for _ in range(count):
+                    self.buffer.add(self.new_log())
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.buffer.flush(), count)
+            return len(queries)
+        
+        flush(1)  # creates the day's stat row
+        self.assertEqual(flush(2), flush(20))
+        self.assertEqual(ChangeLogDailyStat.objects.get().category, category)
+        
+    def test_rolled_back_changes_are_not_spooled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.buffer.add(self.new_log())
+                transaction.set_rollback(True)
+        
+        self.assertEqual(self.spooled(), [])
+        
+    def test_abandoned_segment_is_replayed_once(self):
+        events = [
+            {'seq': seq, 'inventory_item': item_id, 'user': self.user.id, 'owner': self.user.id,
+             'previous_quantity': 10, 'new_quantity': 10 + seq, 'change_type': 'restock',
+             'timestamp': '2026-01-0%dT10:00:00+00:00' % seq}
+            for seq, item_id in ((1, self.item.id), (2, self.item.id), (3, 999999), (4, self.item.id))
+        ]
+        with open(os.path.join(self.spool_dir, 'dead-1-1.spool'), 'w') as spool:
+            spool.writelines(json.dumps(event) + '\n' for event in events)
+            # Cut off mid-write
+            spool.write('{"seq": 5, "inventory_item"')
+        # Logs up to 1 were written before the process died
+        ChangeLogSpoolPosition.objects.create(segment='dead-1-1', sequence=1)
+        
+        out = StringIO()
+        call_command('replay_change_log_spool', stdout=out)
+        
+        self.assertIn('Replayed 3 change logs', out.getvalue())
+        # The log of the deleted item is dropped
+        self.assertEqual(
+            list(InventoryChangeLog.objects.order_by('timestamp').values_list('new_quantity', 'timestamp__day')),
+            [(12, 2), (14, 4)])
+        self.assertEqual(os.listdir(self.spool_dir), [])
+        self.assertFalse(ChangeLogSpoolPosition.objects.exists())
+        
+    def test_live_segments_are_not_replayed(self):
+        self.buffer.enqueue(self.new_log())
+        
+        self.assertEqual(ChangeLogBuffer(spool_dir=self.spool_dir, background=False).replay(), 0)
+        self.assertEqual(len(self.spooled()), 1)
+        self.assertEqual(self.buffer.flush(), 1)
+        
+    @override_settings(INVENTORY_CHANGE_LOG_QUEUE_SIZE=1)
+    def test_full_queue_blocks_writers(self):
+        self.buffer.enqueue(self.new_log(11))
+        writer = threading.Thread(target=self.buffer.enqueue, args=[self.new_log(12)])
+        writer.start()
+        writer.join(0.2)
+        
+        self.assertTrue(writer.is_alive())
+        written = self.buffer.flush()
+        writer.join(5)
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(written + self.buffer.flush(), 2)
+        self.assertEqual(list(InventoryChangeLog.objects.order_by('id').values_list('new_quantity', flat=True)),
+                         [11, 12])
+
+
+class WriteBehindFlusherTests(TransactionTestCase):
+    @override_settings(INVENTORY_CHANGE_LOG_FLUSH_INTERVAL=0.05)
+    def test_background_thread_flushes_and_stops(self):
+        user = User.objects.create_user(username='user1', password='password123')
+        item = InventoryItem.objects.create(user=user, name='Laptop', quantity=10, price=Decimal('999.99'))
+        with tempfile.TemporaryDirectory() as spool_dir:
+            buffer = ChangeLogBuffer(spool_dir=spool_dir)
+            buffer.enqueue(InventoryChangeLog(inventory_item=item, user=user, owner=user, previous_quantity=10,
+                                              new_quantity=12, change_type='restock', timestamp=timezone.now()))
+            # The spool is emptied once its logs are in the database
+            deadline = time.monotonic() + 5
+            while os.path.getsize(buffer._path) and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(os.path.getsize(buffer._path), 0)
+            buffer.stop()
+            
+            self.assertEqual(InventoryChangeLog.objects.count(), 1)
+            self.assertEqual(os.listdir(spool_dir), [])
+            self.assertFalse(ChangeLogSpoolPosition.objects.exists())
+
+
+# Exports are compared against the serializers' output
+@override_settings(INVENTORY_FAST_LISTS=False)
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        other_user = User.objects.create_user(username='user2', password='password123')
+        self.category = Category.objects.create(name='Electronics')
+        self.laptop = InventoryItem.objects.create(
+            user=self.user, name='Laptop', description='Fast, light', quantity=5,
+            price=Decimal('999.99'), category=self.category)
+        self.cable = InventoryItem.objects.create(
+            user=self.user, name='Cable', quantity=100, price=Decimal('4.50'))
+        InventoryItem.objects.create(user=other_user, name='Tablet', quantity=8, price=Decimal('399.99'))
+        InventoryItem.objects.adjust_quantity(self.laptop.id, -2, self.user)
+        InventoryItem.objects.adjust_quantity(self.cable.id, 20, self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+    def export(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+        
+    def test_inventory_csv_matches_serializer(self):
+        response, content = self.export(reverse('inventory-export'), format='csv')
+        
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('inventory.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(content)))
+        listed = self.client.get(reverse('inventory-list')).data['results']
+        self.assertEqual(len(rows), 2)
+        for row, item in zip(rows, listed):
+            expected = {key: '' if value is None else str(value) for key, value in item.items()}
+            expected.setdefault('category_name', '')
+            self.assertEqual(row, expected)
+        
+    def test_inventory_ndjson_matches_serializer(self):
+        response, content = self.export(reverse('inventory-export'), format='ndjson')
+        
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        listed = json.loads(self.client.get(reverse('inventory-list')).content)['results']
+        self.assertEqual(rows, listed)
+        
+    def test_inventory_export_honours_filters(self):
+        _, content = self.export(reverse('inventory-export'), format='ndjson', search='lapt')
+        
+        self.assertEqual([json.loads(line)['name'] for line in content.splitlines()], ['Laptop'])
+        
+    def test_change_log_export(self):
+        _, content = self.export(reverse('changes-export'), format='ndjson', change_type='sale')
+        rows = [json.loads(line) for line in content.splitlines()]
+        listed = json.loads(self.client.get(reverse('changes-list'), {'change_type': 'sale'}).content)
+        
+        self.assertEqual(rows, listed['results'])
+        
+    def test_export_requires_authentication(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse('changes-export'), {'format': 'csv'})
+        
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(INVENTORY_FAST_LISTS=True)
+class FastListTests(APITestCase):
+    """The values_list() list path must render exactly what the serializers do."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        category = Category.objects.create(name='Électronique')
+        self.laptop = InventoryItem.objects.create(
+            user=self.user, name='Laptop "Pro"', description='Fast, light – 14\u2033', quantity=5,
+            reorder_point=6, price=Decimal('999.99'), category=category)
+        self.cable = InventoryItem.objects.create(user=self.user, name='Cable', quantity=100, price=Decimal('4.5'))
+        InventoryItem.objects.create(user=self.user, name='Stand', quantity=3, price=Decimal('20'),
+                                     category=category)
+        InventoryItem.objects.adjust_quantity(self.laptop.id, -2, self.user)
+        InventoryItem.objects.adjust_quantity(self.cable.id, 20, self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+    def assertSameContent(self, url, params=None):
+        # The fast path must not touch the serializers at all
+        with mock.patch.object(InventoryItemSerializer, 'to_representation', side_effect=AssertionError), \
+                mock.patch.object(InventoryChangeLogSerializer, 'to_representation', side_effect=AssertionError):
+            fast = self.client.get(url, params)
+        with self.settings(INVENTORY_FAST_LISTS=False):
+            serialized = self.client.get(url, params)
+        
+        self.assertEqual(fast.status_code, status.HTTP_200_OK)
+        self.assertEqual(fast.content, serialized.content)
+        return fast
+        
+    def test_inventory_list(self):
+        response = self.assertSameContent(reverse('inventory-list'))
+        
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertNotIn('category_name', response.data['results'][1])
+        
+    def test_inventory_list_ordering_search_and_cursor(self):
+        self.assertSameContent(reverse('inventory-list'), {'ordering': '-price'})
+        self.assertSameContent(reverse('inventory-list'), {'search': 'laptop'})
+        response = self.assertSameContent(reverse('inventory-list'), {'ordering': 'name', 'page_size': 1})
+        self.assertSameContent(response.data['next'])
+        
+    @override_settings(TIME_ZONE='America/New_York')
+    def test_inventory_list_in_local_time(self):
+        self.assertSameContent(reverse('inventory-list'))
+        
+    def test_sparse_fieldsets(self):
+        for params in ({'fields': 'name,category_name'}, {'fields': 'id,category'},
+                       {'exclude': 'description,category_name'}):
+            self.assertSameContent(reverse('inventory-list'), params)
+        self.assertSameContent(reverse('changes-list'), {'fields': 'item_name,username,new_quantity'})
+        
+    def test_levels_and_low_stock(self):
+        self.assertSameContent(reverse('inventory-levels'), {'low_stock': 10})
+        response = self.assertSameContent(reverse('inventory-low-stock'))
+        
+        self.assertEqual([item['id'] for item in response.data['results']], [self.laptop.id])
+        
+    def test_changes_list(self):
+        self.assertSameContent(reverse('changes-list'))
+        self.assertSameContent(reverse('changes-list'), {'change_type': 'sale'})
+        
+    def test_conditional_list(self):
+        etag = self.assertSameContent(reverse('inventory-list'))['ETag']
+        response = self.client.get(reverse('inventory-list'), HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        self.category = Category.objects.create(name='Electronics', description='Gadgets')
+        self.laptop = InventoryItem.objects.create(
+            user=self.user, name='Laptop', description='Fast, light', quantity=5,
+            price=Decimal('999.99'), category=self.category)
+        InventoryItem.objects.create(user=self.user, name='Cable', quantity=100, price=Decimal('4.50'))
+        InventoryItem.objects.adjust_quantity(self.laptop.id, -2, self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+    def get(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, [query['sql'] for query in queries]
+        
+    def test_list_loads_only_requested_columns(self):
+        for fast in (True, False):
+            with self.settings(INVENTORY_FAST_LISTS=fast):
+                response, queries = self.get(reverse('inventory-list'), {'fields': 'id,name,quantity'})
+            
+            self.assertEqual(response.data['results'], [
+                {'id': self.laptop.id, 'name': 'Laptop', 'quantity': 3},
+                {'id': self.laptop.id + 1, 'name': 'Cable', 'quantity': 100},
+            ])
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn('description', queries[0])
+            self.assertNotIn('JOIN', queries[0])
+            
+    def test_related_fields_join_only_when_requested(self):
+        for fast in (True, False):
+            with self.settings(INVENTORY_FAST_LISTS=fast):
+                response, queries = self.get(reverse('inventory-list'), {'fields': 'name,category_name'})
+            
+            self.assertEqual(response.data['results'], [
+                {'name': 'Laptop', 'category_name': 'Electronics'}, {'name': 'Cable'},
+            ])
+            self.assertEqual(len(queries), 1)
+            self.assertIn('JOIN', queries[0])
+            
+    def test_exclude(self):
+        response, queries = self.get(reverse('inventory-detail', args=[self.laptop.id]),
+                                     {'exclude': 'description,category_name'})
+        
+        self.assertNotIn('description', response.data)
+        self.assertNotIn('category_name', response.data)
+        self.assertEqual(response.data['category'], self.category.id)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertNotIn('description', queries[0])
+        self.assertNotIn('JOIN', queries[0])
+        
+    def test_cursor_pagination_with_sparse_fields(self):
+        for fast in (True, False):
+            with self.settings(INVENTORY_FAST_LISTS=fast):
+                first, _ = self.get(reverse('inventory-list'), {'fields': 'id', 'ordering': '-price', 'page_size': 1})
+                second, queries = self.get(first.data['next'], {})
+            
+            self.assertEqual(first.data['results'], [{'id': self.laptop.id}])
+            self.assertEqual(second.data['results'], [{'id': self.laptop.id + 1}])
+            self.assertEqual(len(queries), 1)
+            
+    def test_levels_and_changes(self):
+        response, queries = self.get(reverse('inventory-levels'), {'fields': 'name', 'low_stock': 10})
+        self.assertEqual(response.data['results'], [{'name': 'Laptop'}])
+        
+        response, queries = self.get(reverse('changes-list'), {'fields': 'change_type,new_quantity'})
+        self.assertEqual(response.data['results'], [{'new_quantity': 3, 'change_type': 'sale'}])
+        self.assertNotIn('JOIN', queries[0])
+        
+        response, queries = self.get(reverse('changes-list'), {'fields': 'username'})
+        self.assertEqual(response.data['results'], [{'username': 'user1'}])
+        self.assertIn('JOIN', queries[0])
+        
+    def test_categories(self):
+        full, _ = self.get(reverse('category-list'), {})
+        sparse, _ = self.get(reverse('category-list'), {'fields': 'name'})
+        
+        self.assertEqual(full.data['results'][0]['description'], 'Gadgets')
+        self.assertEqual(sparse.data['results'], [{'name': 'Electronics'}])
+        
+    def test_unknown_field(self):
+        response = self.client.get(reverse('inventory-list'), {'fields': 'name,secret', 'exclude': 'nope'})
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {
+            'fields': ['Unknown field "secret".'], 'exclude': ['Unknown field "nope".'],
+        })
+
+
+class ImportInventoryCommandTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='password123')
+        Category.objects.create(name='Electronics')
+        
+    def write_file(self, suffix, content):
+        handle = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8')
+        with handle:
+            handle.write(content)
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+        
+    def call(self, *args):
+        stdout = StringIO()
+        call_command('import_inventory', *args, '--user', 'importer', stdout=stdout, stderr=StringIO())
+        return stdout.getvalue()
+        
+    def test_import_csv(self):
+        path = self.write_file('.csv', (
+            'name,description,quantity,price,category\n'
+            'Laptop,Fast,5,999.99,Electronics\n'
+            'Novel,,10,12.5,Books\n'
+            'Cable,,3,4.00,\n'
+        ))
+        output = self.call(path, '--batch-size', '2')
+        
+        self.assertIn('Imported 3 items', output)
+        items = {item.name: item for item in InventoryItem.objects.select_related('category')}
+        self.assertEqual(items['Laptop'].category.name, 'Electronics')
+        self.assertEqual(items['Novel'].category.name, 'Books')
+        self.assertEqual(items['Novel'].price, Decimal('12.50'))
+        self.assertIsNone(items['Cable'].category)
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(InventorySummary.objects.mismatches(), {})
+        
+    def test_import_ndjson_with_offset(self):
+        path = self.write_file('.ndjson', '\n'.join(json.dumps(row) for row in [
+            {'name': 'Laptop', 'quantity': 5, 'price': '999.99'},
+            {'name': 'Mouse', 'quantity': 7, 'price': '19.99', 'category': 'Electronics'},
+        ]))
+        self.call(path, '--offset', '1')
+        
+        self.assertEqual(list(InventoryItem.objects.values_list('name', flat=True)), ['Mouse'])
+        
+    def test_invalid_row_reports_resume_offset(self):
+        path = self.write_file('.csv', (
+            'name,quantity,price\n'
+            'Laptop,5,999.99\n'
+            'Mouse,7,19.99\n'
+            'Broken,1,not-a-price\n'
+        ))
+        with self.assertRaisesMessage(CommandError, 'resume with --offset 2'):
+            self.call(path, '--batch-size', '2')
+        self.assertEqual(InventoryItem.objects.count(), 2)
+        
+        output = self.call(path, '--offset', '2', '--skip-invalid')
+        self.assertIn('1 skipped', output)
+        
+    def test_invalid_ndjson_lines(self):
+        for line, message in (('{"name": "Broken",', 'invalid JSON'), ('["Broken", 1]', 'row must be an object'),
+                              ('42', 'row must be an object')):
+            InventoryItem.objects.all().delete()
+            path = self.write_file('.ndjson', '\n'.join([
+                json.dumps({'name': 'Laptop', 'quantity': 5, 'price': '999.99'}),
+                line,
+                json.dumps({'name': 'Mouse', 'quantity': 7, 'price': '19.99'}),
+            ]))
+            with self.assertRaisesMessage(CommandError, f'Row 2: {message}. 0 rows were imported; '
+                                                        'fix the row and resume with --offset 0'):
+                self.call(path)
+            self.assertFalse(InventoryItem.objects.exists())
+            
+            output = self.call(path, '--skip-invalid')
+            self.assertIn('Imported 2 items', output)
+            self.assertIn('1 skipped', output)
+
+
+class AsyncReadPathTests(TestCase):
+    """The ASGI routes must answer exactly like the DRF views they shadow."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password123')
+        other_user = User.objects.create_user(username='user2', password='password123')
+        self.category = Category.objects.create(name='Electronics')
+        self.laptop = InventoryItem.objects.create(
+            user=self.user, name='Laptop', quantity=5, price=Decimal('999.99'), category=self.category)
+        InventoryItem.objects.create(user=self.user, name='Cable', quantity=100, price=Decimal('4.50'))
+        self.other_item = InventoryItem.objects.create(
+            user=other_user, name='Tablet', quantity=8, price=Decimal('399.99'))
+        InventoryItem.objects.adjust_quantity(self.laptop.id, -2, self.user)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+        
+    def async_request(self, method, url, headers=None, **kwargs):
+        with override_settings(ROOT_URLCONF='inventory_api.asgi_urls'):
+            send = getattr(self.async_client, method)
+            response = async_to_sync(send)(url, headers=self.headers if headers is None else headers, **kwargs)
+            self.assertTrue(issubclass(response.resolver_match.func.view_class, AsyncReadView))
+        return response
+        
+    def assertSameResponse(self, url, **headers):
+        expected = self.client.get(url, headers=headers)
+        response = self.async_request('get', url, headers={**self.headers, **headers})
+        self.assertEqual(response.status_code, expected.status_code, url)
+        self.assertEqual(response.json(), expected.json(), url)
+        self.assertEqual(response.get('ETag'), expected.get('ETag'), url)
+        return response
+        
+    def test_reads_match_sync_views(self):
+        urls = [
+            reverse('inventory-list'),
+            reverse('inventory-list') + '?search=lap&ordering=-price',
+            reverse('inventory-list') + f'?category={self.category.id}&page_size=1',
+            reverse('inventory-detail', args=[self.laptop.id]),
+            reverse('inventory-detail', args=[self.other_item.id]),
+            reverse('inventory-levels') + '?low_stock=10',
+            reverse('changes-list'),
+            reverse('changes-list') + f'?inventory_item={self.laptop.id}',
+            reverse('changes-list') + '?inventory_item=999999',
+            reverse('inventory-list') + '?fields=id,name&ordering=name&page_size=1',
+            reverse('inventory-detail', args=[self.laptop.id]) + '?exclude=description',
+            reverse('changes-list') + '?fields=item_name,new_quantity',
+            reverse('changes-list') + '?fields=nope',
+            reverse('changes-list') + '?include_archived=true&page_size=1',
+            reverse('category-list'),
+            reverse('category-detail', args=[self.category.id]),
+            reverse('user-me'),
+        ]
+        for url in urls:
+            self.assertSameResponse(url)
+            
+    def test_authentication_errors_match_sync_views(self):
+        url = reverse('inventory-list')
+        self.client.credentials()
+        expected = self.client.get(url)
+        response = self.async_request('get', url, headers={})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.json(), expected.json())
+        
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer invalid')
+        expected = self.client.get(url)
+        response = self.async_request('get', url, headers={'Authorization': 'Bearer invalid'})
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.json(), expected.json())
+        
+    def test_conditional_get(self):
+        url = reverse('inventory-detail', args=[self.laptop.id])
+        etag = self.async_request('get', url)['ETag']
+        response = self.async_request('get', url, headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+    def test_writes_use_sync_views(self):
+        # Token-authenticated writes don't need a CSRF cookie
+        self.async_client = AsyncClient(enforce_csrf_checks=True)
+        response = self.async_request(
+            'post', reverse('inventory-list'),
+            data={'name': 'Mouse', 'quantity': 3, 'price': '19.99'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        
+        url = reverse('inventory-detail', args=[response.json()['id']])
+        response = self.async_request('patch', url, data={'quantity': 4}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.async_request('get', url).json()['quantity'], 4)
+        
+    def test_browsable_api_uses_sync_views(self):
+        response = self.async_request(
+            'get', reverse('inventory-list'), headers={**self.headers, 'Accept': 'text/html'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('text/html', response['Content-Type'])
+
+
+class UserRegistrationTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.register_url = reverse('user-register')
+        
+    def test_user_registration(self):
+        data = {
+            'username': 'newuser',
+            'email': 'newuser@example.com',
+            'password': 'securepassword123',
+            'first_name': 'New',
+            'last_name': 'User'
+        }
+        response = self.client.post(self.register_url, data)
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(User.objects.filter(username='newuser').exists())
+
+
+class AuthenticationTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.token_url = reverse('token_obtain_pair')
+        
+    def test_obtain_token(self):
+        data = {
+            'username': 'testuser',
+            'password': 'testpassword123'
+        }
+        response = self.client.post(self.token_url, data)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.data)
+        self.assertIn('refresh', response.data)
+
+class CachedJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        response = self.client.post(
+            reverse('token_obtain_pair'), {'username': 'testuser', 'password': 'testpassword123'})
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.me_url = reverse('user-me')
+        
+    def test_cached_user_needs_no_queries(self):
+        self.assertEqual(self.client.get(self.me_url).status_code, status.HTTP_200_OK)
+        
+        with self.assertNumQueries(0):
+            response = self.client.get(self.me_url)
+        self.assertEqual(response.data['username'], 'testuser')
+        
+    def test_bearer_token_is_used_before_the_session(self):
+        other = User.objects.create_user(username='other', password='testpassword123')
+        self.client.force_login(other)
+        self.client.get(self.me_url)
+        
+        # No session lookup for a bearer token request
+        with self.assertNumQueries(0):
+            response = self.client.get(self.me_url)
+        self.assertEqual(response.data['username'], 'testuser')
+        
+        with override_settings(ROOT_URLCONF='inventory_api.asgi_urls'):
+            self.async_client.force_login(other)
+            response = async_to_sync(self.async_client.get)(
+                self.me_url, headers={'Authorization': self.client._credentials['HTTP_AUTHORIZATION']})
+        self.assertEqual(response.json()['username'], 'testuser')
+        
+        # Without a token the session still signs in, as for the browsable API
+        self.client.credentials()
+        self.assertEqual(self.client.get(self.me_url).data['username'], 'other')
+        
+    def test_saving_user_evicts_it(self):
+        self.client.get(self.me_url)
+        self.user.email = 'new@example.com'
+        self.user.save()
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(self.me_url)
+        self.assertEqual(response.data['email'], 'new@example.com')
+        
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(self.me_url)
+        self.user.is_active = False
+        self.user.save()
+        
+        self.assertEqual(self.client.get(self.me_url).status_code, status.HTTP_403_FORBIDDEN)
+        
+    @override_settings(INVENTORY_AUTH_USER_CACHE_TTL=0)
+    def test_expired_entries_are_reloaded(self):
+        self.client.get(self.me_url)
+        with self.assertNumQueries(1):
+            self.client.get(self.me_url)
+        
+    @override_settings(INVENTORY_AUTH_USER_CACHE_SIZE=1)
+    def test_least_recently_used_entry_is_evicted(self):
+        other = User.objects.create_user(username='other', password='testpassword123')
+        other_client = APIClient()
+        other_client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(other)}')
+        self.client.get(self.me_url)
+        other_client.get(self.me_url)
+        
+        with self.assertNumQueries(0):
+            other_client.get(self.me_url)
+        with self.assertNumQueries(1):
+            self.client.get(self.me_url)
+
+
+class DatabaseProfileTests(TestCase):
+    
+    def test_sqlite_profile_defaults(self):
+        config = database_from_env({}, Path('/srv'))
+        self.assertEqual(config['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(str(config['NAME']), '/srv/db.sqlite3')
+        self.assertEqual(config['OPTIONS']['timeout'], 20)
+        self.assertEqual(config['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertEqual(config['OPTIONS']['init_command'].split(';'), [
+            'PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL', 'PRAGMA busy_timeout=20000',
+            'PRAGMA mmap_size=268435456', 'PRAGMA cache_size=-65536', 'PRAGMA temp_store=MEMORY',
+        ])
+        
+    def test_sqlite_profile_from_environment(self):
+        config = database_from_env({
+            'INVENTORY_DB_NAME': '/data/inventory.sqlite3',
+            'INVENTORY_SQLITE_BUSY_TIMEOUT': '5',
+            'INVENTORY_SQLITE_CACHE_SIZE': '1024',
+        }, Path('/srv'))
+        self.assertEqual(config['NAME'], '/data/inventory.sqlite3')
+        self.assertEqual(config['OPTIONS']['timeout'], 5)
+        self.assertIn('PRAGMA busy_timeout=5000', config['OPTIONS']['init_command'])
+        self.assertIn('PRAGMA cache_size=-1024', config['OPTIONS']['init_command'])
+        
+    def test_postgresql_persistent_connections(self):
+        config = database_from_env({'INVENTORY_DB_ENGINE': 'postgresql', 'INVENTORY_DB_HOST': 'db'}, Path('/srv'))
+        self.assertEqual(config['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(config['HOST'], 'db')
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('OPTIONS', config)
+        
+    def test_postgresql_pooled_connections(self):
+        env = {'INVENTORY_DB_ENGINE': 'postgresql', 'INVENTORY_DB_POOL': 'true', 'INVENTORY_DB_POOL_MAX_SIZE': '8'}
+        with mock.patch('importlib.util.find_spec', return_value=mock.sentinel.spec):
+            config = database_from_env(env, Path('/srv'))
+            self.assertEqual(check_connection_pool(env=env), [])
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertEqual(config['OPTIONS']['pool'], {'min_size': 2, 'max_size': 8})
+        
+    def test_pool_needs_psycopg_pool(self):
+        env = {'INVENTORY_DB_ENGINE': 'postgresql', 'INVENTORY_DB_POOL': 'true'}
+        installed = {'psycopg': mock.sentinel.spec}
+        with mock.patch('importlib.util.find_spec', side_effect=installed.get):
+            config = database_from_env(env, Path('/srv'))
+            messages = check_connection_pool(env=env)
+        
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        self.assertNotIn('OPTIONS', config)
+        self.assertEqual([message.id for message in messages], ['inventory.W003'])
+        self.assertIn('psycopg[pool]', messages[0].msg)
+        self.assertEqual(check_connection_pool(env={'INVENTORY_DB_ENGINE': 'postgresql'}), [])
+        
+    def test_replicas_from_environment(self):
+        primary = database_from_env({'INVENTORY_DB_ENGINE': 'postgresql', 'INVENTORY_DB_PORT': '5432'}, Path('/srv'))
+        replicas = replicas_from_env({'INVENTORY_DB_REPLICAS': 'db-r1, db-r2:6432'}, primary)
+        self.assertEqual(list(replicas), ['replica1', 'replica2'])
+        self.assertEqual((replicas['replica1']['HOST'], replicas['replica1']['PORT']), ('db-r1', '5432'))
+        self.assertEqual((replicas['replica2']['HOST'], replicas['replica2']['PORT']), ('db-r2', '6432'))
+        self.assertEqual(replicas['replica1']['TEST'], {'MIRROR': 'default'})
+        self.assertEqual(replicas_from_env({}, primary), {})
+        
+    def test_shards_from_environment(self):
+        primary = database_from_env({}, Path('/srv'))
+        shards = shards_from_env({'INVENTORY_DB_SHARDS': '/data/a.sqlite3,/data/b.sqlite3'}, primary)
+        self.assertEqual(list(shards), ['shard1', 'shard2'])
+        self.assertEqual(shards['shard2']['NAME'], '/data/b.sqlite3')
+        self.assertEqual(shards['shard1']['TEST'], {})
+        
+        primary = database_from_env({'INVENTORY_DB_ENGINE': 'postgresql'}, Path('/srv'))
+        shards = shards_from_env({'INVENTORY_DB_SHARDS': 'db1/inventory_a,db1:6432/inventory_b'}, primary)
+        self.assertEqual([(shard['HOST'], shard['PORT'], shard['NAME']) for shard in shards.values()],
+                         [('db1', '', 'inventory_a'), ('db1', '6432', 'inventory_b')])
+        
+    def test_invalid_settings_are_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            database_from_env({'INVENTORY_DB_ENGINE': 'oracle'}, Path('/srv'))
+        with self.assertRaises(ImproperlyConfigured):
+            database_from_env({'INVENTORY_SQLITE_BUSY_TIMEOUT': 'soon'}, Path('/srv'))
+        
+    def test_check_reports_active_sqlite_settings(self):
+        messages = check_database_profile(databases=['default'])
+        self.assertEqual([message.id for message in messages], ['inventory.I001'])
+        self.assertIn('busy_timeout=20000', messages[0].msg)
+        self.assertIn('transaction_mode=IMMEDIATE', messages[0].msg)
+        
+    def test_check_runs_without_the_database_tag(self):
+        # The in-memory test database stands in for a file that doesn't exist yet
+        self.assertEqual(check_database_profile(), [])
+        
+        with mock.patch('inventory.checks.sqlite_exists', return_value=True):
+            messages = check_database_profile()
+            with self.assertLogs('inventory.checks', 'INFO') as logs:
+                log_database_profile()
+        self.assertEqual([message.id for message in messages], ['inventory.I001'])
+        self.assertIn('busy_timeout=20000', logs.output[0])
+        
+    def test_check_reports_postgresql_without_connecting(self):
+        settings_dict = {'OPTIONS': {}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}
+        connection = mock.Mock(vendor='postgresql', alias='default', settings_dict=settings_dict)
+        with mock.patch('inventory.checks.connections', {'default': connection}):
+            messages = check_database_profile()
+        self.assertEqual([message.id for message in messages], ['inventory.I002', 'inventory.W002'])
+        connection.cursor.assert_not_called()
+        
+    def test_check_warns_about_unpooled_postgresql(self):
+        settings_dict = {'OPTIONS': {}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}
+        messages = postgresql_profile(mock.Mock(alias='default', settings_dict=settings_dict))
+        self.assertEqual([message.id for message in messages], ['inventory.I002', 'inventory.W002'])
+        
+        settings_dict['OPTIONS']['pool'] = {'min_size': 2, 'max_size': 8}
+        messages = postgresql_profile(mock.Mock(alias='default', settings_dict=settings_dict))
+        self.assertEqual([message.id for message in messages], ['inventory.I002'])
+        self.assertIn('max_size=8', messages[0].msg)
+
+
+@override_settings(INVENTORY_DB_REPLICAS=['replica1', 'replica2'])
+class ReplicaRouterTests(SimpleTestCase):
+    
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        
+    def reads(self, request, count=1):
+        with route_request(request):
+            return [self.router.db_for_read(InventoryItem) for _ in range(count)]
+        
+    def test_outside_requests_reads_are_not_routed(self):
+        self.assertIsNone(self.router.db_for_read(InventoryItem))
+        
+    def test_safe_requests_read_from_replicas_in_turn(self):
+        self.assertEqual(self.reads(self.factory.get('/'), 3), ['replica1', 'replica2', 'replica1'])
+        
+    def test_unsafe_requests_read_from_primary(self):
+        self.assertEqual(self.reads(self.factory.post('/')), ['default'])
+        
+    def test_reads_after_a_write_stay_on_primary(self):
+        with route_request(self.factory.get('/')):
+            self.assertEqual(self.router.db_for_read(InventoryItem), 'replica1')
+            self.assertEqual(self.router.db_for_write(InventoryItem), 'default')
+            self.assertEqual(self.router.db_for_read(InventoryItem), 'default')
+        
+        # The next request starts over
+        self.assertEqual(self.reads(self.factory.get('/')), ['replica2'])
+        
+    @override_settings(INVENTORY_DB_REPLICA_STRATEGY='lowest_lag')
+    def test_lowest_lag_strategy(self):
+        with mock.patch.object(self.router, 'measure_lag', side_effect={'replica1': 3.0, 'replica2': 0.5}.get):
+            self.assertEqual(self.reads(self.factory.get('/'), 2), ['replica2', 'replica2'])
+        
+    @override_settings(INVENTORY_DB_REPLICA_MAX_LAG=2)
+    def test_lagging_and_unreachable_replicas_are_skipped(self):
+        lags = {'replica1': 3.0, 'replica2': float('inf')}
+        with mock.patch.object(self.router, 'measure_lag', side_effect=lags.get):
+            self.assertEqual(self.reads(self.factory.get('/')), ['default'])
+        
+    @override_settings(INVENTORY_DB_REPLICA_STRATEGY='lowest_lag', INVENTORY_DB_REPLICA_LAG_INTERVAL=60)
+    def test_lag_is_remeasured_after_interval(self):
+        with mock.patch.object(self.router, 'measure_lag', return_value=0.0) as measure_lag:
+            self.reads(self.factory.get('/'), 3)
+        self.assertEqual(measure_lag.call_count, 2)
+        
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica1', 'inventory'))
+        self.assertIsNone(self.router.allow_migrate('default', 'inventory'))
+
+
+@override_settings(INVENTORY_DB_REPLICAS=['replica'])
+class ReplicaReadTests(TransactionTestCase):
+    """The primary test database and a SQLite file copied from it, standing in for a replica."""
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added once the test runner has set up the regular databases
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = {
+            **connections['default'].settings_dict,
+            'NAME': os.path.join(cls.replica_dir.name, 'replica.sqlite3'),
+        }
+        cls.databases = {'default', 'replica'}
+        
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.replica_dir.cleanup()
+        super().tearDownClass()
+        
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.item = InventoryItem.objects.create(
+            name='Test Item', quantity=10, price=Decimal('9.99'), user=self.user,
+        )
+        call_command('sync_sqlite_replicas', stdout=StringIO())
+        # Not replicated yet
+        InventoryItem.objects.filter(pk=self.item.pk).update(quantity=20)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('inventory-detail', args=[self.item.pk])
+        
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.client.get(self.url).data['quantity'], 10)
+        
+        call_command('sync_sqlite_replicas', stdout=StringIO())
+        self.assertEqual(self.client.get(self.url).data['quantity'], 20)
+        
+    def test_writes_go_to_primary(self):
+        response = self.client.patch(self.url, {'quantity': 30})
+        self.assertEqual(response.data['quantity'], 30)
+        
+        self.assertEqual(InventoryItem.objects.using('default').get(pk=self.item.pk).quantity, 30)
+        self.assertEqual(InventoryItem.objects.using('replica').get(pk=self.item.pk).quantity, 10)
+        self.assertEqual(self.client.get(self.url).data['quantity'], 10)
+        
+    def test_category_cache_is_filled_from_primary(self):
+        get_cache().clear()
+        url = reverse('category-list')
+        self.assertEqual(self.client.get(url).data['results'], [])
+        
+        # Bumps the category version; the replica hasn't seen the row yet
+        Category.objects.create(name='Electronics')
+        names = [category['name'] for category in self.client.get(url).data['results']]
+        self.assertEqual(names, ['Electronics'])
+        
+    def test_sync_refuses_the_primary(self):
+        with self.assertRaises(CommandError):
+            call_command('sync_sqlite_replicas', database=['default'], stdout=StringIO())
+
+
+@override_settings(INVENTORY_SHARDS=['shard1', 'shard2'], INVENTORY_SHARD_PLACEMENT_TTL=0)
+class ShardingTests(TransactionTestCase):
+    """The test database as the global database, with two SQLite files as shards."""
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added once the test runner has set up the regular databases
+        cls.shard_dir = tempfile.TemporaryDirectory()
+        for alias in ('shard1', 'shard2'):
+            connections.settings[alias] = {
+                **connections['default'].settings_dict,
+                'NAME': os.path.join(cls.shard_dir.name, f'{alias}.sqlite3'),
+            }
+        cls.databases = {'default', 'shard1', 'shard2'}
+        for alias in ('shard1', 'shard2'):
+            call_command('migrate', database=alias, skip_checks=True, verbosity=0)
+        
+    @classmethod
+    def tearDownClass(cls):
+        for alias in ('shard1', 'shard2'):
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.shard_dir.cleanup()
+        placement_cache.clear()
+        super().tearDownClass()
+        
+    def create_tenant(self, username, shard):
+        user = User.objects.create_user(username=username, password='testpassword123')
+        set_placement(user.pk, shard)
+        client = APIClient()
+        client.force_authenticate(user)
+        return user, client
+        
+    def setUp(self):
+        self.category = Category.objects.create(name='Tools')
+        self.alice, self.alice_client = self.create_tenant('alice', 'shard1')
+        self.bob, self.bob_client = self.create_tenant('bob', 'shard2')
+        
+    def create_item(self, client, name, quantity=5):
+        response = client.post(reverse('inventory-list'), {
+            'name': name, 'quantity': quantity, 'price': '2.50', 'category': self.category.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+        
+    def test_hash_placement_is_stable_and_moves_few_users(self):
+        before = {user_id: hash_shard(user_id, ['shard1', 'shard2']) for user_id in range(1, 601)}
+        after = {user_id: hash_shard(user_id, ['shard1', 'shard2', 'shard3']) for user_id in range(1, 601)}
+        
+        self.assertEqual(before, {user_id: hash_shard(user_id, ['shard1', 'shard2']) for user_id in before})
+        moved = [user_id for user_id in before if before[user_id] != after[user_id]]
+        self.assertTrue(all(after[user_id] == 'shard3' for user_id in moved))
+        self.assertAlmostEqual(len(moved) / len(before), 1 / 3, delta=0.08)
+        
+    def test_new_users_are_placed_and_copied_to_every_shard(self):
+        user = User.objects.create_user(username='carol', password='testpassword123')
+        
+        self.assertEqual(get_placement(user.pk).database, hash_shard(user.pk))
+        for alias in ('shard1', 'shard2'):
+            self.assertTrue(User.objects.using(alias).filter(username='carol').exists())
+            self.assertTrue(Category.objects.using(alias).filter(name='Tools').exists())
+        
+    def test_tenant_data_lives_on_its_shard(self):
+        alice_item = self.create_item(self.alice_client, 'Hammer')
+        self.create_item(self.bob_client, 'Saw')
+        response = self.alice_client.post(reverse('inventory-adjust', args=[alice_item]), {'delta': -2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        self.assertEqual(list(InventoryItem.objects.using('shard1').values_list('name', flat=True)), ['Hammer'])
+        self.assertEqual(list(InventoryItem.objects.using('shard2').values_list('name', flat=True)), ['Saw'])
+        self.assertFalse(InventoryItem.objects.using('default').exists())
+        self.assertEqual(InventoryChangeLog.objects.using('shard1').count(), 1)
+        self.assertGreaterEqual(alice_item, 1 << ID_RANGE_BITS)
+        
+        response = self.alice_client.get(reverse('inventory-list'))
+        self.assertEqual([item['name'] for item in response.data['results']], ['Hammer'])
+        response = self.alice_client.get(reverse('changes-list'))
+        self.assertEqual([(log['item_name'], log['username']) for log in response.data['results']],
+                         [('Hammer', 'alice')])
+        response = self.alice_client.get(reverse('inventory-summary'))
+        self.assertEqual(response.data['total_units'], 3)
+        self.assertEqual(response.data['categories'][0]['category_name'], 'Tools')
+        
+    def test_conditional_update_on_a_shard(self):
+        url = reverse('inventory-detail', args=[self.create_item(self.alice_client, 'Hammer')])
+        etag = self.alice_client.get(url)['ETag']
+        freshness_queryset = InventoryItemViewSet.get_freshness_queryset
+        locked_in = []
+        
+        def get_freshness_queryset(view, lock=False):
+            locked_in.append(connections['shard1'].in_atomic_block)
+            return freshness_queryset(view, lock)
+        
+        with mock.patch.object(InventoryItemViewSet, 'get_freshness_queryset', get_freshness_queryset):
+            response = self.alice_client.patch(url, {'quantity': 7}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The If-Match check and the save share the shard's transaction
+        self.assertEqual(locked_in, [True])
+        response = self.alice_client.patch(url, {'quantity': 9}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        
+        self.assertEqual(InventoryItem.objects.using('shard1').get().quantity, 7)
+        
+    def test_bulk_writes_on_a_shard(self):
+        response = self.alice_client.post(reverse('inventory-bulk'), [
+            {'name': 'Hammer', 'quantity': 5, 'price': '2.50'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.alice_client.patch(reverse('inventory-bulk'), [
+            {'id': response.data[0]['id'], 'quantity': 3}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        self.assertEqual(InventoryItem.objects.using('shard1').get().quantity, 3)
+        self.assertEqual(InventoryChangeLog.objects.using('shard1').get().previous_quantity, 5)
+        
+    def test_shards_allocate_ids_from_separate_ranges(self):
+        alice_item = self.create_item(self.alice_client, 'Hammer')
+        bob_item = self.create_item(self.bob_client, 'Saw')
+        
+        self.assertEqual(alice_item >> ID_RANGE_BITS, 1)
+        self.assertEqual(bob_item >> ID_RANGE_BITS, 2)
+        
+    def test_unplaced_users_stay_on_the_global_database(self):
+        TenantPlacement.objects.filter(user=self.alice).delete()
+        placement_cache.clear()
+        self.create_item(self.alice_client, 'Hammer')
+        
+        self.assertEqual(InventoryItem.objects.using('default').get().name, 'Hammer')
+        
+    def test_rebalance_moves_one_tenant(self):
+        item_id = self.create_item(self.alice_client, 'Hammer')
+        self.alice_client.post(reverse('inventory-adjust', args=[item_id]), {'delta': 4})
+        self.create_item(self.bob_client, 'Saw')
+        original = InventoryItem.objects.using('shard1').get()
+        
+        output = StringIO()
+        call_command('rebalance_shards', usernames=['alice'], to='shard2', grace=0, stdout=output)
+        
+        self.assertIn('Moved alice from shard1 to shard2: 1 inventory items, 1 inventory change logs', output.getvalue())
+        self.assertEqual(get_placement(self.alice.pk), ('shard2', False))
+        self.assertFalse(InventoryItem.objects.using('shard1').exists())
+        self.assertFalse(InventoryChangeLog.objects.using('shard1').exists())
+        moved = InventoryItem.objects.using('shard2').get(user=self.alice)
+        self.assertEqual((moved.pk, moved.date_added, moved.last_updated, moved.quantity),
+                         (original.pk, original.date_added, original.last_updated, 9))
+        self.assertEqual(self.alice_client.get(reverse('inventory-detail', args=[item_id])).data['quantity'], 9)
+        self.assertEqual(self.alice_client.get(reverse('inventory-summary')).data['total_units'], 9)
+        self.assertEqual(len(self.alice_client.get(reverse('changes-list')).data['results']), 1)
+        self.assertEqual(len(self.bob_client.get(reverse('inventory-list')).data['results']), 1)
+        
+    def test_rebalance_moves_unplaced_users_to_their_hashed_shard(self):
+        TenantPlacement.objects.filter(user=self.alice).delete()
+        placement_cache.clear()
+        self.create_item(self.alice_client, 'Hammer')
+        
+        call_command('rebalance_shards', grace=0, stdout=StringIO())
+        
+        shard = hash_shard(self.alice.pk)
+        self.assertEqual(get_placement(self.alice.pk).database, shard)
+        self.assertEqual(InventoryItem.objects.using(shard).get(user=self.alice).name, 'Hammer')
+        self.assertFalse(InventoryItem.objects.using('default').exists())
+        
+    def test_writes_are_refused_while_moving(self):
+        item_id = self.create_item(self.alice_client, 'Hammer')
+        set_placement(self.alice.pk, 'shard1', moving=True)
+        
+        response = self.alice_client.patch(reverse('inventory-detail', args=[item_id]), {'quantity': 1})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.alice_client.get(reverse('inventory-detail', args=[item_id])).data['quantity'], 5)
+        
+    def test_deleting_a_user_deletes_their_shard_data(self):
+        self.create_item(self.alice_client, 'Hammer')
+        self.alice.delete()
+        
+        self.assertFalse(User.objects.using('shard1').filter(username='alice').exists())
+        self.assertFalse(InventoryItem.objects.using('shard1').exists())
+        self.assertFalse(InventorySummary.objects.using('shard1').exists())
+
+
+class BenchTests(TransactionTestCase):
+    def route(self, **metrics):
+        return {'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 30.0, 'requests_per_second': 100.0,
+                'queries_per_request': 2.0, **metrics}
+        
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual((percentile(values, 50), percentile(values, 95), percentile(values, 99)), (50, 95, 99))
+        self.assertEqual(percentile([7], 99), 7)
+        
+    def test_compare_flags_regressions_beyond_threshold(self):
+        baseline = {'routes': {'inventory-list': self.route(), 'users-me': self.route()}}
+        results = {'routes': {
+            'inventory-list': self.route(p95_ms=23.0, requests_per_second=70.0),
+            'users-me': self.route(queries_per_request=3.0),
+            'token-obtain': self.route(p50_ms=1000.0),
+        }}
+        
+        regressions = compare(results, baseline, threshold=20)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('inventory-list: requests_per_second 100.0 -> 70.0'))
+        self.assertEqual(regressions[1], 'users-me: queries_per_request 2.0 -> 3.0')
+        self.assertEqual(compare(baseline, baseline, threshold=0), [])
+        
+    def test_bench_in_place(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench', in_place=True, users=2, categories=2, items=3, changes=2, requests=4, warmup=2,
+                         concurrency=1, routes=['inventory-list', 'inventory-create', 'users-me'], output=output,
+                         stdout=StringIO())
+            with open(output) as file:
+                results = json.load(file)
+            
+            self.assertEqual(list(results['routes']), ['inventory-list', 'inventory-create', 'users-me'])
+            for route in results['routes'].values():
+                self.assertEqual((route['requests'], route['errors']), (4, 0))
+            self.assertEqual(results['routes']['inventory-list']['queries_per_request'], 1)
+            self.assertEqual(InventoryItem.objects.count(), 2 * 3 + 6)
+            self.assertEqual(InventoryChangeLog.objects.count(), 2 * 3 * 2)
+            
+            with self.assertRaises(CommandError):
+                call_command('bench', in_place=True, users=1, items=1, requests=1, routes=['users-me'],
+                             compare=output, stdout=StringIO())
+
+
+class RequestTimingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        category = Category.objects.create(name='Tools')
+        for number in range(3):
+            InventoryItem.objects.create(name=f'Item {number}', quantity=5, price=Decimal('1.00'),
+                                         user=self.user, category=category)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+        
+    def server_timing(self, response):
+        metrics = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            metrics[name] = dict(param.split('=', 1) for param in params)
+        return metrics
+        
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('inventory-list'))
+        
+        metrics = self.server_timing(response)
+        self.assertEqual(list(metrics), ['db', 'db-slowest', 'auth', 'serializer', 'view', 'render', 'total'])
+        self.assertEqual(metrics['db']['desc'], f'"{len(queries)} queries"')
+        self.assertLessEqual(float(metrics['view']['dur']), float(metrics['total']['dur']))
+        self.assertLessEqual(float(metrics['db-slowest']['dur']), float(metrics['db']['dur']))
+        
+    def test_async_views_report_timing(self):
+        with override_settings(ROOT_URLCONF='inventory_api.asgi_urls'):
+            response = async_to_sync(self.async_client.get)(reverse('inventory-list'), headers=self.headers)
+        
+        self.assertEqual(list(self.server_timing(response)),
+                         ['db', 'db-slowest', 'auth', 'serializer', 'view', 'render', 'total'])
+        
+    @override_settings(INVENTORY_SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('inventory.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('inventory-list'))
+        
+        self.assertTrue(logs.output[0].startswith('WARNING:inventory.instrumentation:Slow request: GET /api/inventory/'))
+        timing = logs.records[0].request_timing
+        self.assertEqual((timing['method'], timing['view'], timing['status']), ('GET', 'inventory-list', 200))
+        self.assertGreater(timing['queries'], 0)
+        self.assertTrue(timing['slowest_sql'].startswith('SELECT'))
+        self.assertEqual(timing['repeated_queries'], [])
+        
+    @override_settings(INVENTORY_REPEATED_QUERY_THRESHOLD=3)
+    def test_repeated_queries_are_logged(self):
+        with profile_request() as profile:
+            for item in InventoryItem.objects.all():
+                # One query per item
+                InventoryChangeLog.objects.filter(inventory_item=item).exists()
+        
+        with self.assertLogs('inventory.instrumentation', 'WARNING') as logs:
+            report(RequestFactory().get('/api/inventory/'), HttpResponse(), profile)
+        
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('Repeated query in GET /api/inventory/, 3 times: SELECT', logs.output[0])
+        self.assertEqual(logs.records[0].request_timing['repeated_queries'][0]['count'], 3)
+        
+    def test_nested_phases_count_once(self):
+        with phase('serializer'):
+            # No request being profiled
+            pass
+        with profile_request() as profile:
+            with phase('serializer'):
+                with phase('serializer'):
+                    time.sleep(0.01)
+                profile.enter('view')
+        
+        self.assertEqual(set(profile.phases), {'serializer', 'view'})
+        self.assertLess(profile.phases['serializer'], profile.duration)
+        self.assertGreaterEqual(profile.phases['serializer'], 0.01)
+        
+    @override_settings(INVENTORY_REQUEST_TIMING=False)
+    def test_can_be_turned_off(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+        self.assertNotIn('Server-Timing', client.get(reverse('inventory-list')))
+
+
+@override_settings(INVENTORY_METRICS_TOKEN='secret')
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.item = InventoryItem.objects.create(name='Item', quantity=5, price=Decimal('1.00'), user=self.user)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+        
+    def scrape(self):
+        response = APIClient().get(reverse('metrics'), headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        values = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                series, value = line.rsplit(' ', 1)
+                values[series] = float(value)
+        return values
+        
+    def test_requests_are_counted_by_viewset_and_action(self):
+        list_series = 'inventory_http_requests_total{viewset="InventoryItemViewSet",action="list",method="GET",status="200"}'
+        levels_series = 'inventory_http_request_duration_seconds_count{viewset="InventoryItemViewSet",action="levels"}'
+        before = self.scrape()
+        self.client.get(reverse('inventory-list'))
+        self.client.get(reverse('inventory-list'))
+        self.client.get(reverse('inventory-levels'))
+        self.client.get(reverse('user-me'))
+        APIClient().post(reverse('user-register'), {'username': 'new', 'password': 'newpassword123'})
+        with override_settings(ROOT_URLCONF='inventory_api.asgi_urls'):
+            async_to_sync(self.async_client.get)(reverse('inventory-list'), headers=self.headers)
+        after = self.scrape()
+        
+        def increase(series):
+            return after.get(series, 0) - before.get(series, 0)
+        
+        self.assertEqual(increase(list_series), 3)
+        self.assertEqual(increase(levels_series), 1)
+        self.assertEqual(increase('inventory_http_request_duration_seconds_bucket'
+                                  '{viewset="InventoryItemViewSet",action="levels",le="+Inf"}'), 1)
+        self.assertEqual(increase('inventory_http_requests_total'
+                                  '{viewset="UserViewSet",action="me",method="GET",status="200"}'), 1)
+        self.assertEqual(increase('inventory_http_requests_total'
+                                  '{viewset="UserViewSet",action="register",method="POST",status="201"}'), 1)
+        self.assertGreaterEqual(increase('inventory_db_queries_total{viewset="InventoryItemViewSet",action="list"}'), 3)
+        self.assertGreaterEqual(increase('inventory_cache_requests_total{cache="users",result="hit"}'), 1)
+        # The scrape itself
+        self.assertEqual(after['inventory_http_requests_in_flight'], 1)
+        self.assertEqual(after['inventory_workers'], 1)
+        
+    def test_histogram_buckets_are_cumulative(self):
+        metrics = Registry()
+        for value in (0.003, 0.3, 0.3, 20):
+            metrics.observe('inventory_http_request_duration_seconds', (('viewset', 'V'), ('action', 'a')), value)
+        
+        lines = exposition(metrics.snapshot()).splitlines()
+        self.assertIn('inventory_http_request_duration_seconds_bucket{viewset="V",action="a",le="0.005"} 1', lines)
+        self.assertIn('inventory_http_request_duration_seconds_bucket{viewset="V",action="a",le="0.5"} 3', lines)
+        self.assertIn('inventory_http_request_duration_seconds_bucket{viewset="V",action="a",le="+Inf"} 4', lines)
+        self.assertIn('inventory_http_request_duration_seconds_count{viewset="V",action="a"} 4', lines)
+        
+    def test_threads_that_exit_keep_their_counts(self):
+        metrics = Registry()
+        
+        def work():
+            for _ in range(1000):
+                metrics.inc('inventory_test_total')
+        
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(metrics.snapshot().counters[('inventory_test_total', ())], 4000)
+        self.assertEqual(metrics._active, [])
+        
+    @skipUnless(hasattr(os, 'fork'), 'Needs fork()')
+    def test_worker_processes_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(INVENTORY_METRICS_DIR=directory):
+            registry.inc('inventory_test_total', amount=2)
+            pid = os.fork()
+            if pid == 0:
+                # A pre-forked worker: starts from zero and exits
+                registry.inc('inventory_test_total', amount=5)
+                registry.add_gauge('inventory_http_requests_in_flight', amount=7)
+                registry.write()
+                os._exit(0)
+            os.waitpid(pid, 0)
+            with mock.patch.object(registry, 'start'):
+                total = registry.collect()
+        
+        self.assertEqual(total.counters[('inventory_test_total', ())],
+                         registry.snapshot().counters[('inventory_test_total', ())] + 5)
+        # Only this process is alive
+        self.assertEqual(total.gauges[('inventory_workers', ())], 1)
+        self.assertEqual(total.gauges.get(('inventory_http_requests_in_flight', ()), 0),
+                         registry.snapshot().gauges.get(('inventory_http_requests_in_flight', ()), 0))
+        
+    def test_exited_workers_are_taken_over(self):
+        started = process_start_time(os.getpid())
+        if started is None:
+            self.skipTest('Needs /proc')
+        metrics = Registry()
+        with tempfile.TemporaryDirectory() as directory, override_settings(INVENTORY_METRICS_DIR=directory):
+            # This pid, from before it was reused by this process
+            for pid, start in ((os.getpid(), started - 1), (os.getpid(), started - 2)):
+                Path(directory, f'{pid}-{start}.json').write_text(json.dumps({
+                    'pid': pid, 'started': start, 'counters': [['inventory_test_total', [], 3]],
+                    'gauges': [['inventory_http_requests_in_flight', [], 1]], 'histograms': [],
+                }))
+            Path(directory, f'{os.getpid()}-{started - 1}.1.tmp').write_text('{')
+            
+            with mock.patch.object(metrics, 'start'):
+                self.assertEqual(metrics.collect().gauges[('inventory_workers', ())], 1)
+                metrics.take_over_exited()
+                
+                self.assertEqual(os.listdir(directory), [f'{os.getpid()}-{started}.json'])
+                total = metrics.collect()
+        self.assertEqual(total.counters[('inventory_test_total', ())], 6)
+        self.assertNotIn(('inventory_http_requests_in_flight', ()), total.gauges)
+        
+    def test_token(self):
+        client = APIClient()
+        self.assertEqual(client.get(reverse('metrics')).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = client.get(reverse('metrics'), headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        with override_settings(INVENTORY_METRICS_TOKEN=None):
+            self.assertEqual(client.get(reverse('metrics')).status_code, status.HTTP_404_NOT_FOUND)
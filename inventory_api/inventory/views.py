@@ -1,13 +1,112 @@
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import F
+from rest_framework.exceptions import NotFound
+from decimal import Decimal
+from django.conf import settings
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.db.models import F, Sum, Count
+from django.db.models.functions import TruncWeek, TruncMonth
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth.models import User
-from .models import Category, InventoryItem, InventoryChangeLog
+from .models import (Category, InventoryItem, InventoryChangeLog, ArchivedChangeLog, InventorySummary,
+                     ChangeLogDailyStat, StockAdjustmentError)
 from .serializers import (UserSerializer, CategorySerializer, 
-                         InventoryItemSerializer, InventoryChangeLogSerializer)
+                         InventoryItemSerializer, InventoryChangeLogSerializer,
+                         StockAdjustmentSerializer, BulkStockAdjustmentRequestSerializer,
+                         InventoryTotalsSerializer, ChangeStatsQuerySerializer,
+                         ChangeStatsSerializer)
 from .permissions import IsOwnerOrReadOnly
+from .pagination import InventoryItemPagination, ChangeLogPagination
+from .search import FullTextSearchFilter
+from .renderers import CSVRenderer, NDJSONRenderer
+from .export import stream_export
+from .rows import inventory_converter, change_log_converter
+from .sparse import requested_fields, narrow_queryset
+from .write_behind import log_change
+from .sharding import set_tenant
+from .instrumentation import phase
+from .cache import cached_category_response
+from .conditional import (is_conditional, item_etag, page_etag, set_validators,
+                          precondition_response)
+
+class SparseFieldsMixin:
+    """
+    ``?fields=`` / ``?exclude=`` on reads (see sparse.py): the serializer
+    drops the other fields and the queryset stops loading, and joining,
+    what only they need.
+    """
+    sparse_actions = ('list', 'retrieve')
+    # Model fields read outside the serializer, such as for validators
+    sparse_required_fields = ()
+    
+    def get_sparse_fields(self):
+        if self.action not in self.sparse_actions:
+            return None
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = requested_fields(self.request, list(self.get_serializer_class()().fields))
+        return self._sparse_fields
+    
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            child = getattr(serializer, 'child', serializer)
+            for name in [name for name in child.fields if name not in fields]:
+                child.fields.pop(name)
+        return serializer
+    
+    def filter_queryset(self, queryset):
+        return self.narrow_queryset(super().filter_queryset(queryset))
+    
+    def narrow_queryset(self, queryset):
+        if self.get_sparse_fields() is None:
+            return queryset
+        return narrow_queryset(queryset, self.get_serializer().fields.values(),
+                               self.get_required_fields(queryset))
+    
+    def get_required_fields(self, queryset):
+        # Fields the paginator reads from the boundary rows of a page
+        ordering = queryset.query.order_by or getattr(self.pagination_class, 'ordering', ())
+        ordering = [field.lstrip('-') for field in ordering if isinstance(field, str)]
+        return ['id', *self.sparse_required_fields,
+                *[name for name in ordering if name not in queryset.query.annotations]]
+
+class TenantMixin:
+    """Sends the queries for the user's inventory data to their shard (see sharding.py)."""
+    
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        set_tenant(request.user)
+
+class FastListMixin(SparseFieldsMixin):
+    """
+    With INVENTORY_FAST_LISTS on, list pages are fetched as ``values_list()``
+    rows and converted by ``row_converter`` instead of going through model
+    instances and the serializer. The output is the same either way.
+    """
+    row_converter = None
+    
+    def use_fast_lists(self):
+        return getattr(settings, 'INVENTORY_FAST_LISTS', False)
+    
+    def get_list_queryset(self, queryset):
+        if not self.use_fast_lists():
+            return queryset
+        return self.get_row_converter().values_list(queryset, self.get_required_fields(queryset))
+    
+    def serialize_page(self, page):
+        if not self.use_fast_lists():
+            return self.get_serializer(page, many=True).data
+        with phase('serializer'):
+            return list(self.get_row_converter().to_dicts(page))
+    
+    def get_row_converter(self):
+        fields = self.get_sparse_fields()
+        converter = self.row_converter()
+        return converter if fields is None else converter.subset(fields)
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
@@ -26,7 +125,7 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all().order_by('id')  # Add ordering here
     serializer_class = CategorySerializer
     filter_backends = [filters.SearchFilter]
@@ -38,6 +137,12 @@ class CategoryViewSet(viewsets.ModelViewSet):
         else:
             permission_classes = [permissions.IsAdminUser]
         return [permission() for permission in permission_classes]
+    
+    def list(self, request, *args, **kwargs):
+        return cached_category_response(request, lambda: super(CategoryViewSet, self).list(request, *args, **kwargs))
+    
+    def retrieve(self, request, *args, **kwargs):
+        return cached_category_response(request, lambda: super(CategoryViewSet, self).retrieve(request, *args, **kwargs))
 class InventoryItemViewSet(viewsets.ModelViewSet):
     serializer_class = InventoryItemSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -48,24 +153,102 @@ class InventoryItemViewSet(viewsets.ModelViewSet):
     
       # Add ordering here
    
-class InventoryItemViewSet(viewsets.ModelViewSet):
+class InventoryItemViewSet(TenantMixin, FastListMixin, viewsets.ModelViewSet):
     serializer_class = InventoryItemSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    row_converter = staticmethod(inventory_converter)
+    sparse_actions = ('list', 'retrieve', 'levels', 'low_stock')
+    # ETag and Last-Modified
+    sparse_required_fields = ('last_updated',)
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category']
-    search_fields = ['name', 'description']
     ordering_fields = ['name', 'price', 'quantity', 'date_added']
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_class = InventoryItemPagination
     
     def get_queryset(self):
-        return InventoryItem.objects.filter(user=self.request.user).order_by('id')
+        return (InventoryItem.objects.filter(user=self.request.user)
+                .select_related('category').order_by('id'))
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
     
-    def perform_update(self, serializer):
-        # Get the original item
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if is_conditional(request):
+            # Page through (id, last_updated) only; unchanged pages are
+            # answered without loading or serializing the items.
+            paginator = self.pagination_class()
+            rows = paginator.paginate_queryset(self.get_validator_queryset(queryset), request, self)
+            not_modified = self.page_preconditions(request, rows, paginator)
+            if not_modified is not None:
+                return not_modified
+        return self.page_response(self.paginate_queryset(self.get_list_queryset(queryset)))
+    
+    def retrieve(self, request, *args, **kwargs):
+        precondition_failed = self.check_item_preconditions(request)
+        if precondition_failed is not None:
+            return precondition_failed
         item = self.get_object()
-        old_quantity = item.quantity
+        return self.item_response(self.get_serializer(item).data, item)
+    
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        # On the tenant's database, see sharding.py
+        with transaction.atomic(using=self.get_queryset().db):
+            # Locks the row so it can't change between the If-Match check and the save
+            precondition_failed = self.check_item_preconditions(request, lock=True)
+            if precondition_failed is not None:
+                return precondition_failed
+            item = self.get_object()
+            serializer = self.get_serializer(item, data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
+        return self.item_response(serializer.data, item)
+    
+    def check_item_preconditions(self, request, lock=False):
+        if not is_conditional(request):
+            return None
+        return self.item_preconditions(request, self.get_freshness_queryset(lock).first())
+    
+    def get_validator_queryset(self, queryset):
+        return queryset.select_related(None).only('id', 'last_updated')
+    
+    def get_freshness_queryset(self, lock=False):
+        pk = str(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        if not pk.isdigit():
+            raise NotFound()
+        queryset = self.get_validator_queryset(self.get_queryset()).filter(pk=pk)
+        if lock:
+            queryset = queryset.select_for_update()
+        return queryset.values_list('last_updated', flat=True)
+    
+    def page_preconditions(self, request, rows, paginator):
+        # Last-Modified can't reflect deletions, so only the ETag is
+        # used to validate lists.
+        return precondition_response(
+            request, page_etag(request, rows, paginator.has_next, paginator.has_previous))
+    
+    def item_preconditions(self, request, last_updated):
+        if last_updated is None:
+            # Let get_object() raise the usual 404
+            return None
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return precondition_response(request, item_etag(pk, last_updated), last_updated)
+    
+    def page_response(self, page):
+        response = self.get_paginated_response(self.serialize_page(page))
+        return set_validators(
+            response,
+            page_etag(self.request, page, self.paginator.has_next, self.paginator.has_previous),
+            max((item.last_updated for item in page), default=None),
+        )
+    
+    def item_response(self, data, item):
+        return set_validators(Response(data), item_etag(item.pk, item.last_updated), item.last_updated)
+    
+    def perform_update(self, serializer):
+        # The instance was loaded by get_object() and still holds the original values
+        old_quantity = serializer.instance.quantity
         
         # Save the updated item
         updated_item = serializer.save()
@@ -77,16 +260,128 @@ class InventoryItemViewSet(viewsets.ModelViewSet):
             if new_quantity == old_quantity:
                 change_type = 'adjustment'
                 
-            InventoryChangeLog.objects.create(
+            log_change(InventoryChangeLog(
                 inventory_item=updated_item,
                 user=self.request.user,
                 previous_quantity=old_quantity,
                 new_quantity=new_quantity,
                 change_type=change_type
+            ))
+    
+    def get_adjustment_data(self, item, change_log):
+        data = InventoryItemSerializer(item, context=self.get_serializer_context()).data
+        data['change_log'] = InventoryChangeLogSerializer(change_log).data
+        return data
+    
+    @action(detail=True, methods=['post'], serializer_class=StockAdjustmentSerializer)
+    def adjust(self, request, pk=None):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if not pk.isdigit():
+            raise NotFound()
+        try:
+            item, change_log = self.get_queryset().adjust_quantity(
+                pk, serializer.validated_data['delta'], request.user,
+                change_type=serializer.validated_data.get('change_type'),
+                allow_negative=serializer.validated_data['allow_negative'],
             )
+        except StockAdjustmentError as exc:
+            if exc.errors[0] == 'not_found':
+                raise NotFound()
+            return Response({'detail': 'Insufficient stock for this adjustment.'},
+                            status=status.HTTP_409_CONFLICT)
+        
+        return Response(self.get_adjustment_data(item, change_log))
+    
+    def get_bulk_max_items(self):
+        return getattr(settings, 'INVENTORY_BULK_MAX_ITEMS', 1000)
+    
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        # POST creates every item in the payload, PATCH partially updates
+        # existing items identified by their ``id``.
+        if request.method == 'POST':
+            serializer = self.get_serializer(data=request.data, many=True,
+                                             max_length=self.get_bulk_max_items())
+            serializer.is_valid(raise_exception=True)
+            serializer.save(user=request.user)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        
+        queryset = self.get_queryset()
+        serializer = self.get_serializer(queryset, data=request.data, many=True,
+                                         partial=True, max_length=self.get_bulk_max_items())
+        with transaction.atomic(using=queryset.db):
+            # Validation locks the items until they are saved
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['post'], serializer_class=BulkStockAdjustmentRequestSerializer)
+    def bulk_adjust(self, request):
+        # Either {"adjustments": [...], "allow_negative": ...} or the bare
+        # list of adjustments; errors come back in the same shape.
+        bare = isinstance(request.data, list)
+        serializer = self.get_serializer(data={'adjustments': request.data} if bare else request.data,
+                                         max_length=self.get_bulk_max_items())
+        if not serializer.is_valid():
+            errors = serializer.errors
+            if bare:
+                errors = errors['adjustments']
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        adjustments = [(entry['id'], entry['delta'], entry.get('change_type'))
+                       for entry in serializer.validated_data['adjustments']]
+        try:
+            items, change_logs = self.get_queryset().adjust_quantities(
+                adjustments, request.user, allow_negative=serializer.validated_data['allow_negative'])
+        except StockAdjustmentError as exc:
+            messages = {
+                'not_found': 'Item not found.',
+                'insufficient_stock': 'Insufficient stock for this adjustment.',
+            }
+            errors = [{} for _ in adjustments]
+            for index, code in exc.errors.items():
+                errors[index] = {'id': [messages[code]]}
+            return Response(errors if bare else {'adjustments': errors}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response([self.get_adjustment_data(item, change_log)
+                         for item, change_log in zip(items, change_logs)])
+    
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        # Every item matching the list filters, streamed; ?format=csv|ndjson
+        queryset = self.filter_queryset(self.get_queryset())
+        return stream_export(queryset, inventory_converter(), request.accepted_renderer.format, 'inventory')
+    
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        # Served from the rollup table: one row per category, however many items
+        categories = list(InventorySummary.objects.filter(user=request.user, sku_count__gt=0)
+                          .select_related('category').order_by('category_id'))
+        totals = {
+            'sku_count': sum(row.sku_count for row in categories),
+            'total_units': sum(row.total_units for row in categories),
+            'total_value': sum((row.total_value for row in categories), Decimal('0')),
+            'categories': categories,
+        }
+        return Response(InventoryTotalsSerializer(totals).data)
+    
+    @action(detail=False, methods=['get'])
+    def low_stock(self, request):
+        # Matches the condition of the item_low_stock_idx partial index
+        queryset = self.filter_queryset(self.get_queryset()).filter(quantity__lte=F('reorder_point'))
+        page = self.paginate_queryset(self.get_list_queryset(queryset))
+        return self.get_paginated_response(self.serialize_page(page))
     
     @action(detail=False, methods=['get'])
     def levels(self, request):
+        queryset = self.get_list_queryset(self.get_levels_queryset(request))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.serialize_page(page))
+            
+        return Response(self.serialize_page(queryset))
+    
+    def get_levels_queryset(self, request):
         queryset = self.get_queryset()
         
         # Filter for low stock if requested
@@ -105,22 +400,109 @@ class InventoryItemViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(price__gte=float(min_price))
         if max_price:
             queryset = queryset.filter(price__lte=float(max_price))
-        
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-            
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.narrow_queryset(queryset)
 
-class InventoryChangeLogViewSet(viewsets.ReadOnlyModelViewSet):
+class InventoryChangeLogViewSet(TenantMixin, FastListMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = InventoryChangeLogSerializer
+    row_converter = staticmethod(change_log_converter)
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['inventory_item', 'change_type']
     ordering_fields = ['timestamp']
     ordering = ['-timestamp']  # Default to most recent first
+    pagination_class = ChangeLogPagination
     
     def get_queryset(self):
         # Return only change logs for items owned by the current user
-        return InventoryChangeLog.objects.filter(inventory_item__user=self.request.user)
\ No newline at end of file
+        return (InventoryChangeLog.objects.filter(owner=self.request.user)
+                .select_related('user', 'inventory_item')
+                .only('id', 'inventory_item__name', 'user__username', 'previous_quantity',
+                      'new_quantity', 'change_type', 'timestamp'))
+    
+    def get_archived_queryset(self):
+        return (ArchivedChangeLog.objects.filter(owner=self.request.user)
+                .select_related('user', 'inventory_item')
+                .only('id', 'inventory_item__name', 'user__username', 'previous_quantity',
+                      'new_quantity', 'change_type', 'timestamp'))
+    
+    def include_archived(self):
+        return self.request.query_params.get('include_archived', '').lower() in ('1', 'true', 'yes')
+    
+    def get_page_querysets(self, queryset, archived=None):
+        if archived is None:
+            return [self.get_list_queryset(queryset)]
+        # The archived logs replace the checkpoints summarizing them
+        return [self.get_list_queryset(queryset.exclude(change_type=InventoryChangeLog.CHECKPOINT)),
+                self.get_list_queryset(archived)]
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        archived = self.filter_queryset(self.get_archived_queryset()) if self.include_archived() else None
+        page = self.paginator.paginate_querysets(self.get_page_querysets(queryset, archived), request, self)
+        return self.get_paginated_response(self.serialize_page(page))
+    
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        # Every change log matching the list filters, streamed; ?format=csv|ndjson
+        queryset = self.filter_queryset(self.get_queryset())
+        return stream_export(queryset, change_log_converter(), request.accepted_renderer.format, 'changes')
+    
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        Net unit movement per period and change type.
+        
+        Completed days are read from the daily rollup table; the current,
+        still-changing day is aggregated from the change logs themselves.
+        """
+        params = ChangeStatsQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        bucket = params.validated_data['bucket']
+        start, end = params.validated_data['from'], params.validated_data['to']
+        today = timezone.localdate()
+        
+        filters = {}
+        for name in ('inventory_item', 'category', 'change_type'):
+            if name in params.validated_data:
+                filters[name] = params.validated_data[name]
+        
+        totals = {}
+        
+        def add(period, change_type, net_units, changes):
+            row = totals.setdefault((period, change_type), [0, 0])
+            row[0] += net_units
+            row[1] += changes
+        
+        if start < today:
+            truncate = {'day': F('day'), 'week': TruncWeek('day'), 'month': TruncMonth('day')}[bucket]
+            rows = (ChangeLogDailyStat.objects
+                    .filter(owner=request.user, day__gte=start, day__lte=min(end, today - timedelta(days=1)),
+                            **filters)
+                    .annotate(period=truncate).order_by()
+                    .values('period', 'change_type')
+                    .annotate(net=Sum('net_units'), changes=Sum('change_count')))
+            for row in rows:
+                add(row['period'], row['change_type'], row['net'], row['changes'])
+        
+        if start <= today <= end:
+            if 'category' in filters:
+                filters['inventory_item__category'] = filters.pop('category')
+            day_start = timezone.make_aware(datetime.combine(today, time.min))
+            period = {'day': today, 'week': today - timedelta(days=today.weekday()),
+                      'month': today.replace(day=1)}[bucket]
+            rows = (InventoryChangeLog.objects
+                    .filter(owner=request.user, timestamp__gte=day_start, **filters)
+                    .order_by().values('change_type')
+                    .annotate(net=Sum(F('new_quantity') - F('previous_quantity')), changes=Count('id')))
+            for row in rows:
+                add(period, row['change_type'], row['net'], row['changes'])
+        
+        results = [
+            {'period': period, 'change_type': change_type, 'net_units': net_units, 'changes': changes}
+            for (period, change_type), (net_units, changes) in sorted(totals.items())
+        ]
+        return Response({
+            'bucket': bucket,
+            'from': start,
+            'to': end,
+            'results': ChangeStatsSerializer(results, many=True).data,
+        })
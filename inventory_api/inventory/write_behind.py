@@ -0,0 +1,276 @@
+"""
+Write-behind buffering of change logs.
+
+With INVENTORY_CHANGE_LOG_WRITE_BEHIND on, ``log_change()`` doesn't insert
+the log on the request path. Once the request's transaction commits, the
+log is appended to this process's spool segment, a local append-only file,
+and queued for a background thread. That thread writes the queue with
+``bulk_create()`` whenever INVENTORY_CHANGE_LOG_FLUSH_SIZE logs are waiting
+or INVENTORY_CHANGE_LOG_FLUSH_INTERVAL seconds have passed.
+
+Every spooled log carries a sequence number, and each batch records the
+last one it wrote in ChangeLogSpoolPosition, in the same transaction as
+the logs; with sharding on, each shard keeps its own position. A segment
+left behind by a process that died is replayed from that position, by the
+next process to start flushing or by ``manage.py
+replay_change_log_spool``, so no log is lost or written twice. While a
+process is alive it holds an exclusive ``flock()`` on its segment, which
+is how abandoned segments are told apart.
+
+The queue holds at most INVENTORY_CHANGE_LOG_QUEUE_SIZE logs; when it is
+full, writers wait for the flusher to make room.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ChangeLogSpoolPosition, InventoryChangeLog, InventoryItem
+from .sharding import TenantMoving, get_placements, tenant_databases
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SUFFIX = '.spool'
+
+
+def log_to_event(log, sequence):
+    return {
+        'seq': sequence,
+        'inventory_item': log.inventory_item_id,
+        'user': log.user_id,
+        'owner': log.owner_id,
+        'previous_quantity': log.previous_quantity,
+        'new_quantity': log.new_quantity,
+        'change_type': log.change_type,
+        'timestamp': log.timestamp.isoformat(),
+    }
+
+
+def event_to_log(event):
+    return InventoryChangeLog(
+        inventory_item_id=event['inventory_item'], user_id=event['user'], owner_id=event['owner'],
+        previous_quantity=event['previous_quantity'], new_quantity=event['new_quantity'],
+        change_type=event['change_type'], timestamp=parse_datetime(event['timestamp']),
+    )
+
+
+def group_events(events):
+    """Split events by the database of their owner, see sharding.py."""
+    placements = get_placements({event['owner'] for event in events}, cached=False)
+    if any(placement.moving for placement in placements.values()):
+        # Retried once the move is over
+        raise TenantMoving()
+    groups = {}
+    for event in events:
+        groups.setdefault(placements[event['owner']].database, []).append(event)
+    return groups
+
+
+def write_events(segment, events):
+    """
+    Insert spooled events and advance the segment's position, atomically
+    on each database written to.
+    """
+    for alias, batch in group_events(events).items():
+        with transaction.atomic(using=alias):
+            # Logs of items deleted in the meantime would have been deleted with them
+            existing = set(InventoryItem.objects.using(alias)
+                           .filter(pk__in={event['inventory_item'] for event in batch})
+                           .values_list('pk', flat=True))
+            InventoryChangeLog.objects.using(alias).bulk_create(
+                [event_to_log(event) for event in batch if event['inventory_item'] in existing])
+            ChangeLogSpoolPosition.objects.using(alias).update_or_create(
+                segment=segment, defaults={'sequence': batch[-1]['seq']})
+
+
+def read_segment(path):
+    events = []
+    with open(path, encoding='utf-8') as spool:
+        for line in spool:
+            if not line.endswith('\n'):
+                # Cut off by a crash halfway through the write
+                break
+            events.append(json.loads(line))
+    return events
+
+
+class ChangeLogBuffer:
+    def __init__(self, spool_dir=None, background=True):
+        self._spool_dir = spool_dir
+        self.background = background
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+
+    @property
+    def spool_dir(self):
+        return Path(self._spool_dir or getattr(settings, 'INVENTORY_CHANGE_LOG_SPOOL_DIR',
+                                               Path(settings.BASE_DIR) / 'spool'))
+
+    @property
+    def flush_size(self):
+        return getattr(settings, 'INVENTORY_CHANGE_LOG_FLUSH_SIZE', 500)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'INVENTORY_CHANGE_LOG_FLUSH_INTERVAL', 1.0)
+
+    def add(self, log):
+        """Spool and queue an unsaved change log once the current transaction commits."""
+        if log.timestamp is None:
+            # The time of the change, not of the eventual insert
+            log.timestamp = timezone.now()
+        log.fill_owner()
+        transaction.on_commit(lambda: self.enqueue(log))
+
+    def enqueue(self, log):
+        self.start()
+        with self._lock:
+            self._sequence += 1
+            event = log_to_event(log, self._sequence)
+            self._spool.write(json.dumps(event) + '\n')
+            self._spool.flush()
+            if getattr(settings, 'INVENTORY_CHANGE_LOG_SPOOL_FSYNC', False):
+                os.fsync(self._spool.fileno())
+            # Blocks while the queue is full; queue order must match the spool
+            self._queue.put(event)
+        if self._queue.qsize() >= self.flush_size:
+            self._wakeup.set()
+
+    def start(self):
+        """Open this process's spool segment and start the flusher, once per process."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            self.segment = f'{socket.gethostname()}-{os.getpid()}-{time.time_ns()}'
+            self._path = self.spool_dir / (self.segment + SPOOL_SUFFIX)
+            self._spool = open(self._path, 'a', encoding='utf-8')
+            fcntl.flock(self._spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self._sequence = self._flushed = 0
+            self._queue = queue.Queue(maxsize=getattr(settings, 'INVENTORY_CHANGE_LOG_QUEUE_SIZE', 10000))
+            self._pending = []
+            self._wakeup = threading.Event()
+            self._stopping = threading.Event()
+            self._pid = os.getpid()
+            if self.background:
+                self._thread = threading.Thread(target=self.run, name='change-log-flusher', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def queue_depth(self):
+        """Logs this process has queued and not written yet."""
+        if self._pid != os.getpid():
+            return 0
+        return self._queue.qsize() + len(self._pending)
+
+    def run(self):
+        try:
+            self.replay()
+        except Exception:
+            logger.exception('Replaying change log spool segments failed')
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                # The batch stays pending and is retried on the next round
+                logger.exception('Writing buffered change logs failed')
+
+    def flush(self):
+        """Write every queued log to the database. Returns how many were written."""
+        if self._pid != os.getpid():
+            return 0
+        written = 0
+        with self._flush_lock:
+            while True:
+                while len(self._pending) < self.flush_size:
+                    try:
+                        self._pending.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not self._pending:
+                    break
+                write_events(self.segment, self._pending)
+                written += len(self._pending)
+                self._flushed = self._pending[-1]['seq']
+                self._pending = []
+            with self._lock:
+                if written and self._flushed == self._sequence:
+                    # Everything spooled is in the database
+                    self._spool.truncate(0)
+        return written
+
+    def stop(self):
+        """Flush what's left and remove this process's segment."""
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        if self.background:
+            self._thread.join()
+        self.flush()
+        with self._lock:
+            self._spool.close()
+            self._pid = None
+            if self._flushed == self._sequence:
+                self._path.unlink(missing_ok=True)
+                self.forget(self.segment)
+
+    def forget(self, segment):
+        for alias in tenant_databases():
+            ChangeLogSpoolPosition.objects.using(alias).filter(segment=segment).delete()
+
+    def replay(self):
+        """
+        Write the unflushed logs of segments abandoned by dead processes,
+        then remove them. Returns how many logs were written.
+        """
+        written = 0
+        if not self.spool_dir.is_dir():
+            return written
+        for path in sorted(self.spool_dir.glob('*' + SPOOL_SUFFIX)):
+            with open(path, 'a', encoding='utf-8') as spool:
+                try:
+                    fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Still owned by a live process
+                    continue
+                segment = path.name[:-len(SPOOL_SUFFIX)]
+                events = read_segment(path)
+                for alias, batch in (group_events(events) if events else {}).items():
+                    position = (ChangeLogSpoolPosition.objects.using(alias).filter(segment=segment)
+                                .values_list('sequence', flat=True).first() or 0)
+                    batch = [event for event in batch if event['seq'] > position]
+                    for start in range(0, len(batch), self.flush_size):
+                        write_events(segment, batch[start:start + self.flush_size])
+                    written += len(batch)
+                path.unlink()
+                self.forget(segment)
+        return written
+
+
+change_log_buffer = ChangeLogBuffer()
+
+
+def log_change(log):
+    """Save an unsaved change log, or leave it to the write-behind buffer if enabled."""
+    if getattr(settings, 'INVENTORY_CHANGE_LOG_WRITE_BEHIND', False):
+        change_log_buffer.add(log)
+    else:
+        log.save()
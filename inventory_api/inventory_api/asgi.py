@@ -2,6 +2,8 @@
 ASGI config for inventory_api project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests served through it are routed with ``inventory_api.asgi_urls``, which
+adds native async views for the read-heavy endpoints.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -9,8 +11,25 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventory_api.settings')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+
+class InventoryASGIRequest(ASGIRequest):
+    urlconf = 'inventory_api.asgi_urls'
+
+
+class InventoryASGIHandler(ASGIHandler):
+    request_class = InventoryASGIRequest
+
+
+application = InventoryASGIHandler()
+
+# Servers don't run the system checks, so report the database settings here
+from inventory.checks import log_database_profile  # noqa: E402
+
+log_database_profile()
@@ -0,0 +1,11 @@
+"""
+URL configuration for the ASGI deployment: the regular routes, with the
+native async read views from ``inventory.async_urls`` taking precedence.
+"""
+from django.urls import path, include
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/', include('inventory.async_urls')),
+] + sync_urlpatterns
@@ -0,0 +1,141 @@
+"""
+Database profile, configured from the environment.
+
+``INVENTORY_DB_ENGINE`` picks ``sqlite`` (the default) or ``postgresql``.
+
+SQLite runs in WAL mode with ``synchronous=NORMAL``, so readers never block
+the writer and commits don't wait for a full fsync. Transactions start
+with ``BEGIN IMMEDIATE``: a transaction takes the write lock up front,
+waiting up to the busy timeout for it, instead of failing with "database is
+locked" when it later tries to upgrade a read lock. Variables:
+
+- ``INVENTORY_DB_NAME``: database file, ``db.sqlite3`` in the project by default
+- ``INVENTORY_SQLITE_BUSY_TIMEOUT``: seconds to wait for the write lock (20)
+- ``INVENTORY_SQLITE_MMAP_SIZE``: bytes of the file to memory-map (256 MiB)
+- ``INVENTORY_SQLITE_CACHE_SIZE``: page cache per connection, in KiB (64 MiB)
+
+PostgreSQL connections are kept open between requests and checked before
+reuse, or taken from a psycopg connection pool. Variables:
+
+- ``INVENTORY_DB_NAME``, ``INVENTORY_DB_USER``, ``INVENTORY_DB_PASSWORD``,
+  ``INVENTORY_DB_HOST``, ``INVENTORY_DB_PORT``
+- ``INVENTORY_DB_CONN_MAX_AGE``: seconds to keep a connection open (60)
+- ``INVENTORY_DB_POOL``: ``true`` to use a connection pool instead. It
+  needs psycopg 3 with its pool extra (``psycopg[pool]``); without them
+  connections stay persistent and ``manage.py check`` warns
+- ``INVENTORY_DB_POOL_MIN_SIZE`` / ``INVENTORY_DB_POOL_MAX_SIZE``: pool bounds (2 / 20)
+
+``INVENTORY_DB_REPLICAS`` lists read replicas, separated by commas: database
+files for SQLite, ``host[:port][/name]`` for PostgreSQL. They become the
+aliases ``replica1``, ``replica2``... with the primary's other settings. A
+SQLite replica is a copy of the primary kept up to date with ``manage.py
+sync_sqlite_replicas``, standing in for real replication.
+
+``INVENTORY_DB_SHARDS`` lists the shards for per-tenant sharding (see
+``inventory/sharding.py``) the same way, as ``shard1``, ``shard2``... Only
+ever append to it: a shard's position in the list sets its id range.
+"""
+import importlib.util
+
+from django.core.exceptions import ImproperlyConfigured
+
+MiB = 1024 * 1024
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+# Module -> package, for Django's PostgreSQL connection pool
+POOL_DEPENDENCIES = {'psycopg': 'psycopg', 'psycopg_pool': 'psycopg[pool]'}
+
+
+def env_int(env, name, default):
+    try:
+        return int(env.get(name, default))
+    except ValueError:
+        raise ImproperlyConfigured(f'{name} must be an integer, not {env[name]!r}.')
+
+
+def sqlite_config(env, base_dir):
+    busy_timeout = env_int(env, 'INVENTORY_SQLITE_BUSY_TIMEOUT', 20)
+    pragmas = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': busy_timeout * 1000,
+        'mmap_size': env_int(env, 'INVENTORY_SQLITE_MMAP_SIZE', 256 * MiB),
+        # Negative sizes are in KiB rather than pages
+        'cache_size': -env_int(env, 'INVENTORY_SQLITE_CACHE_SIZE', 64 * 1024),
+        'temp_store': 'MEMORY',
+    }
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': env.get('INVENTORY_DB_NAME', base_dir / 'db.sqlite3'),
+        'OPTIONS': {
+            'timeout': busy_timeout,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items()),
+        },
+    }
+
+
+def wants_pool(env):
+    return env.get('INVENTORY_DB_POOL', '').lower() in TRUE_VALUES
+
+
+def missing_pool_dependencies():
+    """Packages the connection pool needs that aren't installed."""
+    return [package for module, package in POOL_DEPENDENCIES.items() if importlib.util.find_spec(module) is None]
+
+
+def postgresql_config(env):
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env.get('INVENTORY_DB_NAME', 'inventory'),
+        'USER': env.get('INVENTORY_DB_USER', ''),
+        'PASSWORD': env.get('INVENTORY_DB_PASSWORD', ''),
+        'HOST': env.get('INVENTORY_DB_HOST', ''),
+        'PORT': env.get('INVENTORY_DB_PORT', ''),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    if wants_pool(env) and not missing_pool_dependencies():
+        # Pooled connections are returned to the pool after each request
+        config['CONN_MAX_AGE'] = 0
+        config['OPTIONS'] = {'pool': {
+            'min_size': env_int(env, 'INVENTORY_DB_POOL_MIN_SIZE', 2),
+            'max_size': env_int(env, 'INVENTORY_DB_POOL_MAX_SIZE', 20),
+        }}
+    else:
+        config['CONN_MAX_AGE'] = env_int(env, 'INVENTORY_DB_CONN_MAX_AGE', 60)
+    return config
+
+
+def database_from_env(env, base_dir):
+    engine = env.get('INVENTORY_DB_ENGINE', 'sqlite')
+    if engine == 'sqlite':
+        return sqlite_config(env, base_dir)
+    if engine == 'postgresql':
+        return postgresql_config(env)
+    raise ImproperlyConfigured(f'INVENTORY_DB_ENGINE must be "sqlite" or "postgresql", not {engine!r}.')
+
+
+def databases_from_env(env, primary, variable, prefix, test):
+    databases = {}
+    names = [name.strip() for name in env.get(variable, '').split(',') if name.strip()]
+    for number, name in enumerate(names, start=1):
+        database = {**primary, 'TEST': dict(test)}
+        if primary['ENGINE'] == 'django.db.backends.sqlite3':
+            database['NAME'] = name
+        else:
+            address, _, database['NAME'] = name.partition('/')
+            database['HOST'], _, port = address.partition(':')
+            database['PORT'] = port or primary['PORT']
+            database['NAME'] = database['NAME'] or primary['NAME']
+        databases[f'{prefix}{number}'] = database
+    return databases
+
+
+def replicas_from_env(env, primary):
+    # Tests read the primary's test database through replica aliases
+    return databases_from_env(env, primary, 'INVENTORY_DB_REPLICAS', 'replica', {'MIRROR': 'default'})
+
+
+def shards_from_env(env, primary):
+    return databases_from_env(env, primary, 'INVENTORY_DB_SHARDS', 'shard', {})
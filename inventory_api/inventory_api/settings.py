@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import database_from_env, replicas_from_env, shards_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +47,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.middleware.RequestTimingMiddleware',
+    'inventory.middleware.MetricsMiddleware',
+    'inventory.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,12 +84,16 @@ WSGI_APPLICATION = 'inventory_api.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Configured from INVENTORY_DB_* environment variables, see database.py.
+# The settings each database runs with are reported by the system checks
+# and logged when a WSGI or ASGI server starts, see inventory/checks.py.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_from_env(os.environ, BASE_DIR),
 }
+DATABASES.update(replicas_from_env(os.environ, DATABASES['default']))
+DATABASES.update(shards_from_env(os.environ, DATABASES['default']))
+
+DATABASE_ROUTERS = ['inventory.sharding.ShardRouter', 'inventory.routers.ReplicaRouter']
 
 
 # Password validation
@@ -128,9 +138,11 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
+    # Bearer tokens first, so API requests never load a session; sessions
+    # are left for requests without one, such as the browsable API
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'inventory.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -139,4 +151,75 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 }
 
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+
+# Maximum number of entries accepted by the bulk inventory endpoints
+INVENTORY_BULK_MAX_ITEMS = 1000
+
+# Category list/detail responses are cached per category version. Use a
+# shared backend (Redis, Memcached) when running more than one process, so
+# a write invalidates every worker's entries.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+INVENTORY_CATEGORY_CACHE = 'default'
+INVENTORY_CATEGORY_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Per-process cache of users authenticated by JWT. Saving or deleting a user
+# evicts it in the current process; other processes see the change after
+# at most INVENTORY_AUTH_USER_CACHE_TTL seconds.
+INVENTORY_AUTH_USER_CACHE_SIZE = 1024
+INVENTORY_AUTH_USER_CACHE_TTL = 60
+
+# Serve list endpoints from values_list() rows instead of the serializers;
+# the output is identical (see inventory/rows.py). Opt-in.
+INVENTORY_FAST_LISTS = False
+
+# Change logs older than this many days are moved to the archive table by
+# `manage.py archive_change_logs`; ?include_archived=true lists them again.
+INVENTORY_CHANGE_LOG_RETENTION_DAYS = 365
+
+# Write-behind change logs (see inventory/write_behind.py). Off by default:
+# each process then needs a writable INVENTORY_CHANGE_LOG_SPOOL_DIR on local
+# disk that outlives it, so its unflushed logs can be replayed.
+INVENTORY_CHANGE_LOG_WRITE_BEHIND = False
+INVENTORY_CHANGE_LOG_SPOOL_DIR = BASE_DIR / 'spool'
+INVENTORY_CHANGE_LOG_QUEUE_SIZE = 10000
+INVENTORY_CHANGE_LOG_FLUSH_SIZE = 500
+INVENTORY_CHANGE_LOG_FLUSH_INTERVAL = 1.0
+
+# Read replicas, see inventory/routers.py. Safe-method requests read from
+# INVENTORY_DB_REPLICAS, picked 'round_robin' or by 'lowest_lag'; replicas
+# more than INVENTORY_DB_REPLICA_MAX_LAG seconds behind (None: no limit)
+# are skipped.
+INVENTORY_DB_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica')]
+INVENTORY_DB_REPLICA_STRATEGY = 'round_robin'
+INVENTORY_DB_REPLICA_MAX_LAG = None
+INVENTORY_DB_REPLICA_LAG_INTERVAL = 5
+
+# Per-tenant sharding, see inventory/sharding.py. Placements are cached
+# for INVENTORY_SHARD_PLACEMENT_TTL seconds per process; moving a tenant
+# waits INVENTORY_SHARD_MOVE_GRACE seconds twice, which must be longer than
+# the TTL plus the longest request and the change log flush interval.
+INVENTORY_SHARDS = [alias for alias in DATABASES if alias.startswith('shard')]
+INVENTORY_SHARD_PLACEMENT_TTL = 5
+INVENTORY_SHARD_MOVE_GRACE = 15
+
+# Request instrumentation, see inventory/instrumentation.py: a Server-Timing
+# header on every response, and a warning for requests slower than
+# INVENTORY_SLOW_REQUEST_THRESHOLD seconds or running one statement
+# INVENTORY_REPEATED_QUERY_THRESHOLD times or more.
+INVENTORY_REQUEST_TIMING = True
+INVENTORY_SLOW_REQUEST_THRESHOLD = 1.0
+INVENTORY_REPEATED_QUERY_THRESHOLD = 10
+
+# Prometheus metrics at /metrics, see inventory/metrics.py. Pre-forked
+# workers share their totals through INVENTORY_METRICS_DIR. Scrapes must
+# send INVENTORY_METRICS_TOKEN as a bearer token; without one set,
+# /metrics isn't served.
+INVENTORY_METRICS = True
+INVENTORY_METRICS_DIR = os.environ.get('INVENTORY_METRICS_DIR') or None
+INVENTORY_METRICS_FLUSH_INTERVAL = 1.0
+INVENTORY_METRICS_TOKEN = os.environ.get('INVENTORY_METRICS_TOKEN') or None
\ No newline at end of file
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventory_api.settings')
 
 application = get_wsgi_application()
+
+# Servers don't run the system checks, so report the database settings here
+from inventory.checks import log_database_profile  # noqa: E402
+
+log_database_profile()